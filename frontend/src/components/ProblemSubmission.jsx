@@ -3,6 +3,7 @@ import React, { useState, useEffect } from "react";
 import { FontAwesomeIcon } from "@fortawesome/react-fontawesome";
 import { faPlus, faTrash, faCheck, faTimes } from "@fortawesome/free-solid-svg-icons";
 import { getTestCases } from "../repository/getTestCases";
+import Progress from "./Progress";
 
 const ProblemSubmission = ({ code, language, input, setInput, onRun, runResult, judgeAvailable, problemSlug }) => {
   const [testCases, setTestCases] = useState([
@@ -13,6 +14,7 @@ const ProblemSubmission = ({ code, language, input, setInput, onRun, runResult,
   const [problemTestCases, setProblemTestCases] = useState([]);
   const [hasTestCases, setHasTestCases] = useState(false);
   const [isSubmitting, setIsSubmitting] = useState(false);
+  const [submitProgress, setSubmitProgress] = useState(null);
   const [submissionResult, setSubmissionResult] = useState(null);
 
   // Load test cases when problemSlug changes
@@ -97,13 +99,15 @@ const ProblemSubmission = ({ code, language, input, setInput, onRun, runResult,
     }
     
     setIsSubmitting(true);
+    setSubmitProgress(null);
     try {
       // Import the submit function
       const { submitCodeWithTestCases } = await import("../repository/judgeApi");
       const result = await submitCodeWithTestCases({
         code,
         language,
-        problemSlug
+        problemSlug,
+        onProgress: setSubmitProgress
       });
       
       // Handle the submission result
@@ -238,6 +242,12 @@ const ProblemSubmission = ({ code, language, input, setInput, onRun, runResult,
         </button>
       </div>
 
+      {isSubmitting && submitProgress && (
+        <div className="mt-4">
+          <Progress update={submitProgress} />
+        </div>
+      )}
+
       {/* Results Summary */}
       {runResult.summary && (
         <div className="mb-4 p-3 bg-gray-50 rounded-md">
@@ -2,10 +2,26 @@ import React from "react";
 import { FontAwesomeIcon } from "@fortawesome/react-fontawesome";
 import { faSpinner } from "@fortawesome/free-solid-svg-icons";
 
-const Progress = () => {
+// Text for a progress update sent by the judge while it runs a submission
+export const describeProgress = (update) => {
+  if (!update) return null;
+  if (update.stage === "compile_started") return "Compiling...";
+  if (update.stage === "compile_finished") {
+    return update.success ? `Compiled in ${update.timeMs} ms${update.cached ? " (cached)" : ""}` : "Compilation failed";
+  }
+  if (update.stage === "test_case") {
+    const time = update.wallTimeMs != null ? ` in ${update.wallTimeMs} ms` : "";
+    return `Test ${update.testCase} of ${update.total} ${update.passed === false ? "failed" : "passed"}${time}`;
+  }
+  return null;
+};
+
+const Progress = ({ update = null }) => {
+  const message = describeProgress(update);
   return (
-    <div className="flex justify-center items-center">
+    <div className="flex flex-col justify-center items-center">
       <FontAwesomeIcon icon={faSpinner} spin size="3x" color="blue" />
+      {message && <span className="mt-2 text-blue-600 text-sm">{message}</span>}
     </div>
   );
 };
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from "react";
 import { FontAwesomeIcon } from "@fortawesome/react-fontawesome";
 import { faPlus, faTrash, faCheck, faTimes, faPlay } from "@fortawesome/free-solid-svg-icons";
 import { getTestCases } from "../repository/getTestCases";
+import Progress from "./Progress";
 
 const TabbedTestCases = ({ code, language, onRun, runResult, judgeAvailable, problemSlug }) => {
   const [testCases, setTestCases] = useState([
@@ -14,6 +15,7 @@ const TabbedTestCases = ({ code, language, onRun, runResult, judgeAvailable, pro
   const [problemTestCases, setProblemTestCases] = useState([]);
   const [hasTestCases, setHasTestCases] = useState(false);
   const [isSubmitting, setIsSubmitting] = useState(false);
+  const [submitProgress, setSubmitProgress] = useState(null);
   const [submissionResult, setSubmissionResult] = useState(null);
 
   // Load test cases when problemSlug changes
@@ -115,13 +117,15 @@ const TabbedTestCases = ({ code, language, onRun, runResult, judgeAvailable, pro
     }
     
     setIsSubmitting(true);
+    setSubmitProgress(null);
     try {
       // Import the submit function
       const { submitCodeWithTestCases } = await import("../repository/judgeApi");
       const result = await submitCodeWithTestCases({
         code,
         language,
-        problemSlug
+        problemSlug,
+        onProgress: setSubmitProgress
       });
       
       // Handle the submission result
@@ -450,6 +454,12 @@ const TabbedTestCases = ({ code, language, onRun, runResult, judgeAvailable, pro
           {isSubmitting ? 'Submitting...' : 'Submit'}
         </button>
       </div>
+
+      {isSubmitting && submitProgress && (
+        <div className="mt-4">
+          <Progress update={submitProgress} />
+        </div>
+      )}
     </div>
   );
 };
@@ -10,6 +10,9 @@ import { getSubmissionHistory } from "../repository/judgeRTCApi";
 const ProblemDescription = lazy(() => import("../components/ProblemDescription"));
 const TabbedTestCases = lazy(() => import("../components/TabbedTestCases"));
 
+// Submissions loaded per page of the history tab
+const HISTORY_PAGE_SIZE = 20;
+
 
 const ProblemDetails = () => {
   const { problemSlug } = useParams();
@@ -20,6 +23,7 @@ const ProblemDetails = () => {
   const [input, setInput] = useState("");
   const [submissionHistory, setSubmissionHistory] = useState([]);
   const [isLoadingHistory, setIsLoadingHistory] = useState(false);
+  const [historyCursor, setHistoryCursor] = useState(null);
   const [expandedSubmission, setExpandedSubmission] = useState(null);
   const [activeTab, setActiveTab] = useState('description');
 
@@ -95,16 +99,35 @@ const ProblemDetails = () => {
 
     setIsLoadingHistory(true);
     try {
-      const response = await getSubmissionHistory(problemSlug);
+      const response = await getSubmissionHistory(problemSlug, false, { limit: HISTORY_PAGE_SIZE });
       setSubmissionHistory(response.history || []);
+      setHistoryCursor(response.nextCursor || null);
     } catch (error) {
       console.error("Failed to fetch submission history:", error);
       setSubmissionHistory([]);
+      setHistoryCursor(null);
     } finally {
       setIsLoadingHistory(false);
     }
   };
 
+  const fetchMoreSubmissionHistory = async () => {
+    if (!historyCursor) {
+      return;
+    }
+
+    try {
+      const response = await getSubmissionHistory(problemSlug, false, {
+        limit: HISTORY_PAGE_SIZE,
+        cursor: historyCursor
+      });
+      setSubmissionHistory(prev => [...prev, ...(response.history || [])]);
+      setHistoryCursor(response.nextCursor || null);
+    } catch (error) {
+      console.error("Failed to fetch more submission history:", error);
+    }
+  };
+
   const expandSubmission = async (submissionId) => {
     if (expandedSubmission === submissionId) {
       setExpandedSubmission(null);
@@ -112,7 +135,7 @@ const ProblemDetails = () => {
     }
 
     try {
-      const response = await getSubmissionHistory(problemSlug, true);
+      const response = await getSubmissionHistory(problemSlug, true, { submissionId, fields: ["code"] });
       const submission = response.history.find(s => s.id === submissionId);
       if (submission) {
         setExpandedSubmission(submissionId);
@@ -282,6 +305,14 @@ const ProblemDetails = () => {
                           )}
                         </div>
                       ))}
+                      {historyCursor && (
+                        <button
+                          onClick={fetchMoreSubmissionHistory}
+                          className="w-full py-2 text-sm text-blue-600 hover:text-blue-800 transition-colors"
+                        >
+                          Load more
+                        </button>
+                      )}
                     </div>
                   )}
                 </div>
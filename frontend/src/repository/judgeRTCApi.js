@@ -10,6 +10,7 @@ let dataChannel = null;
 let connected = false;
 let pendingQueue = [];
 let responseResolvers = {};
+let progressHandlers = {};
 let msgId = 0;
 let rtcPc = null;
 let socket = null;
@@ -206,12 +207,21 @@ async function connectRTC() {
         return;
       }
       
+      // Progress updates come before the final response with the same _msgId
+      if (msg.type === "progress") {
+        if (progressHandlers[msg._msgId]) {
+          progressHandlers[msg._msgId](msg);
+        }
+        return;
+      }
+      
       // Handle regular message responses with _msgId
       if (msg._msgId && responseResolvers[msg._msgId]) {
         console.log("Found resolver for msgId:", msg._msgId);
         console.log("Resolving with message:", msg);
         responseResolvers[msg._msgId](msg);
         delete responseResolvers[msg._msgId];
+        delete progressHandlers[msg._msgId];
         console.log("Resolver removed for msgId:", msg._msgId);
       } else if (msg._msgId) {
         console.log("Message has _msgId but no resolver found:", msg._msgId);
@@ -284,7 +294,8 @@ async function connectRTC() {
   });
 }
 
-function sendMessage(msg) {
+// onProgress, if given, is called with each progress update the judge sends for this message
+function sendMessage(msg, onProgress = null) {
   return new Promise(async (resolve, reject) => {
     console.log("=== sendMessage called ===");
     console.log("Message to send:", msg);
@@ -300,6 +311,10 @@ function sendMessage(msg) {
     console.log("Message with ID:", msg);
     
     responseResolvers[thisMsgId] = resolve;
+    if (onProgress) {
+      msg.progress = true;
+      progressHandlers[thisMsgId] = onProgress;
+    }
     console.log("Added resolver for msgId:", thisMsgId);
     console.log("Current responseResolvers:", Object.keys(responseResolvers));
     
@@ -314,6 +329,7 @@ function sendMessage(msg) {
       if (responseResolvers[thisMsgId]) {
         console.log("Timeout reached, rejecting promise");
         delete responseResolvers[thisMsgId];
+        delete progressHandlers[thisMsgId];
         reject(new Error("RTC judge timeout"));
       }
     }, 30000);
@@ -353,14 +369,14 @@ export const executeCode = async ({ code, language, input }) => {
   return resp;
 };
 
-export const executeCodeWithTestCases = async ({ code, language, testCases }) => {
-  const resp = await sendMessage({ type: "execute", code, language, testCases });
+export const executeCodeWithTestCases = async ({ code, language, testCases, onProgress }) => {
+  const resp = await sendMessage({ type: "execute", code, language, testCases }, onProgress);
   if (resp.error) throw new Error(resp.error);
   return resp;
 };
 
-export const submitCodeWithTestCases = async ({ code, language, problemSlug }) => {
-  const resp = await sendMessage({ type: "submit", code, language, problemSlug });
+export const submitCodeWithTestCases = async ({ code, language, problemSlug, onProgress }) => {
+  const resp = await sendMessage({ type: "submit", code, language, problemSlug }, onProgress);
   if (resp.error) throw new Error(resp.error);
   return resp;
 };
@@ -372,9 +388,17 @@ export const checkProblemsStatus = async (problemSlugs) => {
   return resp.problemStatuses;
 };
 
-// Get submission history for a specific problem
-export const getSubmissionHistory = async (problemSlug, includeCode = false) => {
-  const resp = await sendMessage({ type: "submission_history", problemSlug, includeCode });
+// Get solved/failed/attempted counts for each module of a course, or for one module
+export const getCourseProgress = async (course, module) => {
+  const resp = await sendMessage({ type: "course_progress", course, module });
+  if (resp.error) throw new Error(resp.error);
+  return resp;
+};
+
+// Get submission history for a specific problem.
+// options: limit, cursor (nextCursor of the previous page), language, status, submissionId, fields
+export const getSubmissionHistory = async (problemSlug, includeCode = false, options = {}) => {
+  const resp = await sendMessage({ type: "submission_history", problemSlug, includeCode, ...options });
   if (resp.error) throw new Error(resp.error);
   return resp;
 };
@@ -386,9 +410,16 @@ export const getSubmissionStats = async () => {
   return resp.stats;
 };
 
-// Get recent submissions
-export const getRecentSubmissions = async (limit = 10) => {
-  const resp = await sendMessage({ type: "recent_submissions", limit });
+// Get submission counts per day (last `days` days) with the current and longest streaks
+export const getDailyActivity = async (days = 365) => {
+  const resp = await sendMessage({ type: "daily_activity", days });
+  if (resp.error) throw new Error(resp.error);
+  return resp;
+};
+
+// Get recent submissions; options: cursor, language, status, fields
+export const getRecentSubmissions = async (limit = 10, options = {}) => {
+  const resp = await sendMessage({ type: "recent_submissions", limit, ...options });
   if (resp.error) throw new Error(resp.error);
   return resp.recentSubmissions;
 };
\ No newline at end of file
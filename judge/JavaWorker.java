@@ -0,0 +1,305 @@
+import java.io.*;
+import java.lang.management.ManagementFactory;
+import java.lang.management.ThreadMXBean;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.util.Arrays;
+import javax.tools.JavaCompiler;
+import javax.tools.ToolProvider;
+
+/**
+ * Long-lived JVM used by java_worker.py to compile and run Java submissions
+ * without paying JVM startup for every javac and java invocation.
+ *
+ * Requests and responses are sequences of frames on stdin/stdout, each frame
+ * being a 4-byte big-endian length followed by that many bytes.
+ *
+ *   compile <argc> <arg>...
+ *       -> ok|error, diagnostics
+ *   run <class dir> <stdin file> <timeout ms> <output limit bytes>
+ *       -> (stdout, chunk)...
+ *          ok|timeout|output|aborted, exit code, wall ms, user ns, cpu ns, stderr
+ *       -> error, message (the stdin file cannot be opened)
+ *
+ * The program's stdout is sent in chunks as it is flushed, so the Python
+ * side can check it while the program runs. After a run request the
+ * Python side sends exactly one more frame: "abort" to stop the run early,
+ * or "done" once it has the result. An aborted program is stopped at its
+ * next write and its thread is interrupted.
+ *
+ * Every run loads Main through a fresh class loader so static state never
+ * leaks between runs. A run that times out leaves its thread behind, so the
+ * Python side kills and replaces this worker.
+ */
+public class JavaWorker {
+    private static DataInputStream in;
+    private static DataOutputStream out;
+
+    public static void main(String[] args) throws Exception {
+        in = new DataInputStream(new BufferedInputStream(new FileInputStream(FileDescriptor.in)));
+        out = new DataOutputStream(new BufferedOutputStream(new FileOutputStream(FileDescriptor.out)));
+        // Keep stray writes (e.g. from a timed-out run) away from the protocol stream
+        System.setOut(new PrintStream(new OutputStream() {
+            @Override
+            public void write(int b) {
+            }
+        }));
+
+        while (true) {
+            String op;
+            try {
+                op = readString();
+            } catch (EOFException e) {
+                return;
+            }
+            if (op.equals("compile")) {
+                compile();
+            } else if (op.equals("run")) {
+                run();
+            } else {
+                writeString("error");
+                writeString("Unknown operation: " + op);
+            }
+            out.flush();
+        }
+    }
+
+    private static void compile() throws IOException {
+        int argc = Integer.parseInt(readString());
+        String[] compilerArgs = new String[argc];
+        for (int i = 0; i < argc; i++) {
+            compilerArgs[i] = readString();
+        }
+
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        if (compiler == null) {
+            writeString("error");
+            writeString("No system Java compiler available");
+            return;
+        }
+        ByteArrayOutputStream diagnostics = new ByteArrayOutputStream();
+        int status = compiler.run(null, diagnostics, diagnostics, compilerArgs);
+        writeString(status == 0 ? "ok" : "error");
+        writeFrame(diagnostics.toByteArray());
+    }
+
+    private static void run() throws Exception {
+        String classDir = readString();
+        String inputPath = readString();
+        long timeoutMs = Long.parseLong(readString());
+        long outputLimit = Long.parseLong(readString());
+
+        InputStream input;
+        try {
+            input = new BufferedInputStream(new FileInputStream(inputPath));
+        } catch (FileNotFoundException e) {
+            writeString("error");
+            writeString("Cannot open input: " + e.getMessage());
+            out.flush();
+            readString();
+            return;
+        }
+
+        StreamedOutputStream stdout = new StreamedOutputStream(outputLimit);
+        LimitedOutputStream stderr = new LimitedOutputStream(outputLimit);
+        PrintStream runOut = new PrintStream(new BufferedOutputStream(stdout), false, "UTF-8");
+        PrintStream runErr = new PrintStream(stderr, true, "UTF-8");
+        final int[] exitCode = {0};
+        final long[] cpuTimes = {0, 0};
+        ThreadMXBean threads = ManagementFactory.getThreadMXBean();
+
+        URLClassLoader loader = new URLClassLoader(
+            new URL[]{new File(classDir).toURI().toURL()},
+            JavaWorker.class.getClassLoader().getParent()
+        );
+
+        InputStream oldIn = System.in;
+        PrintStream oldOut = System.out;
+        PrintStream oldErr = System.err;
+        System.setIn(input);
+        System.setOut(runOut);
+        System.setErr(runErr);
+
+        Thread thread = new Thread(() -> {
+            try {
+                Class<?> mainClass = Class.forName("Main", true, loader);
+                Method mainMethod = mainClass.getMethod("main", String[].class);
+                mainMethod.invoke(null, (Object) new String[0]);
+            } catch (InvocationTargetException e) {
+                Throwable cause = e.getCause();
+                if (cause instanceof RunStopped) {
+                    exitCode[0] = 1;
+                    return;
+                }
+                trimStackTrace(cause);
+                runErr.print("Exception in thread \"main\" ");
+                cause.printStackTrace(runErr);
+                exitCode[0] = 1;
+            } catch (Throwable e) {
+                e.printStackTrace(runErr);
+                exitCode[0] = 1;
+            } finally {
+                if (threads.isCurrentThreadCpuTimeSupported()) {
+                    cpuTimes[0] = threads.getCurrentThreadUserTime();
+                    cpuTimes[1] = threads.getCurrentThreadCpuTime();
+                }
+            }
+        }, "main");
+        thread.setContextClassLoader(loader);
+
+        // Reads the run's control frame while it runs; a closed stdin aborts the run too
+        Thread control = new Thread(() -> {
+            String message;
+            try {
+                message = readString();
+            } catch (IOException e) {
+                message = "abort";
+            }
+            if (message.equals("abort")) {
+                stdout.aborted = true;
+                thread.interrupt();
+            }
+        }, "control");
+        control.setDaemon(true);
+
+        long start = System.nanoTime();
+        thread.start();
+        control.start();
+        thread.join(timeoutMs);
+        long wallMs = (System.nanoTime() - start) / 1000000;
+        boolean timedOut = thread.isAlive();
+
+        if (!timedOut) {
+            try {
+                runOut.flush();
+            } catch (RunStopped e) {
+                // Reported through the status below
+            }
+        }
+        stdout.finish();
+        System.setIn(oldIn);
+        System.setOut(oldOut);
+        System.setErr(oldErr);
+
+        String status = timedOut ? "timeout" : stdout.aborted ? "aborted"
+            : (stdout.exceeded || stderr.exceeded) ? "output" : "ok";
+        writeString(status);
+        writeString(Integer.toString(exitCode[0]));
+        writeString(Long.toString(wallMs));
+        writeString(Long.toString(cpuTimes[0]));
+        writeString(Long.toString(cpuTimes[1]));
+        writeFrame(stderr.toByteArray());
+        if (!timedOut) {
+            loader.close();
+            input.close();
+            out.flush();
+            control.join();
+        }
+    }
+
+    /** Thrown into the program to stop it once it passes the output limit or its run is aborted. */
+    private static class RunStopped extends Error {
+        RunStopped() {
+            super("Run stopped", null, false, false);
+        }
+    }
+
+    /** Buffers output up to a limit, then stops the program by throwing. */
+    private static class LimitedOutputStream extends ByteArrayOutputStream {
+        private final long limit;
+        volatile boolean exceeded = false;
+
+        LimitedOutputStream(long limit) {
+            this.limit = limit;
+        }
+
+        @Override
+        public synchronized void write(int b) {
+            write(new byte[]{(byte) b}, 0, 1);
+        }
+
+        @Override
+        public synchronized void write(byte[] b, int off, int len) {
+            if (count + len > limit) {
+                exceeded = true;
+                throw new RunStopped();
+            }
+            super.write(b, off, len);
+        }
+    }
+
+    /** Sends output to the Python side as stdout frames up to a limit, then stops the program by throwing. */
+    private static class StreamedOutputStream extends OutputStream {
+        private final long limit;
+        private long count = 0;
+        private boolean finished = false;
+        volatile boolean exceeded = false;
+        volatile boolean aborted = false;
+
+        StreamedOutputStream(long limit) {
+            this.limit = limit;
+        }
+
+        @Override
+        public void write(int b) throws IOException {
+            write(new byte[]{(byte) b}, 0, 1);
+        }
+
+        @Override
+        public synchronized void write(byte[] b, int off, int len) throws IOException {
+            if (finished || aborted) {
+                throw new RunStopped();
+            }
+            if (count + len > limit) {
+                exceeded = true;
+                throw new RunStopped();
+            }
+            count += len;
+            writeString("stdout");
+            out.writeInt(len);
+            out.write(b, off, len);
+            out.flush();
+        }
+
+        /** Stop sending frames, so a thread left behind by a timeout cannot write into the result. */
+        synchronized void finish() {
+            finished = true;
+        }
+    }
+
+    /** Drop the reflection frames below Main.main so traces match a plain java run. */
+    private static void trimStackTrace(Throwable error) {
+        StackTraceElement[] trace = error.getStackTrace();
+        int end = trace.length;
+        while (end > 0 && !(trace[end - 1].getClassName().equals("Main")
+                && trace[end - 1].getMethodName().equals("main"))) {
+            end--;
+        }
+        if (end > 0) {
+            error.setStackTrace(Arrays.copyOf(trace, end));
+        }
+    }
+
+    private static byte[] readFrame() throws IOException {
+        int length = in.readInt();
+        byte[] data = new byte[length];
+        in.readFully(data);
+        return data;
+    }
+
+    private static String readString() throws IOException {
+        return new String(readFrame(), StandardCharsets.UTF_8);
+    }
+
+    private static void writeFrame(byte[] data) throws IOException {
+        out.writeInt(data.length);
+        out.write(data);
+    }
+
+    private static void writeString(String value) throws IOException {
+        writeFrame(value.getBytes(StandardCharsets.UTF_8));
+    }
+}
@@ -1,7 +1,18 @@
+import contextlib
 import subprocess
 import tempfile
+import shutil
+import threading
+import time
 import os
-from config import LANG_COMMANDS
+import json
+from config import (LANG_COMMANDS, RUN_TIMEOUT, COMPILE_FLAGS, RUN_CPU_TIME_LIMIT, RUN_MEMORY_LIMIT,
+                    RUN_OUTPUT_LIMIT, RUN_PROCESS_LIMIT)
+from compile_cache import CompileCache
+from java_worker import get_java_workers, JavaWorkerError
+from python_forkserver import get_python_forkserver, ForkServerError
+from sandbox import (RunLimits, spawn_limited, limits_supported, read_pipes, poll_with_usage, next_poll_interval,
+                     usage_from_rusage, detect_limit_exceeded, kill_child)
 
 
 def detect_languages():
@@ -16,43 +27,432 @@ def detect_languages():
     return result
 
 
-def run_python(code, input_text):
-    """Execute Python code with given input"""
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as f:
-        f.write(code)
-        filepath = f.name
+class RunCancelled(Exception):
+    """Raised when a run is cancelled before it finishes"""
+
+
+class CancelToken:
+    """Lets another thread cancel a run, killing its process if it already started"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._process = None
+        self.cancelled = False
+
+    def attach(self, process):
+        """Track the process of the run, killing it at once if already cancelled"""
+        with self._lock:
+            self._process = process
+            if self.cancelled:
+                process.kill()
+
+    def detach(self):
+        with self._lock:
+            self._process = None
+
+    def cancel(self):
+        """Cancel the run and kill its process"""
+        with self._lock:
+            self.cancelled = True
+            if self._process is not None:
+                self._process.kill()
+
+
+class ChildProcess:
+    """
+    A run's child process, killed by a CancelToken or its deadline.
+
+    Once reaped its pid may belong to another process, so it is never
+    signalled after that.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.reaped = False
+        self._lock = threading.Lock()
+
+    def kill(self):
+        with self._lock:
+            if not self.reaped:
+                kill_child(self.pid)
+
+    def wait(self, deadline):
+        """Reap the child, killing it if it runs past deadline; returns (exit_code, rusage, timed_out)"""
+        timed_out = False
+        interval = 0.001
+        while True:
+            with self._lock:
+                result = poll_with_usage(self.pid)
+                if result is not None:
+                    self.reaped = True
+                    return (*result, timed_out)
+            if not timed_out and time.monotonic() >= deadline:
+                # e.g. it closed stdout and stderr and kept running
+                self.kill()
+                timed_out = True
+            time.sleep(interval)
+            interval = next_poll_interval(interval)
+
+
+def open_input(input_data):
+    """
+    Binary file to use as a run's stdin.
+
+    Packed test inputs open themselves (see test_case_store.PackedInput) so
+    their contents never pass through Python; text and bytes are written to
+    a temporary file.
+    """
+    if hasattr(input_data, "open"):
+        return input_data.open()
+    stdin_file = tempfile.TemporaryFile()
+    stdin_file.write(input_data.encode() if isinstance(input_data, str) else input_data)
+    stdin_file.seek(0)
+    return stdin_file
+
+
+@contextlib.contextmanager
+def input_path(input_data):
+    """
+    Path of a file holding the input, for runners that open it themselves.
+
+    Packed inputs stored as shared blobs are used in place; anything else
+    is written to a temporary file, removed afterwards.
+    """
+    shared_path = getattr(input_data, "shared_path", None)
+    if shared_path is not None:
+        yield shared_path
+        return
+    fd, path = tempfile.mkstemp(prefix="judge_input_")
     try:
-        result = subprocess.run(["python3", filepath], input=input_text.encode(), capture_output=True, timeout=5)
-        return result.stdout.decode(), result.stderr.decode()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(input_bytes(input_data))
+        yield path
     finally:
-        os.remove(filepath)
+        os.remove(path)
+
+
+def input_bytes(input_data):
+    """The whole input as bytes, for runners that need it in memory"""
+    if hasattr(input_data, "read"):
+        return input_data.read()
+    return input_data.encode() if isinstance(input_data, str) else bytes(input_data)
+
+
+def run_limits(language):
+    """Resource limits for runs of a language"""
+    return RunLimits(
+        wall_time=RUN_TIMEOUT,
+        cpu_time=RUN_CPU_TIME_LIMIT,
+        # The JVM reserves far more address space than it uses; its heap is capped with -Xmx instead
+        memory_bytes=RUN_MEMORY_LIMIT if language != "java" else None,
+        output_bytes=RUN_OUTPUT_LIMIT,
+        processes=RUN_PROCESS_LIMIT
+    )
+
+
+class RunResult:
+    """Output, exit code and resource usage of one run"""
+
+    def __init__(self, stdout, stderr, exit_code=0, usage=None, limit_exceeded=None, aborted=False):
+        self.stdout = stdout
+        self.stderr = stderr
+        self.exit_code = exit_code
+        self.usage = usage
+        # "time", "memory" or "output" when the run was stopped by a limit
+        self.limit_exceeded = limit_exceeded
+        # True when the run was killed because its output checker saw wrong output
+        self.aborted = aborted
+
+
+class CompiledProgram:
+    """A submission built once into a workspace, ready to run against many inputs"""
+
+    def __init__(self, language, workdir):
+        self.language = language
+        self.workdir = workdir
+        self.build_dir = os.path.join(workdir, "build")
+        self.limits = run_limits(language)
+        self.command = None
+        self.compile_error = None
+        self.compile_exception = None
+        self.from_cache = False
+        self.forkserver_id = None
+
+    def run(self, input_data, cancel=None, checker=None):
+        """Run the built program with given input, returns a RunResult.
+
+        The input is text, bytes or a file-backed input from the test case
+        store, which is connected to the process as stdin without being
+        read into memory.
+
+        Several runs of the same program may happen concurrently. If a
+        cancel token is given and gets cancelled, the process is killed and
+        RunCancelled is raised.
+
+        With an OutputChecker, stdout is fed to the checker as it is read
+        instead of being collected, and the process is killed as soon as
+        the checker finds the output wrong. The result's stdout is then the
+        checker's (possibly truncated) copy of the output.
+        """
+        if self.compile_exception is not None:
+            raise self.compile_exception
+        if self.compile_error is not None:
+            return RunResult("", self.compile_error, exit_code=1)
+        if cancel is not None and cancel.cancelled:
+            raise RunCancelled()
+        stdout_sink = checker.feed if checker is not None else None
+        outcome = None
+        forkserver = get_python_forkserver() if self.forkserver_id else None
+        if forkserver is not None:
+            try:
+                with open_input(input_data) as stdin_file:
+                    outcome = forkserver.run(self.forkserver_id, stdin_file, self.limits, cancel, stdout_sink)
+            except ForkServerError as e:
+                print(f"Python fork server run failed, falling back to python3: {e}")
+                if checker is not None:
+                    checker.reset()
+        java_workers = get_java_workers() if self.language == "java" else None
+        if java_workers is not None:
+            try:
+                with input_path(input_data) as stdin_path:
+                    outcome = java_workers.run(self.build_dir, stdin_path, self.limits, stdout_sink, cancel)
+            except JavaWorkerError as e:
+                if cancel is not None and cancel.cancelled:
+                    raise RunCancelled()
+                # e.g. the program called System.exit; rerun it in its own JVM
+                print(f"Java worker run failed, falling back to java: {e}")
+                if checker is not None:
+                    checker.reset()
+        if outcome is None:
+            outcome = self._run_process(input_data, cancel, stdout_sink)
+        if cancel is not None and cancel.cancelled:
+            raise RunCancelled()
+
+        stdout, stderr, exit_code, usage, exceeded = outcome
+        stderr = stderr.decode(errors="replace")
+        stdout = checker.output if checker is not None else stdout.decode(errors="replace")
+        if exceeded == "abort":
+            return RunResult(stdout, stderr, exit_code, usage, aborted=True)
+        if exceeded is None:
+            exceeded = detect_limit_exceeded(exit_code, stderr, usage, self.limits)
+        return RunResult(stdout, stderr, exit_code, usage, exceeded)
+
+    def _run_process(self, input_data, cancel, stdout_sink=None):
+        """Run the build command in a new process, returns (stdout, stderr, exit_code, usage, exceeded)"""
+        if not limits_supported():
+            outcome = self._run_process_unlimited(input_data, cancel)
+            if stdout_sink is not None:
+                stdout_sink(outcome[0])
+            return outcome
+        limits = self.limits
+        with open_input(input_data) as stdin_file:
+            start_time = time.monotonic()
+            process = spawn_limited(self.command, limits, stdin=stdin_file, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+        child = ChildProcess(process.pid)
+        if cancel is not None:
+            cancel.attach(child)
+        try:
+            (stdout, stderr), exceeded = read_pipes([process.stdout, process.stderr],
+                                                    start_time + limits.wall_time, limits.output_bytes,
+                                                    stdout_sink)
+            if exceeded:
+                child.kill()
+            process.stdout.close()
+            process.stderr.close()
+            exit_code, rusage, timed_out = child.wait(start_time + limits.wall_time)
+            process.returncode = exit_code
+            if exceeded is None and timed_out:
+                exceeded = "time"
+        finally:
+            if cancel is not None:
+                cancel.detach()
+        usage = usage_from_rusage(rusage, time.monotonic() - start_time)
+        return stdout, stderr, exit_code, usage, exceeded
+
+    def _run_process_unlimited(self, input_data, cancel):
+        """Fallback for platforms without rlimits: only wall time and output size are enforced"""
+        with open_input(input_data) as stdin_file:
+            start_time = time.monotonic()
+            process = subprocess.Popen(self.command, stdin=stdin_file,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if cancel is not None:
+            cancel.attach(process)
+        exceeded = None
+        try:
+            stdout, stderr = process.communicate(timeout=self.limits.wall_time)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            stdout, stderr = process.communicate()
+            exceeded = "time"
+        finally:
+            if cancel is not None:
+                cancel.detach()
+        if exceeded is None and len(stdout) + len(stderr) > self.limits.output_bytes:
+            exceeded = "output"
+        usage = usage_from_rusage(None, time.monotonic() - start_time)
+        return stdout, stderr, process.returncode, usage, exceeded
+
+    def cleanup(self):
+        """Remove the workspace and everything built into it"""
+        forkserver = get_python_forkserver() if self.forkserver_id else None
+        if forkserver is not None:
+            forkserver.release(self.forkserver_id)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+
+def build_python(code, workdir, build_dir):
+    """Write Python code into the build directory, returns the compile error if any"""
+    os.makedirs(build_dir)
+    with open(os.path.join(build_dir, "main.py"), "w") as f:
+        f.write(code)
+    return None
+
+
+def build_python_forkserver(program):
+    """Compile Python code once in the fork server, returns the syntax error if any"""
+    forkserver = get_python_forkserver()
+    if forkserver is None:
+        return None
+    try:
+        program.forkserver_id, syntax_error = forkserver.compile(os.path.join(program.build_dir, "main.py"))
+        return syntax_error
+    except ForkServerError as e:
+        print(f"Python fork server compile failed, falling back to python3: {e}")
+        return None
+
+
+def build_cpp(code, workdir, build_dir):
+    """Compile C++ code into the build directory, returns the compile error if any"""
+    source = os.path.join(workdir, "main.cpp")
+    binary = os.path.join(build_dir, "main.out")
+    os.makedirs(build_dir)
+    with open(source, "w") as f:
+        f.write(code)
+    compile_result = subprocess.run(["g++", *COMPILE_FLAGS["cpp"], source, "-o", binary], capture_output=True)
+    if compile_result.returncode != 0:
+        return compile_result.stderr.decode()
+    return None
+
+
+def build_java(code, workdir, build_dir):
+    """Compile Java code into the build directory, returns the compile error if any"""
+    source_path = os.path.join(workdir, "Main.java")
+    os.makedirs(build_dir)
+    with open(source_path, "w") as f:
+        f.write(code)
+    args = [*COMPILE_FLAGS["java"], "-d", build_dir, source_path]
+    java_workers = get_java_workers()
+    if java_workers is not None:
+        try:
+            ok, diagnostics = java_workers.compile(args)
+            return None if ok else diagnostics
+        except JavaWorkerError as e:
+            print(f"Java worker compile failed, falling back to javac: {e}")
+    compile = subprocess.run(["javac", *args], capture_output=True)
+    if compile.returncode != 0:
+        return compile.stderr.decode()
+    return None
+
+
+# Builder mapping
+BUILDERS = {
+    "python": build_python,
+    "java": build_java,
+    "cpp": build_cpp
+}
+
+# Command to run a build directory
+RUN_COMMANDS = {
+    "python": lambda build_dir: ["python3", os.path.join(build_dir, "main.py")],
+    "java": lambda build_dir: ["java", f"-Xmx{RUN_MEMORY_LIMIT // (1024 * 1024)}m", "-cp", build_dir, "Main"],
+    "cpp": lambda build_dir: [os.path.join(build_dir, "main.out")]
+}
+
+compile_cache = CompileCache()
+
+_language_versions = None
+_language_versions_lock = threading.Lock()
+
+
+def get_language_versions():
+    """Detected language versions, probed once per process"""
+    global _language_versions
+    with _language_versions_lock:
+        if _language_versions is None:
+            _language_versions = detect_languages()
+        return _language_versions
+
+
+def toolchain_fingerprint(language):
+    """Everything besides the code and tests that a verdict depends on: compiler version, flags and limits"""
+    return json.dumps({
+        "version": get_language_versions().get(language),
+        "flags": COMPILE_FLAGS.get(language, []),
+        "limits": run_limits(language).to_dict()
+    }, sort_keys=True)
+
+
+def compile_code(language, code):
+    """Build code once so it can be run against many inputs.
+
+    Compilation failures are kept on the returned program and reported by
+    every run, so callers see the same result they would from execute_code.
+    Successful C++ and Java builds are stored in the compile cache, and a
+    cached build is reused without invoking the compiler.
+    """
+    if language not in BUILDERS:
+        raise ValueError(f"Unsupported language: {language}")
+    program = CompiledProgram(language, tempfile.mkdtemp(prefix="judge_"))
+    build_dir = program.build_dir
+    try:
+        cache_key = None
+        if language in COMPILE_FLAGS:
+            version = get_language_versions().get(language)
+            cache_key = compile_cache.make_key(language, code, version, COMPILE_FLAGS[language])
+            if compile_cache.fetch(cache_key, build_dir):
+                print(f"Compile cache hit for {language} submission")
+                program.from_cache = True
+                program.command = RUN_COMMANDS[language](build_dir)
+                return program
+
+        program.compile_error = BUILDERS[language](code, program.workdir, build_dir)
+        if language == "python" and program.compile_error is None:
+            program.compile_error = build_python_forkserver(program)
+        if program.compile_error is None:
+            program.command = RUN_COMMANDS[language](build_dir)
+            if cache_key:
+                compile_cache.store(cache_key, build_dir)
+    except Exception as e:
+        program.compile_exception = e
+    return program
+
+
+def run_python(code, input_text):
+    """Execute Python code with given input"""
+    with compile_code("python", code) as program:
+        result = program.run(input_text)
+        return result.stdout, result.stderr
 
 
 def run_cpp(code, input_text):
     """Execute C++ code with given input"""
-    with tempfile.TemporaryDirectory() as tempdir:
-        source = os.path.join(tempdir, "main.cpp")
-        binary = os.path.join(tempdir, "main.out")
-        with open(source, "w") as f:
-            f.write(code)
-        compile_result = subprocess.run(["g++", source, "-o", binary], capture_output=True)
-        if compile_result.returncode != 0:
-            return "", compile_result.stderr.decode()
-        run_result = subprocess.run([binary], input=input_text.encode(), capture_output=True, timeout=5)
-        return run_result.stdout.decode(), run_result.stderr.decode()
+    with compile_code("cpp", code) as program:
+        result = program.run(input_text)
+        return result.stdout, result.stderr
 
 
 def run_java(code, input_text):
     """Execute Java code with given input"""
-    with tempfile.TemporaryDirectory() as tempdir:
-        source_path = os.path.join(tempdir, "Main.java")
-        with open(source_path, "w") as f:
-            f.write(code)
-        compile = subprocess.run(["javac", source_path], capture_output=True)
-        if compile.returncode != 0:
-            return "", compile.stderr.decode()
-        run = subprocess.run(["java", "-cp", tempdir, "Main"], input=input_text.encode(), capture_output=True, timeout=5)
-        return run.stdout.decode(), run.stderr.decode()
+    with compile_code("java", code) as program:
+        result = program.run(input_text)
+        return result.stdout, result.stderr
 
 
 # Executor mapping
@@ -0,0 +1,112 @@
+import os
+import shutil
+import hashlib
+import threading
+import uuid
+from config import COMPILE_CACHE_DIR, COMPILE_CACHE_MAX_BYTES
+
+
+def directory_size(path):
+    """Total size in bytes of all files below a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class CompileCache:
+    """
+    Content-addressed disk cache of compiled artifacts.
+
+    Each entry is a directory named by the hash of everything that affects
+    the build (source, language, compiler version and flags). Entries are
+    evicted least recently used first, using the directory mtime as the
+    access time so the ordering survives restarts.
+    """
+
+    def __init__(self, cache_dir: str = COMPILE_CACHE_DIR, max_bytes: int = COMPILE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, language, code, compiler_version, flags):
+        """Hash everything that affects the compiled output"""
+        digest = hashlib.sha256()
+        for part in (language, compiler_version or "", "\0".join(flags), code):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def fetch(self, key, dest_dir):
+        """Copy a cached build into dest_dir, returns True on a hit"""
+        entry = self._entry_path(key)
+        try:
+            shutil.copytree(entry, dest_dir)
+            os.utime(entry)
+        except OSError:
+            # Missing entry, or evicted while we were copying it
+            shutil.rmtree(dest_dir, ignore_errors=True)
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, src_dir):
+        """Add a build directory to the cache and evict old entries if over budget"""
+        entry = self._entry_path(key)
+        temp_entry = f"{entry}.tmp-{uuid.uuid4().hex}"
+        try:
+            shutil.copytree(src_dir, temp_entry)
+            os.rename(temp_entry, entry)
+        except OSError as e:
+            # Another job stored the same build first
+            shutil.rmtree(temp_entry, ignore_errors=True)
+            if not os.path.isdir(entry):
+                print(f"Error storing compile cache entry {key}: {e}")
+            return
+        self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        """Remove least recently used entries until the cache fits its budget"""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                path = self._entry_path(name)
+                if ".tmp-" in name or not os.path.isdir(path):
+                    continue
+                size = directory_size(path)
+                total += size
+                entries.append((os.path.getmtime(path), name, size))
+
+            entries.sort()
+            for _, name, size in entries:
+                if total <= self.max_bytes:
+                    break
+                if name == keep:
+                    continue
+                shutil.rmtree(self._entry_path(name), ignore_errors=True)
+                total -= size
+
+    def stats(self):
+        """Hit/miss counters and current disk usage"""
+        entries = [name for name in os.listdir(self.cache_dir) if ".tmp-" not in name]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "size_bytes": directory_size(self.cache_dir),
+            "max_bytes": self.max_bytes
+        }
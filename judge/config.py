@@ -7,12 +7,57 @@ TEST_CASES_SERVER_URL = "https://diwakar-gupta.github.io/pepper"
 # File paths
 JUDGE_CODE_FILE = ".judge_code"
 TEST_CASES_CACHE_DIR = ".test_cases_cache"
+COMPILE_CACHE_DIR = ".compile_cache"
+JAVA_WORKER_DIR = ".java_worker"
+
+# Local copy of the test case database (this repository's frontend/public/database).
+# When it exists, manifests and test files are read from it instead of the server.
+LOCAL_DATABASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "public", "database")
+
+# Cached problem manifests are used without revalidation for this many seconds
+MANIFEST_TTL = 10 * 60
+
+# Test case downloads
+DOWNLOAD_WORKERS = 8  # Concurrent downloads (and pooled keep-alive connections)
+DOWNLOAD_RETRIES = 3  # Attempts per request
+DOWNLOAD_RETRY_DELAY = 0.5  # Seconds before the first retry, doubled after each one
+DOWNLOAD_TIMEOUT = 30  # Socket timeout in seconds
+PACK_SHARED_BLOB_MIN = 64 * 1024  # Test files this large are stored once across problems
+TEST_SUITE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Memory budget for loaded test suites
 
 # Retry configuration for Render webapp suspension
 MAX_RETRY_ATTEMPTS = 5
 RETRY_DELAY_BASE = 2  # Base delay in seconds
 WAKEUP_TIMEOUT = 30  # Timeout for wakeup request
 
+# Code execution
+RUN_TIMEOUT = 5  # Wall-clock limit per test case in seconds
+RUN_CPU_TIME_LIMIT = 5  # CPU seconds per test case
+RUN_MEMORY_LIMIT = 256 * 1024 * 1024  # Address space per run (heap size for Java)
+RUN_OUTPUT_LIMIT = 64 * 1024 * 1024  # Bytes of stdout + stderr per run
+OUTPUT_DISPLAY_LIMIT = 1024 * 1024  # Bytes of packed input and checked output kept for the response
+RUN_PROCESS_LIMIT = 4096  # RLIMIT_NPROC; counts all of the user's processes and threads
+TEST_CASE_WORKERS = os.cpu_count() or 1  # Test cases run concurrently
+JOB_WORKERS = 2  # Execute/submit requests handled concurrently
+JOB_SHUTDOWN_TIMEOUT = 30  # Seconds Ctrl+C waits for queued and running jobs before closing the database
+JAVA_WORKERS = 2  # Warm JVMs for Java submissions, 0 to always use javac/java
+PYTHON_FORKSERVER = True  # Fork Python runs from a warm interpreter (Unix only)
+COMPILE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Disk budget for cached builds
+
+# Submission database (SQLite)
+DB_MMAP_SIZE = 64 * 1024 * 1024  # Bytes of the database file read through mmap
+DB_CACHED_STATEMENTS = 64  # Prepared statements kept per connection
+DB_BUSY_TIMEOUT = 10  # Seconds a write waits for another writer
+DB_WRITE_BEHIND_INTERVAL = 0.5  # Most seconds a submission waits to be written (lost if the judge crashes)
+DB_WRITE_BEHIND_BATCH = 100  # Queued writes committed in one transaction at most
+VERDICT_CACHE_MAX_ENTRIES = 10000  # Cached verdicts kept, least recently used evicted first
+
+# Compiler flags (part of the compile cache key)
+COMPILE_FLAGS = {
+    "cpp": [],
+    "java": []
+}
+
 # Language configurations
 LANG_COMMANDS = {
     "python": ["python3", "--version"],
@@ -0,0 +1,102 @@
+import http.client
+import queue
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from config import DOWNLOAD_WORKERS, DOWNLOAD_RETRIES, DOWNLOAD_RETRY_DELAY, DOWNLOAD_TIMEOUT
+
+# Shared pool for concurrent downloads of test case files
+download_pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download")
+
+
+class DownloadError(Exception):
+    """Raised when a request still fails after all retries"""
+
+
+class HTTPConnectionPool:
+    """
+    Keep-alive HTTP(S) connections to one server, shared between threads.
+
+    At most max_connections requests are in flight at once; each reuses an
+    idle connection when there is one, so only new connections pay for a
+    TCP/TLS handshake. Connection errors and 5xx responses are retried with
+    exponential backoff.
+    """
+
+    def __init__(self, base_url, max_connections: int = DOWNLOAD_WORKERS, timeout: float = DOWNLOAD_TIMEOUT):
+        parts = urllib.parse.urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _checkout(self):
+        """An idle connection if there is one, else a new one; returns (connection, reused)"""
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def request(self, path, headers=None):
+        """
+        GET base_url + path, returns (status, headers, body).
+
+        Only failures to get a response at all and 5xx responses raise
+        DownloadError (after retrying); other statuses are returned.
+        """
+        url_path = urllib.parse.quote(self.base_path + path)
+        error = None
+        with self._slots:
+            attempt = 0
+            while attempt < DOWNLOAD_RETRIES:
+                connection, reused = self._checkout()
+                try:
+                    connection.request("GET", url_path, headers=headers or {})
+                    response = connection.getresponse()
+                    body = response.read()
+                except (OSError, http.client.HTTPException) as e:
+                    connection.close()
+                    error = e
+                    if reused:
+                        # The server closed the idle connection; retry at once on a new one
+                        continue
+                else:
+                    if response.will_close:
+                        connection.close()
+                    else:
+                        self._idle.put(connection)
+                    if response.status < 500:
+                        return response.status, response.headers, body
+                    error = f"HTTP {response.status}"
+                attempt += 1
+                if attempt < DOWNLOAD_RETRIES:
+                    time.sleep(DOWNLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+        raise DownloadError(f"GET {url_path} failed after {DOWNLOAD_RETRIES} attempts: {error}")
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(base_url):
+    """The shared connection pool for a server"""
+    with _pools_lock:
+        if base_url not in _pools:
+            _pools[base_url] = HTTPConnectionPool(base_url)
+        return _pools[base_url]
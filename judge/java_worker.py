@@ -0,0 +1,340 @@
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from config import JAVA_WORKERS, JAVA_WORKER_DIR, RUN_MEMORY_LIMIT
+from sandbox import RunLimits
+
+WORKER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "JavaWorker.java")
+
+# Seconds between attempts to restart a worker, doubled after each failure
+RESTART_DELAY = 1
+RESTART_DELAY_MAX = 60
+
+# Seconds a run waits for an idle worker, and how often it checks for cancellation meanwhile
+ACQUIRE_TIMEOUT = 60
+ACQUIRE_POLL_INTERVAL = 0.05
+
+WARMUP_SOURCE = """import java.util.*;
+public class Main {
+    public static void main(String[] args) {
+        Scanner scn = new Scanner(System.in);
+        System.out.println(scn.nextInt() + 1);
+    }
+}
+"""
+
+
+class JavaWorkerError(Exception):
+    """Raised when a worker cannot serve a request and the caller should fall back"""
+
+
+class JavaWorker:
+    """A long-lived JVM running JavaWorker.java, serving one request at a time"""
+
+    def __init__(self, worker_dir):
+        self.process = subprocess.Popen(
+            ["java", f"-Xmx{RUN_MEMORY_LIMIT // (1024 * 1024)}m", "-cp", worker_dir, "JavaWorker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        """Kill the JVM; any request in progress fails with JavaWorkerError"""
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+
+    def close(self):
+        self.kill()
+        self.process.wait()
+
+    def _write_frames(self, *frames):
+        try:
+            for frame in frames:
+                if isinstance(frame, str):
+                    frame = frame.encode()
+                self.process.stdin.write(struct.pack(">I", len(frame)))
+                self.process.stdin.write(frame)
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise JavaWorkerError(f"Java worker is not accepting requests: {e}")
+
+    def _read_frame(self):
+        header = self.process.stdout.read(4)
+        if len(header) < 4:
+            raise JavaWorkerError("Java worker exited")
+        length = struct.unpack(">I", header)[0]
+        data = self.process.stdout.read(length)
+        if len(data) < length:
+            raise JavaWorkerError("Java worker exited")
+        return data
+
+    def compile(self, args):
+        """Run javac in the worker, returns (ok, diagnostics)"""
+        self._write_frames("compile", str(len(args)), *args)
+        status = self._read_frame().decode()
+        diagnostics = self._read_frame().decode()
+        return status == "ok", diagnostics
+
+    def run(self, class_dir, input_path, limits, stdout_sink=None, cancel=None):
+        """
+        Run Main from class_dir with the file at input_path as stdin.
+
+        Returns (stdout, stderr, exit_code, usage, exceeded) where exceeded
+        is "time" or "output" if the run passed the wall time or output
+        limit. A worker whose run timed out is useless afterwards and is
+        killed.
+
+        stdout arrives in chunks while the program runs. With stdout_sink
+        the chunks are passed to it instead of being collected; once it
+        returns False the run is aborted and exceeded is "abort". A cancel
+        token aborts the run the same way. An aborted program stops at its
+        next write or interruptible wait, keeping the JVM; one that does
+        neither runs on until its time limit.
+        """
+        control = _RunControl(self)
+        # Guard against a worker that stops responding altogether
+        watchdog = threading.Timer(limits.wall_time + 5, self.kill)
+        watchdog.start()
+        chunks = []
+        aborted = False
+        try:
+            output_limit = limits.output_bytes if limits.output_bytes is not None else 2 ** 31 - 1
+            self._write_frames("run", class_dir, input_path,
+                               str(int(limits.wall_time * 1000)), str(output_limit))
+            if cancel is not None:
+                cancel.attach(control)
+            status = self._read_frame().decode()
+            while status == "stdout":
+                data = self._read_frame()
+                if stdout_sink is None:
+                    chunks.append(data)
+                elif not aborted and stdout_sink(data) is False:
+                    aborted = True
+                    control.abort()
+                status = self._read_frame().decode()
+            if status == "error":
+                message = self._read_frame().decode()
+                control.send("done")
+                raise JavaWorkerError(message)
+            exit_code = int(self._read_frame().decode())
+            wall_ms, user_ns, cpu_ns = (int(self._read_frame()) for _ in range(3))
+            stderr = self._read_frame()
+        finally:
+            watchdog.cancel()
+            if cancel is not None:
+                cancel.detach()
+        usage = {
+            "wallTimeMs": wall_ms,
+            "userTimeMs": round(user_ns / 1e6, 1),
+            "sysTimeMs": round((cpu_ns - user_ns) / 1e6, 1),
+            # The heap is shared with the worker, so per-run RSS is unknown
+            "peakRssKb": None
+        }
+        exceeded = {"timeout": "time", "output": "output", "aborted": "abort"}.get(status)
+        if exceeded == "time":
+            self.kill()
+        else:
+            control.send("done")
+        if aborted and exceeded is None:
+            exceeded = "abort"
+        return b"".join(chunks), stderr, exit_code, usage, exceeded
+
+
+class _RunControl:
+    """
+    Sends a run its one control frame: "abort" to stop it early, or "done"
+    once its result is in. Attached to a cancel token in place of a
+    process, so cancelling aborts the run without killing the JVM.
+    """
+
+    def __init__(self, worker):
+        self._worker = worker
+        self._lock = threading.Lock()
+        self._sent = False
+
+    def send(self, message):
+        with self._lock:
+            if self._sent:
+                return
+            self._sent = True
+            try:
+                self._worker._write_frames(message)
+            except JavaWorkerError:
+                # The worker is gone; the pool replaces it when it is released
+                pass
+
+    def abort(self):
+        self.send("abort")
+
+    def kill(self):
+        """Called by a cancel token"""
+        self.abort()
+
+
+class JavaWorkerPool:
+    """
+    Fixed-size pool of warm JVM workers. Dead or timed-out workers are
+    replaced when they are returned to the pool: the replacement is started
+    and warmed up in the background, retrying until it starts, so the pool
+    never shrinks and no request waits for a JVM to start.
+    """
+
+    def __init__(self, size: int = JAVA_WORKERS, worker_dir: str = JAVA_WORKER_DIR):
+        self.size = size
+        self.worker_dir = os.path.abspath(worker_dir)
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self):
+        """Build JavaWorker.java if needed and start warmed-up workers"""
+        self._build_worker()
+        for _ in range(self.size):
+            self._idle.put(self._new_worker())
+
+    def _build_worker(self):
+        class_file = os.path.join(self.worker_dir, "JavaWorker.class")
+        if os.path.exists(class_file) and os.path.getmtime(class_file) >= os.path.getmtime(WORKER_SOURCE):
+            return
+        os.makedirs(self.worker_dir, exist_ok=True)
+        result = subprocess.run(["javac", "-d", self.worker_dir, WORKER_SOURCE], capture_output=True)
+        if result.returncode != 0:
+            raise JavaWorkerError(f"Could not build Java worker: {result.stderr.decode()}")
+
+    def _new_worker(self):
+        worker = JavaWorker(self.worker_dir)
+        with self._lock:
+            if self._closed:
+                worker.close()
+                raise JavaWorkerError("Java worker pool is shut down")
+            self._workers.append(worker)
+        self._warm_up(worker)
+        return worker
+
+    def _warm_up(self, worker):
+        """Compile and run a small program so javac and the JIT are loaded"""
+        workdir = tempfile.mkdtemp(prefix="judge_java_warmup_")
+        try:
+            source = os.path.join(workdir, "Main.java")
+            with open(source, "w") as f:
+                f.write(WARMUP_SOURCE)
+            input_path = os.path.join(workdir, "input.txt")
+            with open(input_path, "w") as f:
+                f.write("1")
+            ok, _ = worker.compile(["-d", workdir, source])
+            if ok:
+                worker.run(workdir, input_path, RunLimits(wall_time=10))
+        except JavaWorkerError as e:
+            print(f"Java worker warm-up failed: {e}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _acquire(self, cancel=None):
+        """Take an idle worker, giving up after a minute or once cancel is cancelled"""
+        deadline = time.monotonic() + ACQUIRE_TIMEOUT
+        while True:
+            if cancel is not None and cancel.cancelled:
+                raise JavaWorkerError("Run cancelled")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise JavaWorkerError("No Java worker available")
+            try:
+                return self._idle.get(timeout=min(remaining, ACQUIRE_POLL_INTERVAL))
+            except queue.Empty:
+                pass
+
+    def _release(self, worker):
+        if worker.alive() or self._closed:
+            self._idle.put(worker)
+            return
+        # Recycle a worker that died or was killed after a hung run
+        with self._lock:
+            self._workers.remove(worker)
+        worker.close()
+        threading.Thread(target=self._replace_worker, name="java-worker-restart", daemon=True).start()
+
+    def _replace_worker(self):
+        """Start a worker in place of one that died, retrying until it starts or the pool shuts down"""
+        delay = RESTART_DELAY
+        while not self._closed:
+            try:
+                self._idle.put(self._new_worker())
+                return
+            except JavaWorkerError:
+                return
+            except OSError as e:
+                print(f"Could not restart Java worker, retrying in {delay} seconds: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX)
+
+    def compile(self, args):
+        """Compile with javac arguments on a warm worker, returns (ok, diagnostics)"""
+        worker = self._acquire()
+        try:
+            return worker.compile(args)
+        finally:
+            self._release(worker)
+
+    def run(self, class_dir, input_path, limits, stdout_sink=None, cancel=None):
+        """
+        Run Main from class_dir on a warm worker, see JavaWorker.run.
+
+        A run cancelled before it gets a worker fails with JavaWorkerError
+        without running. A run already in progress is aborted through the
+        worker protocol rather than by killing its JVM, which would cost
+        the pool a warm worker.
+        """
+        worker = self._acquire(cancel)
+        try:
+            if cancel is not None and cancel.cancelled:
+                raise JavaWorkerError("Run cancelled")
+            return worker.run(class_dir, input_path, limits, stdout_sink, cancel)
+        finally:
+            self._release(worker)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+        for worker in workers:
+            worker.close()
+
+
+_pool = None
+
+
+def start_java_workers():
+    """Start the shared worker pool; used by main.py when Java is detected"""
+    global _pool
+    pool = JavaWorkerPool()
+    try:
+        pool.start()
+    except (JavaWorkerError, OSError) as e:
+        print(f"Java worker unavailable, using javac/java subprocesses: {e}")
+        pool.shutdown()
+        return None
+    _pool = pool
+    print(f"Started {pool.size} warm Java workers")
+    return pool
+
+
+def stop_java_workers():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def get_java_workers():
+    """The shared worker pool, or None when it is not running"""
+    return _pool
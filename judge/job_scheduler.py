@@ -0,0 +1,63 @@
+import itertools
+import queue
+import threading
+import time
+from typing import Optional
+from config import JOB_WORKERS
+
+# Job priorities, lower runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+_STOP = object()
+
+
+class JobScheduler:
+    """
+    Runs long jobs (code execution, judging) on a bounded pool of worker
+    threads, so they never block the asyncio loop that drives WebRTC.
+    Jobs are picked by priority, then in submission order.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"judge-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn, *args, priority: int = PRIORITY_NORMAL):
+        """Queue fn(*args) to run on a worker thread"""
+        self._queue.put((priority, next(self._counter), fn, args))
+
+    def pending(self):
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            _, _, fn, args = self._queue.get()
+            if fn is _STOP:
+                return
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Error running job {getattr(fn, '__name__', fn)}: {e}")
+
+    def shutdown(self, wait: bool = False, timeout: Optional[float] = None) -> bool:
+        """
+        Stop the workers once the jobs already queued have run.
+
+        With wait, block until they have stopped or timeout seconds have
+        passed; returns whether every worker stopped.
+        """
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._counter), _STOP, ()))
+        if wait:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            for thread in self._threads:
+                thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
@@ -1,59 +1,273 @@
-import difflib
-from code_executor import execute_code
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from code_executor import compile_code, CancelToken, RunCancelled, toolchain_fingerprint
+from output_checker import OutputChecker
 from test_case_manager import fetch_test_cases
+from test_case_store import blob_hash
+from config import TEST_CASE_WORKERS, OUTPUT_DISPLAY_LIMIT
+
+# Shared pool for running test cases of all submissions
+test_case_pool = ThreadPoolExecutor(max_workers=TEST_CASE_WORKERS, thread_name_prefix="test-case")
 
 
 def compare_outputs(actual, expected):
     """Compare actual output with expected output"""
-    # Split into lines, strip each line, ignore line ending differences
-    actual_lines = [line.rstrip() for line in actual.strip().splitlines()]
-    expected_lines = [line.rstrip() for line in expected.strip().splitlines()]
-    passed = actual_lines == expected_lines
-    diff = None
-    if not passed:
-        diff = '\n'.join(difflib.unified_diff(expected_lines, actual_lines, fromfile='expected', tofile='output', lineterm=''))
-    return passed, diff
+    checker = OutputChecker(expected)
+    checker.feed(actual.encode())
+    return checker.finish()
 
 
-def execute_test_cases(language, code, test_cases):
-    """Execute code against multiple test cases"""
-    results = []
-    for i, test_case in enumerate(test_cases):
-        input_text = test_case.get("input", "")
-        expected_output = test_case.get("expectedOutput", "")
+# Verdicts for runs stopped by a resource limit
+LIMIT_VERDICTS = {
+    "time": ("TLE", "Time limit exceeded"),
+    "memory": ("MLE", "Memory limit exceeded"),
+    "output": ("OLE", "Output limit exceeded")
+}
+
+
+def run_verdict(program, run, passed):
+    """Verdict for a finished run: AC, WA, RE, CE, TLE, MLE or OLE (None if not compared)"""
+    if program.compile_error is not None:
+        return "CE"
+    if run.limit_exceeded:
+        return LIMIT_VERDICTS[run.limit_exceeded][0]
+    if passed is None:
+        return None
+    if passed:
+        return "AC"
+    return "RE" if run.exit_code != 0 and not run.aborted else "WA"
+
+
+def display_input(input_data):
+    """Input as shown in results; packed inputs are cut to the display limit"""
+    if isinstance(input_data, str):
+        return input_data
+    return input_data.preview(OUTPUT_DISPLAY_LIMIT)
+
+
+def run_test_case(program, test_number, test_case, always_compare=False, cancel=None):
+    """Run a compiled program against a single test case"""
+    input_data = test_case.get("input", "")
+    input_text = display_input(input_data)
+    expected_output = test_case.get("expectedOutput", "")
+    try:
+        # Output is checked while it is read, so a wrong answer stops the run early
+        checker = OutputChecker(expected_output) if expected_output.strip() or always_compare else None
+        run = program.run(input_data, cancel=cancel, checker=checker)
+        actual_output = run.stdout.strip()
+        expected_output = expected_output.strip()
+        stderr = run.stderr
+        error = None
+        passed, diff = (None, None)
+        if run.limit_exceeded:
+            error = LIMIT_VERDICTS[run.limit_exceeded][1]
+            stderr = f"{stderr}\n{error}" if stderr else error
+            passed = False
+        elif checker is not None:
+            passed, diff = checker.finish(complete=not run.aborted)
+        return {
+            "testCase": test_number,
+            "input": input_text,
+            "expectedOutput": expected_output,
+            "actualOutput": actual_output,
+            "stderr": stderr,
+            "passed": passed,
+            "diff": diff,
+            "error": error,
+            "verdict": run_verdict(program, run, passed),
+            "usage": run.usage,
+            "infraError": False
+        }
+    except RunCancelled:
+        raise
+    except Exception as e:
+        # The judge could not run the test (e.g. out of file descriptors),
+        # which says nothing about the code
+        return {
+            "testCase": test_number,
+            "input": input_text,
+            "expectedOutput": expected_output,
+            "actualOutput": "",
+            "stderr": str(e),
+            "passed": False,
+            "diff": None,
+            "error": str(e),
+            "verdict": "RE",
+            "usage": None,
+            "infraError": True
+        }
+
+
+def summarize_usage(results):
+    """Largest time and memory used by any test case"""
+    usages = [r["usage"] for r in results if r.get("usage")]
+    
+    def largest(key):
+        values = [usage[key] for usage in usages if usage.get(key) is not None]
+        return max(values) if values else None
+    
+    cpu_times = [(usage.get("userTimeMs") or 0) + (usage.get("sysTimeMs") or 0) for usage in usages]
+    return {
+        "max_wall_time_ms": largest("wallTimeMs"),
+        "max_cpu_time_ms": round(max(cpu_times), 1) if cpu_times else None,
+        "max_peak_rss_kb": largest("peakRssKb")
+    }
+
+
+def compile_program(language, code, progress=None):
+    """compile_code, telling progress when compilation starts and finishes"""
+    if progress is None:
+        return compile_code(language, code)
+    progress({"stage": "compile_started"})
+    start_time = time.time()
+    program = compile_code(language, code)
+    progress({
+        "stage": "compile_finished",
+        "success": program.compile_error is None and program.compile_exception is None,
+        "cached": program.from_cache,
+        "timeMs": round((time.time() - start_time) * 1000, 1)
+    })
+    return program
+
+
+def result_progress(result, total):
+    """Progress update for a finished test case"""
+    return {
+        "stage": "test_case",
+        "testCase": result["testCase"],
+        "total": total,
+        "passed": result["passed"],
+        "verdict": result["verdict"],
+        "wallTimeMs": (result["usage"] or {}).get("wallTimeMs")
+    }
+
+
+def run_test_cases(program, test_cases, always_compare=False, fail_fast=False, progress=None, order=None):
+    """
+    Run a compiled program against test cases concurrently on the shared pool.
+    
+    order lists test case indexes in the order to run them (all of them, in
+    order, by default). Results are returned in that order and keep their
+    original test case numbers. With fail_fast, every run after the first
+    failing test case in that order is cancelled (and its process killed),
+    and the results end at that failing test case.
+    
+    progress, if given, is called with an update as each test case finishes,
+    in the order they finish.
+    """
+    if order is None:
+        order = range(len(test_cases))
+    order = list(order)
+    tokens = [CancelToken() for _ in order]
+    state = {"first_failure": len(order)}
+    lock = threading.Lock()
+    
+    def run(position):
+        index = order[position]
         try:
-            stdout, stderr = execute_code(language, code, input_text)
-            actual_output = stdout.strip()
-            expected_output = expected_output.strip()
-            passed, diff = (None, None)
-            if expected_output:
-                passed, diff = compare_outputs(actual_output, expected_output)
-            results.append({
-                "testCase": i + 1,
-                "input": input_text,
-                "expectedOutput": expected_output,
-                "actualOutput": actual_output,
-                "stderr": stderr,
-                "passed": passed,
-                "diff": diff,
-                "error": None
-            })
-        except Exception as e:
-            results.append({
-                "testCase": i + 1,
-                "input": input_text,
-                "expectedOutput": expected_output,
-                "actualOutput": "",
-                "stderr": str(e),
-                "passed": False,
-                "diff": None,
-                "error": str(e)
-            })
+            result = run_test_case(program, index + 1, test_cases[index], always_compare, cancel=tokens[position])
+        except RunCancelled:
+            return None
+        if fail_fast and not result["passed"]:
+            with lock:
+                if position < state["first_failure"]:
+                    state["first_failure"] = position
+                    for token in tokens[position + 1:]:
+                        token.cancel()
+        if progress is not None:
+            progress(result_progress(result, len(test_cases)))
+        return result
+    
+    futures = [test_case_pool.submit(run, position) for position in range(len(order))]
+    wait(futures)
+    results = [future.result() for future in futures]
+    if fail_fast:
+        results = results[:state["first_failure"] + 1]
     return results
 
 
-def judge_submission(language, code, problem_slug, submission_db):
-    """Judge a code submission against problem test cases"""
+def input_size(test_case):
+    input_data = test_case.get("input", "")
+    return len(input_data) if isinstance(input_data, str) else input_data.length
+
+
+def judging_order(test_cases, failure_counts):
+    """
+    Order to judge test cases in, so a wrong answer is found as soon as possible.
+    
+    Test cases that failed most often come first; ties go to the smallest
+    input, which is usually the quickest to run. failure_counts maps test
+    case numbers to how many submissions failed on them.
+    """
+    return sorted(range(len(test_cases)),
+                  key=lambda index: (-failure_counts.get(index + 1, 0), input_size(test_cases[index]), index))
+
+
+def execute_test_cases(language, code, test_cases, progress=None):
+    """Execute code against multiple test cases"""
+    with compile_program(language, code, progress) as program:
+        return run_test_cases(program, test_cases, progress=progress)
+
+
+def suite_digest(test_cases):
+    """Hash of a test suite's content; packed inputs are identified by the hash they are stored under"""
+    digest = hashlib.sha256()
+    for test_case in test_cases:
+        input_data = test_case.get("input", "")
+        input_hash = blob_hash(input_data.encode()) if isinstance(input_data, str) else input_data.digest
+        digest.update(f"{input_hash} {blob_hash(test_case.get('expectedOutput', '').encode())}\n".encode())
+    return digest.hexdigest()
+
+
+def verdict_key(language, code, test_cases):
+    """
+    Verdict cache key of a submission.
+    
+    Changing the code, the test cases or the toolchain (compiler version,
+    flags or limits) changes the key, so stale verdicts are never found.
+    """
+    digest = hashlib.sha256()
+    for part in (language, toolchain_fingerprint(language), suite_digest(test_cases), code):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def submission_response(status, test_results, error_message, submission_id):
+    """Response to a judged submission, from what is stored for it"""
+    if status == "failed":
+        failed_test_case = test_results["failed_test_case"]
+        return {
+            "failed": True,
+            "failedTestCase": failed_test_case,
+            "testCaseNumber": failed_test_case["testCase"],
+            "verdict": test_results["verdict"],
+            "message": error_message,
+            "submissionId": submission_id
+        }
+    return {
+        "failed": False,
+        "allPassed": True,
+        "verdict": "AC",
+        "usage": test_results["usage"],
+        "message": "All test cases passed!",
+        "submissionId": submission_id
+    }
+
+
+def judge_submission(language, code, problem_slug, submission_db, progress=None):
+    """
+    Judge a code submission against problem test cases.
+    
+    Code that was already judged against the same test cases with the same
+    toolchain gets its earlier verdict without running again; it is still
+    recorded as a new submission, and the response has "cached": True.
+    
+    progress, if given, is called with updates as compilation and each test
+    case finish.
+    """
     if not problem_slug:
         return {"error": "Problem slug is required"}
     
@@ -73,49 +287,33 @@ def judge_submission(language, code, problem_slug, submission_db):
             "submissionId": submission_id
         }
     
-    results = []
-    failed_test_case = None
+    key = verdict_key(language, code, test_cases)
+    cached = submission_db.get_cached_verdict(key)
+    if cached is not None:
+        test_results = dict(cached["test_results"], cached_from=cached["submission_id"])
+        submission_id = submission_db.add_submission(
+            problem_slug=problem_slug,
+            language=language,
+            code=code,
+            status=cached["status"],
+            test_results=test_results,
+            error_message=cached["error_message"],
+            cached_from=cached["submission_id"]
+        )
+        response = submission_response(cached["status"], test_results, cached["error_message"], submission_id)
+        response["cached"] = True
+        return response
     
-    for i, test_case in enumerate(test_cases):
-        input_text = test_case.get("input", "")
-        expected_output = test_case.get("expectedOutput", "")
-        try:
-            stdout, stderr = execute_code(language, code, input_text)
-            actual_output = stdout.strip()
-            expected_output = expected_output.strip()
-            passed, diff = compare_outputs(actual_output, expected_output)
-            
-            result = {
-                "testCase": i + 1,
-                "input": input_text,
-                "expectedOutput": expected_output,
-                "actualOutput": actual_output,
-                "stderr": stderr,
-                "passed": passed,
-                "diff": diff,
-                "error": None
-            }
-            results.append(result)
-            
-            # If this test case failed, stop execution and return details
-            if not passed:
-                failed_test_case = result
-                break
-                
-        except Exception as e:
-            result = {
-                "testCase": i + 1,
-                "input": input_text,
-                "expectedOutput": expected_output,
-                "actualOutput": "",
-                "stderr": str(e),
-                "passed": False,
-                "diff": None,
-                "error": str(e)
-            }
-            results.append(result)
-            failed_test_case = result
-            break
+    # Compile once and run the same build against every test case, starting
+    # with the ones this problem's submissions failed most, and stop at the
+    # first failing test case
+    order = judging_order(test_cases, submission_db.get_failed_test_case_counts(problem_slug))
+    with compile_program(language, code, progress) as program:
+        results = run_test_cases(program, test_cases, always_compare=True, fail_fast=True,
+                                 progress=progress, order=order)
+        # A build or run that failed for reasons other than the code is not a verdict on it
+        cacheable = program.compile_exception is None and not any(r["infraError"] for r in results)
+    failed_test_case = results[-1] if not results[-1]["passed"] else None
     
     # Determine submission status and save to database
     if failed_test_case:
@@ -124,49 +322,39 @@ def judge_submission(language, code, problem_slug, submission_db):
         test_results = {
             "total_test_cases": len(test_cases),
             "passed_test_cases": len(results) - 1,  # All except the failed one
-            "failed_test_case": failed_test_case
+            "failed_test_case": failed_test_case,
+            "verdict": failed_test_case["verdict"],
+            "usage": summarize_usage(results)
         }
         error_message = f"Test case {failed_test_case['testCase']} failed"
-        
-        # Save failed submission to database
-        submission_id = submission_db.add_submission(
-            problem_slug=problem_slug,
-            language=language,
-            code=code,
-            status=status,
-            test_results=test_results,
-            error_message=error_message
-        )
-        
-        # Return the failed test case details
-        return {
-            "failed": True,
-            "failedTestCase": failed_test_case,
-            "testCaseNumber": failed_test_case["testCase"],
-            "message": error_message,
-            "submissionId": submission_id
-        }
+        if failed_test_case["error"]:
+            error_message = f"Test case {failed_test_case['testCase']}: {failed_test_case['error']}"
+        # Running out of time depends on the machine's load, so it is worth retrying
+        cacheable = cacheable and test_results["verdict"] != "TLE"
     else:
         # All test cases passed
         status = "success"
         test_results = {
             "total_test_cases": len(test_cases),
             "passed_test_cases": len(results),
-            "all_passed": True
-        }
-        
-        # Save successful submission to database
-        submission_id = submission_db.add_submission(
-            problem_slug=problem_slug,
-            language=language,
-            code=code,
-            status=status,
-            test_results=test_results
-        )
-        
-        return {
-            "failed": False,
-            "allPassed": True,
-            "message": "All test cases passed!",
-            "submissionId": submission_id
+            "all_passed": True,
+            "verdict": "AC",
+            "usage": summarize_usage(results)
         }
+        error_message = None
+    
+    # Save the submission to database
+    submission_id = submission_db.add_submission(
+        problem_slug=problem_slug,
+        language=language,
+        code=code,
+        status=status,
+        test_results=test_results,
+        error_message=error_message
+    )
+    if cacheable:
+        submission_db.cache_verdict(key, submission_id, status, test_results, error_message)
+    
+    response = submission_response(status, test_results, error_message, submission_id)
+    response["cached"] = False
+    return response
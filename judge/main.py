@@ -4,22 +4,73 @@ import signal
 import sys
 import socketio
 from submission_db import SubmissionDB
-from config import SIGNALING_SERVER_URL
+from config import SIGNALING_SERVER_URL, JAVA_WORKERS, PYTHON_FORKSERVER, JOB_SHUTDOWN_TIMEOUT
+from code_executor import get_language_versions
+from java_worker import start_java_workers, stop_java_workers
+from python_forkserver import start_python_forkserver, stop_python_forkserver
 from connection_manager import connect_with_retry
 from judge_code_manager import get_or_create_judge_code, format_judge_code
 from webrtc_handler import WebRTCHandler
+from job_scheduler import JobScheduler
+from prefetch import CoursePrefetch
+
+
+def prefetch_course(course_slug):
+    """Download the test cases of every problem in a course, then exit"""
+    def progress(update):
+        print(f"[{update['done']}/{update['total']}] {update['problemSlug']}: {update['status']}")
+    
+    try:
+        prefetch = CoursePrefetch(course_slug, progress)
+    except Exception as e:
+        print(f"❌ Could not read course {course_slug}: {e}")
+        sys.exit(1)
+    print(f"📥 Prefetching test cases for {len(prefetch.problem_slugs)} problems in {course_slug}...")
+    scheduler = JobScheduler()
+    prefetch.start(scheduler)
+    prefetch.finished.wait()
+    scheduler.shutdown()
+    summary = prefetch.summary()
+    print(f"✅ Prefetched {summary['done'] - len(summary['failed'])}/{summary['total']} problems")
+    if summary["failed"]:
+        print(f"⚠ Failed: {', '.join(summary['failed'])}")
+
+
+def rebuild_problem_status():
+    """Recompute the per-problem status and rollup tables from the submission history, then exit"""
+    submission_db = SubmissionDB()
+    submission_db.rebuild_problem_status()
+    submission_db.close()
+    print("✅ Problem statuses and statistics rebuilt")
 
 
 def main():
     # Initialize submission database
     submission_db = SubmissionDB()
     
+    # Worker pool for code execution, kept off the WebRTC event loop
+    scheduler = JobScheduler()
+    
+    # Warm interpreter that forks Python runs
+    if PYTHON_FORKSERVER:
+        start_python_forkserver()
+    
+    # Warm JVMs for Java submissions, started in the background
+    if JAVA_WORKERS > 0 and get_language_versions().get("java"):
+        threading.Thread(target=start_java_workers, daemon=True).start()
+    
     # Global variables for cleanup
     sio = None
     loop = None
     
     def signal_handler(sig, frame):
         print("\nShutting down judge...")
+        # Jobs still use the runners and the database, so let them finish first
+        if not scheduler.shutdown(wait=True, timeout=JOB_SHUTDOWN_TIMEOUT):
+            print(f"Jobs still running after {JOB_SHUTDOWN_TIMEOUT} seconds, their results may be lost")
+        stop_java_workers()
+        stop_python_forkserver()
+        submission_db.close()
         if sio:
             sio.disconnect()
         if loop:
@@ -38,7 +89,7 @@ def main():
         print("=" * 40)
         print("Press Ctrl+C to exit")
         
-        webrtc_handler = WebRTCHandler(session_id, sio, submission_db)
+        webrtc_handler = WebRTCHandler(session_id, sio, submission_db, scheduler)
         loop = asyncio.new_event_loop()
         
         def run_loop():
@@ -81,4 +132,11 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # python main.py --prefetch <course> warms the test case cache and exits
+    if len(sys.argv) == 3 and sys.argv[1] == "--prefetch":
+        prefetch_course(sys.argv[2])
+    # python main.py --rebuild-problem-status recomputes solved/failed statuses and statistics and exits
+    elif len(sys.argv) == 2 and sys.argv[1] == "--rebuild-problem-status":
+        rebuild_problem_status()
+    else:
+        main()
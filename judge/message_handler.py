@@ -1,34 +1,67 @@
 import json
-from code_executor import detect_languages, EXECUTORS, execute_code
+from code_executor import detect_languages, EXECUTORS, execute_code, compile_cache
 from judge import execute_test_cases, judge_submission
+from job_scheduler import PRIORITY_NORMAL, PRIORITY_LOW
+from prefetch import CoursePrefetch
+from test_case_manager import suite_cache, course_modules
+
+
+# Message types handled on the job scheduler, with their priority
+SCHEDULED_MESSAGE_TYPES = {
+    "execute": PRIORITY_NORMAL,
+    "submit": PRIORITY_NORMAL,
+    "prefetch": PRIORITY_LOW,
+    # May download the course metadata
+    "course_progress": PRIORITY_NORMAL
+}
 
 
 class MessageHandler:
-    def __init__(self, submission_db):
+    def __init__(self, submission_db, scheduler=None):
         self.submission_db = submission_db
+        self.scheduler = scheduler
     
-    def handle_message(self, message, channel):
-        """Handle incoming messages from browser"""
+    def handle_message(self, message, send):
+        """
+        Handle incoming messages from browser.
+        
+        Messages that run code or may download course data are queued on
+        the job scheduler and answered through send() when the job
+        finishes; everything else is answered right away.
+        """
         try:
             data = json.loads(message)
-            msg_id = data.get("_msgId")
-            
-            response = self._process_message(data)
+        except Exception as e:
+            print(f"Error handling message: {e}")
+            send(json.dumps({"error": str(e)}))
+            return
+        
+        message_type = data.get("type")
+        if self.scheduler is not None and message_type in SCHEDULED_MESSAGE_TYPES:
+            self.scheduler.submit(self._respond, data, send, priority=SCHEDULED_MESSAGE_TYPES[message_type])
+        else:
+            self._respond(data, send)
+    
+    def _respond(self, data, send):
+        """Process a message and send the response to the browser"""
+        msg_id = data.get("_msgId")
+        try:
+            response = self._process_message(data, send)
             
             # Include the _msgId in the response if it was provided
             if msg_id is not None:
                 response["_msgId"] = msg_id
             
             print(f"Sending response to browser: {response}")
-            channel.send(json.dumps(response))
+            send(json.dumps(response))
         except Exception as e:
             print(f"Error handling message: {e}")
             error_response = {"error": str(e)}
-            if 'msg_id' in locals() and msg_id is not None:
+            if msg_id is not None:
                 error_response["_msgId"] = msg_id
-            channel.send(json.dumps(error_response))
+            send(json.dumps(error_response))
     
-    def _process_message(self, data):
+    def _process_message(self, data, send):
         """Process different message types"""
         message_type = data.get("type")
         
@@ -36,10 +69,10 @@ class MessageHandler:
             return {"languages": detect_languages()}
         
         elif message_type == "execute":
-            return self._handle_execute(data)
+            return self._handle_execute(data, self._progress_sender(data, send))
         
         elif message_type == "submit":
-            return self._handle_submit(data)
+            return self._handle_submit(data, self._progress_sender(data, send))
         
         elif message_type == "submission_history":
             return self._handle_submission_history(data)
@@ -47,16 +80,45 @@ class MessageHandler:
         elif message_type == "check_problems_status":
             return self._handle_check_problems_status(data)
         
+        elif message_type == "course_progress":
+            return self._handle_course_progress(data)
+        
         elif message_type == "submission_stats":
             return self._handle_submission_stats(data)
         
+        elif message_type == "daily_activity":
+            return self._handle_daily_activity(data)
+        
         elif message_type == "recent_submissions":
             return self._handle_recent_submissions(data)
         
+        elif message_type == "cache_stats":
+            return self._handle_cache_stats(data)
+        
+        elif message_type == "prefetch":
+            return self._handle_prefetch(data, send)
+        
         else:
             return {"error": "Unknown message type"}
     
-    def _handle_execute(self, data):
+    def _progress_sender(self, data, send):
+        """
+        Function sending progress updates for a request, or None.
+        
+        Only requests with a _msgId that ask for progress get updates: they
+        are sent as "progress" messages with the request's _msgId, before
+        its final response.
+        """
+        msg_id = data.get("_msgId")
+        if msg_id is None or not data.get("progress"):
+            return None
+        
+        def progress(update):
+            send(json.dumps({"type": "progress", "_msgId": msg_id, **update}))
+        
+        return progress
+    
+    def _handle_execute(self, data, progress=None):
         """Handle code execution request"""
         code = data.get("code")
         lang = data.get("language")
@@ -69,7 +131,7 @@ class MessageHandler:
         if lang not in EXECUTORS:
             return {"error": "Unsupported language"}
         
-        results = execute_test_cases(lang, code, test_cases)
+        results = execute_test_cases(lang, code, test_cases, progress)
         
         return {
             "results": results,
@@ -81,7 +143,7 @@ class MessageHandler:
             }
         }
     
-    def _handle_submit(self, data):
+    def _handle_submit(self, data, progress=None):
         """Handle code submission request"""
         code = data.get("code")
         lang = data.get("language")
@@ -90,20 +152,57 @@ class MessageHandler:
         if lang not in EXECUTORS:
             return {"error": "Unsupported language"}
         
-        return judge_submission(lang, code, problem_slug, self.submission_db)
+        return judge_submission(lang, code, problem_slug, self.submission_db, progress)
+    
+    def _page_options(self, data):
+        """Keyset pagination, filter and projection parameters shared by submission listings"""
+        limit = data.get("limit")
+        if limit is not None and (not isinstance(limit, int) or limit < 1):
+            raise ValueError("limit must be a positive integer")
+        cursor = data.get("cursor")
+        if cursor is not None and not (isinstance(cursor, dict) and "timestamp" in cursor and "id" in cursor):
+            raise ValueError("cursor must be the nextCursor of a previous response")
+        fields = data.get("fields")
+        if fields is not None and not isinstance(fields, list):
+            raise ValueError("fields must be a list")
+        if fields is not None and not data.get("includeCode", False):
+            # Code is only sent when asked for with includeCode, projection or not
+            fields = [field for field in fields if field != "code"]
+        return {"before": cursor, "language": data.get("language"), "status": data.get("status"), "fields": fields}
+    
+    def _next_cursor(self, submissions, limit):
+        """Cursor for the page after these submissions, None if this is the last page"""
+        if limit is None or len(submissions) <= limit:
+            return None
+        del submissions[limit:]
+        return {"timestamp": submissions[-1]["timestamp"], "id": submissions[-1]["id"]}
     
     def _handle_submission_history(self, data):
-        """Handle submission history request"""
+        """
+        Handle submission history request.
+        
+        Without a limit the whole history is returned; with one, pages are
+        requested by passing the previous response's nextCursor as cursor.
+        """
         problem_slug = data.get("problemSlug")
         include_code = data.get("includeCode", False)
+        limit = data.get("limit")
         
         if not problem_slug:
             return {"error": "Problem slug is required"}
         
-        history = self.submission_db.get_submission_history(problem_slug)
+        options = self._page_options(data)
+        # One extra submission tells whether there is a next page
+        history = self.submission_db.get_submission_history(
+            problem_slug, include_code=include_code, limit=limit + 1 if limit is not None else None,
+            submission_id=data.get("submissionId"), **options)
+        next_cursor = self._next_cursor(history, limit)
         history_summary = []
         
         for submission in history:
+            if options["fields"] is not None:
+                history_summary.append(submission)
+                continue
             summary = {
                 "id": submission["id"],
                 "language": submission["language"],
@@ -121,7 +220,8 @@ class MessageHandler:
         return {
             "problemSlug": problem_slug,
             "history": history_summary,
-            "totalSubmissions": len(history_summary)
+            "totalSubmissions": len(history_summary),
+            "nextCursor": next_cursor
         }
     
     def _handle_check_problems_status(self, data):
@@ -141,16 +241,87 @@ class MessageHandler:
             "notAttemptedCount": sum(1 for status in status_map.values() if status == "not_attempted")
         }
     
+    def _handle_course_progress(self, data):
+        """
+        Handle course progress request.
+        
+        Counts solved, failed and attempted problems for every module of a
+        course, or for one module if "module" is given.
+        """
+        course_slug = data.get("course")
+        module_slug = data.get("module")
+        
+        if not course_slug:
+            return {"error": "Course slug is required"}
+        
+        modules = course_modules(course_slug)
+        if module_slug is not None:
+            modules = [module for module in modules if module["slug"] == module_slug]
+            if not modules:
+                return {"error": f"Unknown module: {module_slug}"}
+        
+        progress = self.submission_db.get_module_progress({module["slug"]: module["problems"] for module in modules})
+        module_progress = [{"module": module["slug"], "name": module["name"], **progress[module["slug"]]}
+                           for module in modules]
+        # A problem listed in several modules counts once in the totals
+        course_problems = list(dict.fromkeys(slug for module in modules for slug in module["problems"]))
+        totals = self.submission_db.get_module_progress({course_slug: course_problems})[course_slug]
+        return {"course": course_slug, "modules": module_progress, "totals": totals}
+    
     def _handle_submission_stats(self, data):
         """Handle submission statistics request"""
         stats = self.submission_db.get_submission_stats()
         return {"stats": stats}
     
+    def _handle_daily_activity(self, data):
+        """Handle daily activity and streak request"""
+        days = data.get("days", 365)
+        
+        if not isinstance(days, int) or days < 1:
+            return {"error": "days must be a positive integer"}
+        
+        activity = self.submission_db.get_daily_activity(days)
+        return {
+            "days": activity["days"],
+            "currentStreak": activity["current_streak"],
+            "longestStreak": activity["longest_streak"]
+        }
+    
     def _handle_recent_submissions(self, data):
         """Handle recent submissions request"""
+        options = self._page_options(data)
         limit = data.get("limit", 10)
-        recent = self.submission_db.get_recent_submissions(limit)
+        # One extra submission tells whether there is a next page
+        recent = self.submission_db.get_recent_submissions(limit + 1, **options)
+        next_cursor = self._next_cursor(recent, limit)
         return {
             "recentSubmissions": recent,
-            "count": len(recent)
+            "count": len(recent),
+            "nextCursor": next_cursor
         }
+    
+    def _handle_cache_stats(self, data):
+        """Handle judge cache statistics request"""
+        return {"compileCache": compile_cache.stats(), "testSuites": suite_cache.stats()}
+    
+    def _handle_prefetch(self, data, send):
+        """
+        Handle course prefetch request.
+        
+        Replies with the number of problems right away; a prefetch_progress
+        message follows as each problem's test cases are cached.
+        """
+        course_slug = data.get("course")
+        
+        if not course_slug:
+            return {"error": "Course slug is required"}
+        
+        def progress(update):
+            send(json.dumps({"type": "prefetch_progress", **update}))
+        
+        prefetch = CoursePrefetch(course_slug, progress)
+        if self.scheduler is not None:
+            prefetch.start(self.scheduler)
+        else:
+            prefetch.run()
+        return {"prefetch": prefetch.summary()}
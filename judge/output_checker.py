@@ -0,0 +1,175 @@
+"""
+Streaming comparison of program output against the expected output.
+
+The checker is fed stdout as it is read from the running program and
+compares it line by line, so a run can be stopped as soon as its output
+differs from the expected output or runs past its end. Only a bounded
+prefix of the output is kept for display, and the diff covers a few lines
+around the first difference.
+
+Lines are compared the same way compare_outputs always has: leading and
+trailing whitespace of the whole output is ignored, as is trailing
+whitespace on each line.
+"""
+import codecs
+import difflib
+import re
+from config import OUTPUT_DISPLAY_LIMIT
+
+DIFF_CONTEXT_LINES = 3
+DIFF_LINE_LIMIT = 200  # Characters of a line shown in the diff
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@$")
+
+
+def _clip(line):
+    if len(line) > DIFF_LINE_LIMIT:
+        return line[:DIFF_LINE_LIMIT] + "..."
+    return line
+
+
+class OutputChecker:
+    """Compares output fed in chunks against an expected output"""
+
+    def __init__(self, expected, display_limit=OUTPUT_DISPLAY_LIMIT):
+        self.expected_lines = [line.rstrip() for line in expected.strip().splitlines()]
+        self.display_limit = display_limit
+        self.reset()
+
+    def reset(self):
+        """Forget any output fed so far, e.g. before the run is retried"""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._display = []
+        self._display_size = 0
+        self.truncated = False
+        self._started = False
+        self._partial = ""
+        self._partial_content = 0  # Length of the partial line without trailing whitespace
+        self._line = 0  # Index of the next complete line
+        self._blank_tail = 0  # Blank lines seen past the end of the expected output
+        # Set once the output differs: index of the first differing line and
+        # the actual lines from there on (a few, for the diff)
+        self.mismatch = None
+        self._mismatch_lines = []
+        self._partial_checked = False
+        self._finished = False
+        self._complete = True
+
+    def feed(self, data):
+        """Check a chunk of output, returns False once the output is known to be wrong"""
+        self._keep(data)
+        if self.mismatch is not None:
+            return False
+        text = self._decoder.decode(data)
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return True
+            self._started = True
+        lines = text.split("\n")
+        self._append_partial(lines[0])
+        for line in lines[1:]:
+            self._check_line(self._partial.rstrip())
+            self._partial = ""
+            self._partial_content = 0
+            self._partial_checked = False
+            self._append_partial(line)
+        self._check_partial()
+        return self.mismatch is None
+
+    def finish(self, complete=True):
+        """
+        Call at the end of the output, returns (passed, diff).
+
+        Pass complete=False if reading stopped early because feed returned
+        False, so the diff does not show the unread output as missing.
+        """
+        if not self._finished:
+            self._finished = True
+            self._complete = complete
+            tail = self._decoder.decode(b"", final=True)
+            if self.mismatch is None:
+                self._append_partial(tail)
+                if self._partial.strip():
+                    self._check_line(self._partial.rstrip())
+                if self.mismatch is None and self._line < len(self.expected_lines):
+                    # Output ended early
+                    self.mismatch = self._line
+            elif complete and self._partial_content and not self._partial_checked:
+                self._check_line(self._partial.rstrip())
+        if self.mismatch is None:
+            return True, None
+        return False, self._diff()
+
+    @property
+    def output(self):
+        """The output seen so far, up to the display limit"""
+        text = b"".join(self._display).decode(errors="replace")
+        if self.truncated:
+            text += "\n... (output truncated)"
+        return text
+
+    def _keep(self, data):
+        room = self.display_limit - self._display_size
+        if len(data) > room:
+            self.truncated = True
+            data = data[:max(room, 0)]
+        if data:
+            self._display.append(data)
+            self._display_size += len(data)
+
+    def _append_partial(self, text):
+        content = text.rstrip()
+        if content:
+            self._partial_content = len(self._partial) + len(content)
+        self._partial += text
+
+    def _check_partial(self):
+        """Catch a wrong line before it is complete, e.g. a runaway print without newlines"""
+        if self.mismatch is not None or not self._partial_content:
+            return
+        content = self._partial[:self._partial_content]
+        if self._line >= len(self.expected_lines) or not self.expected_lines[self._line].startswith(content):
+            self._check_line(content)
+            self._partial_checked = True
+
+    def _check_line(self, line):
+        if self.mismatch is not None:
+            if len(self._mismatch_lines) <= DIFF_CONTEXT_LINES:
+                self._mismatch_lines.append(line)
+            return
+        if self._line < len(self.expected_lines):
+            if line != self.expected_lines[self._line]:
+                self.mismatch = self._line
+                self._mismatch_lines.append(line)
+            self._line += 1
+        elif not line:
+            # Blank lines at the end are ignored, unless more output follows
+            self._blank_tail += 1
+        else:
+            self.mismatch = self._line
+            self._mismatch_lines = [""] * min(self._blank_tail, DIFF_CONTEXT_LINES) + [line]
+
+    def _diff(self):
+        """Unified diff of the lines around the first difference"""
+        start = max(self.mismatch - DIFF_CONTEXT_LINES, 0)
+        # Output before the mismatch equals the expected output
+        actual = self.expected_lines[start:self.mismatch] + self._mismatch_lines[:DIFF_CONTEXT_LINES + 1]
+        expected = self.expected_lines[start:self.mismatch + DIFF_CONTEXT_LINES + 1]
+        if not self._complete:
+            # The rest of the output was never read, so don't show it as missing
+            expected = expected[:len(actual)]
+        lines = []
+        for line in difflib.unified_diff([_clip(line) for line in expected], [_clip(line) for line in actual],
+                                         fromfile='expected', tofile='output', lineterm='',
+                                         n=DIFF_CONTEXT_LINES):
+            match = _HUNK_HEADER.match(line)
+            if match:
+                # Hunk line numbers are relative to the window
+                old_start, old_count, new_start, new_count = match.groups()
+                line = (f"@@ -{int(old_start) + start}{old_count or ''} "
+                        f"+{int(new_start) + start}{new_count or ''} @@")
+            lines.append(line)
+        if not self._complete:
+            lines.append("... (output not compared past the first difference)")
+        return '\n'.join(lines)
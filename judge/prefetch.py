@@ -0,0 +1,69 @@
+import threading
+from job_scheduler import PRIORITY_LOW
+from test_case_manager import course_problem_slugs, fetch_and_cache_all_test_case_files, get_problem_manifest
+
+
+class CoursePrefetch:
+    """
+    Warms the test case cache for every problem of a course.
+
+    Each problem is fetched in its own low-priority scheduler job, so
+    execute and submit requests queued meanwhile run before the rest of the
+    prefetch. progress(update) is called after each problem with a dict of
+    the problem slug, its status ("cached", "no_test_cases" or "failed")
+    and the done/total counts.
+    """
+
+    def __init__(self, course_slug, progress=None):
+        self.course_slug = course_slug
+        self.progress = progress
+        self.problem_slugs = course_problem_slugs(course_slug)
+        self.done = 0
+        self.failed = []
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        if not self.problem_slugs:
+            self.finished.set()
+
+    def start(self, scheduler):
+        """Queue a job per problem"""
+        for problem_slug in self.problem_slugs:
+            scheduler.submit(self.fetch_problem, problem_slug, priority=PRIORITY_LOW)
+
+    def run(self):
+        """Fetch every problem on the calling thread"""
+        for problem_slug in self.problem_slugs:
+            self.fetch_problem(problem_slug)
+
+    def fetch_problem(self, problem_slug):
+        status = "cached" if fetch_and_cache_all_test_case_files(problem_slug) else "failed"
+        if status == "failed":
+            try:
+                # The manifest is cached by now, so this needs no request
+                if not get_problem_manifest(problem_slug).get("testCases"):
+                    status = "no_test_cases"
+            except Exception:
+                pass
+        with self._lock:
+            self.done += 1
+            if status == "failed":
+                self.failed.append(problem_slug)
+            update = {
+                "course": self.course_slug,
+                "problemSlug": problem_slug,
+                "status": status,
+                "done": self.done,
+                "total": len(self.problem_slugs)
+            }
+            if self.done == len(self.problem_slugs):
+                self.finished.set()
+        if self.progress is not None:
+            self.progress(update)
+
+    def summary(self):
+        return {
+            "course": self.course_slug,
+            "total": len(self.problem_slugs),
+            "done": self.done,
+            "failed": list(self.failed)
+        }
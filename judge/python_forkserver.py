@@ -0,0 +1,383 @@
+"""
+Fork server for Python submissions.
+
+A pre-initialized Python process compiles each submission once and forks a
+child per test case, so runs skip interpreter startup and site imports.
+
+The judge talks to the server over a Unix socket, one connection per
+request. A run request carries the stdin, stdout and stderr file
+descriptors of the run. The server forks a runner that forks the actual
+child, reports its pid, waits for it and reports its exit code. The
+runner kills the child when it passes its wall time limit, or when the
+judge sends anything on the connection (or closes it); being the process
+that reaps the child, it never signals a pid that was already reused.
+
+This file is also the server entry point: python3 python_forkserver.py <socket>
+"""
+import array
+import builtins
+import json
+import os
+import select
+import selectors
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import uuid
+from sandbox import RunLimits, apply_limits, read_pipes, poll_with_usage, next_poll_interval, usage_from_rusage
+
+# Modules submissions commonly import, loaded once in the server
+PRELOAD_MODULES = ["bisect", "collections", "functools", "heapq", "itertools", "math", "re", "string"]
+
+MAX_MESSAGE = 64 * 1024
+
+
+class ForkServerError(Exception):
+    """Raised when the fork server cannot serve a request and the caller should fall back"""
+
+
+def forkserver_supported():
+    return hasattr(os, "fork") and hasattr(socket, "AF_UNIX")
+
+
+def _send_message(conn, message, fds=()):
+    data = json.dumps(message).encode() + b"\n"
+    if fds:
+        conn.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))])
+    else:
+        conn.sendall(data)
+
+
+def _recv_message(conn, max_fds=0):
+    """Read one newline-terminated JSON message and any file descriptors sent with it"""
+    fds = array.array("i")
+    ancillary_size = socket.CMSG_SPACE(max_fds * fds.itemsize) if max_fds else 0
+    data, ancillary, _, _ = conn.recvmsg(MAX_MESSAGE, ancillary_size)
+    for level, kind, payload in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - (len(payload) % fds.itemsize)])
+    while data and not data.endswith(b"\n"):
+        chunk = conn.recv(MAX_MESSAGE)
+        if not chunk:
+            break
+        data += chunk
+    if not data:
+        raise EOFError("connection closed")
+    return json.loads(data), list(fds)
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+def _exit_code(error):
+    """Exit code for a SystemExit, printing its message like the interpreter does"""
+    code = error.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _execute(code, path, fds, limits):
+    """Run a compiled submission in the current (forked) process; never returns"""
+    exit_code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        apply_limits(limits)
+        sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+        sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+        sys.stderr = open(2, "w", encoding="utf-8", errors="backslashreplace", closefd=False, buffering=1)
+        sys.argv = [path]
+        sys.path[0] = os.path.dirname(path)
+        namespace = {"__name__": "__main__", "__file__": path, "__builtins__": builtins, "__doc__": None}
+        try:
+            exec(code, namespace)
+        except SystemExit as e:
+            exit_code = _exit_code(e)
+        except BaseException:
+            error_type, error, tb = sys.exc_info()
+            # Skip this frame so the traceback starts at the submission
+            traceback.print_exception(error_type, error, tb.tb_next)
+            exit_code = 1
+        try:
+            sys.stdout.flush()
+        except BrokenPipeError:
+            pass
+        sys.stderr.flush()
+    finally:
+        os._exit(exit_code)
+
+
+def _wait_for_child(conn, child, deadline):
+    """Reap the child, killing it at deadline or when the judge asks; returns (exit_code, rusage, timed_out)"""
+    killed = False
+    timed_out = False
+    interval = 0.001
+    while True:
+        result = poll_with_usage(child)
+        if result is not None:
+            return (*result, timed_out)
+        if killed:
+            time.sleep(interval)
+        elif time.monotonic() >= deadline:
+            os.kill(child, signal.SIGKILL)
+            killed = timed_out = True
+        elif select.select([conn], [], [], interval)[0]:
+            # A kill request, or the judge closed the connection
+            os.kill(child, signal.SIGKILL)
+            killed = True
+        interval = next_poll_interval(interval)
+
+
+def _runner(conn, code, path, fds, limits):
+    """Fork the child for one run, report its pid, exit code and usage; never returns"""
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        start_time = time.monotonic()
+        child = os.fork()
+        if child == 0:
+            conn.close()
+            _execute(code, path, fds, limits)
+        for fd in fds:
+            os.close(fd)
+        _send_message(conn, {"pid": child})
+        exit_code, rusage, timed_out = _wait_for_child(conn, child, start_time + limits.wall_time)
+        usage = usage_from_rusage(rusage, time.monotonic() - start_time)
+        _send_message(conn, {"exitCode": exit_code, "usage": usage, "timedOut": timed_out})
+    finally:
+        os._exit(0)
+
+
+def serve(socket_path):
+    """Accept requests until the judge closes our stdin"""
+    for name in PRELOAD_MODULES:
+        __import__(name)
+    # Runners are never waited for by the server
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # Ctrl+C in the judge's terminal is handled by the judge, which closes our stdin
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(64)
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    selector.register(sys.stdin, selectors.EVENT_READ)
+
+    programs = {}
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is sys.stdin:
+                # The judge exited or closed our stdin
+                return
+            conn, _ = listener.accept()
+            fds = []
+            try:
+                message, fds = _recv_message(conn, max_fds=3)
+                op = message.get("op")
+                if op == "compile":
+                    path = message["path"]
+                    try:
+                        with open(path) as f:
+                            source = f.read()
+                        programs[message["id"]] = (compile(source, path, "exec"), path)
+                        _send_message(conn, {"ok": True})
+                    except (SyntaxError, ValueError) as e:
+                        error = "".join(traceback.format_exception_only(type(e), e))
+                        _send_message(conn, {"ok": False, "error": error})
+                elif op == "release":
+                    programs.pop(message["id"], None)
+                    _send_message(conn, {"ok": True})
+                elif op == "run" and message.get("id") in programs and len(fds) == 3:
+                    code, path = programs[message["id"]]
+                    limits = RunLimits.from_dict(message["limits"])
+                    if os.fork() == 0:
+                        listener.close()
+                        _runner(conn, code, path, fds, limits)
+                else:
+                    _send_message(conn, {"error": f"Bad request: {op}"})
+            except Exception as e:
+                print(f"Fork server error: {e}", file=sys.stderr)
+            finally:
+                for fd in fds:
+                    os.close(fd)
+                conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Client side
+# ---------------------------------------------------------------------------
+
+class _ChildKiller:
+    """Lets a CancelToken kill a forked child, by asking the runner that reaps it"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def kill(self):
+        try:
+            self.conn.sendall(b"kill\n")
+        except OSError:
+            # The runner already reported the exit
+            pass
+
+
+class PythonForkServer:
+    """Client for a fork server process started by the judge"""
+
+    def __init__(self):
+        self.socket_dir = tempfile.mkdtemp(prefix="judge_forkserver_")
+        self.socket_path = os.path.join(self.socket_dir, "forkserver.sock")
+        self.process = subprocess.Popen(["python3", os.path.abspath(__file__), self.socket_path],
+                                        stdin=subprocess.PIPE)
+        deadline = time.monotonic() + 10
+        while not os.path.exists(self.socket_path):
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.close()
+                raise ForkServerError("Fork server did not start")
+            time.sleep(0.01)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def _request(self, message, fds=()):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.socket_path)
+            _send_message(conn, message, fds)
+        except OSError as e:
+            conn.close()
+            raise ForkServerError(f"Fork server is not accepting requests: {e}")
+        return conn
+
+    def _reply(self, conn, reader=None):
+        """
+        Read a reply. A run's replies come one after the other, so they are
+        read through one buffered reader that keeps whatever follows a line.
+        """
+        try:
+            if reader is None:
+                reply, _ = _recv_message(conn)
+            else:
+                line = reader.readline()
+                if not line:
+                    raise EOFError("connection closed")
+                reply = json.loads(line)
+        except (OSError, EOFError, ValueError) as e:
+            raise ForkServerError(f"Fork server did not reply: {e}")
+        if "error" in reply and "ok" not in reply:
+            raise ForkServerError(reply["error"])
+        return reply
+
+    def compile(self, path):
+        """Compile a source file in the server, returns (program_id, syntax_error)"""
+        program_id = uuid.uuid4().hex
+        with self._request({"op": "compile", "id": program_id, "path": path}) as conn:
+            reply = self._reply(conn)
+        if not reply["ok"]:
+            return None, reply["error"]
+        return program_id, None
+
+    def release(self, program_id):
+        """Forget a compiled program"""
+        try:
+            with self._request({"op": "release", "id": program_id}) as conn:
+                self._reply(conn)
+        except ForkServerError:
+            pass
+
+    def run(self, program_id, stdin_file, limits, cancel=None, stdout_sink=None):
+        """
+        Fork a child running the program, with stdin_file as its stdin.
+
+        Returns (stdout, stderr, exit_code, usage, exceeded) where exceeded
+        is "time" or "output" if the child was killed for passing the wall
+        time (also after closing its output) or output limit, or "abort" if
+        stdout_sink stopped it (see sandbox.read_pipes).
+        """
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        try:
+            conn = self._request({"op": "run", "id": program_id, "limits": limits.to_dict()},
+                                 [stdin_file.fileno(), stdout_write, stderr_write])
+        except ForkServerError:
+            os.close(stdout_read)
+            os.close(stderr_read)
+            raise
+        finally:
+            os.close(stdout_write)
+            os.close(stderr_write)
+
+        with conn, conn.makefile("rb") as reader, open(stdout_read, "rb") as stdout, \
+                open(stderr_read, "rb") as stderr:
+            self._reply(conn, reader)  # The child's pid; the runner kills it for us
+            child = _ChildKiller(conn)
+            if cancel is not None:
+                cancel.attach(child)
+            try:
+                deadline = time.monotonic() + limits.wall_time
+                outputs, exceeded = read_pipes([stdout, stderr], deadline, limits.output_bytes, stdout_sink)
+                if exceeded:
+                    child.kill()
+                reply = self._reply(conn, reader)
+            finally:
+                if cancel is not None:
+                    cancel.detach()
+        if exceeded is None and reply.get("timedOut"):
+            exceeded = "time"
+        return outputs[0], outputs[1], reply["exitCode"], reply["usage"], exceeded
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+
+_server = None
+
+
+def start_python_forkserver():
+    """Start the shared fork server; used by main.py"""
+    global _server
+    if not forkserver_supported():
+        return None
+    try:
+        _server = PythonForkServer()
+    except (ForkServerError, OSError) as e:
+        print(f"Python fork server unavailable, using python3 subprocesses: {e}")
+        return None
+    print("Started Python fork server")
+    return _server
+
+
+def stop_python_forkserver():
+    global _server
+    if _server is not None:
+        _server.close()
+        _server = None
+
+
+def get_python_forkserver():
+    """The shared fork server, or None when it is not running"""
+    if _server is not None and not _server.alive():
+        return None
+    return _server
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1])
@@ -0,0 +1,250 @@
+"""
+Resource limits and usage accounting for submission runs.
+
+Limits are applied with rlimits before the submission starts; usage
+comes from the rusage reported by wait4. On platforms without the
+resource module (Windows) only the wall-clock timeout and output limit
+are enforced.
+
+Only the standard library is used here, since the Python fork server
+imports this module too.
+"""
+import json
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Longest pause between checks whether a child has exited, in seconds
+WAIT_POLL_INTERVAL = 0.02
+
+# Run by spawn_limited: the shell stops itself until its limits are set, then becomes the program
+_HOLD_SCRIPT = 'kill -STOP $$; exec "$@"'
+
+
+class RunLimits:
+    """Limits for a single run. A limit of None is not enforced."""
+
+    def __init__(self, wall_time, cpu_time=None, memory_bytes=None, output_bytes=None, processes=None):
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.memory_bytes = memory_bytes
+        self.output_bytes = output_bytes
+        self.processes = processes
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def limits_supported():
+    return resource is not None
+
+
+def _set_limit(kind, soft, hard, pid=None):
+    """Lower a limit of pid (this process if None), never above the hard limit already in place"""
+    _, current_hard = resource.getrlimit(kind) if pid is None else resource.prlimit(pid, kind)
+    if current_hard != resource.RLIM_INFINITY:
+        soft = min(soft, current_hard)
+        hard = min(hard, current_hard)
+    if pid is None:
+        resource.setrlimit(kind, (soft, hard))
+    else:
+        resource.prlimit(pid, kind, (soft, hard))
+
+
+def apply_limits(limits, pid=None):
+    """Set rlimits on process pid, or on the current process before it becomes the submission"""
+    if resource is None:
+        return
+    if limits.cpu_time is not None:
+        # SIGXCPU at the soft limit, SIGKILL one second later
+        cpu_seconds = max(1, int(limits.cpu_time + 0.999))
+        _set_limit(resource.RLIMIT_CPU, cpu_seconds, cpu_seconds + 1, pid)
+    if limits.memory_bytes is not None:
+        _set_limit(resource.RLIMIT_AS, limits.memory_bytes, limits.memory_bytes, pid)
+    if limits.output_bytes is not None:
+        # Pipes are limited by the reader; this bounds files the program writes
+        _set_limit(resource.RLIMIT_FSIZE, limits.output_bytes, limits.output_bytes, pid)
+    if limits.processes is not None and hasattr(resource, "RLIMIT_NPROC"):
+        _set_limit(resource.RLIMIT_NPROC, limits.processes, limits.processes, pid)
+    _set_limit(resource.RLIMIT_CORE, 0, 0, pid)
+
+
+def spawn_limited(command, limits, **popen_args):
+    """
+    Start command under rlimits, returns its Popen.
+
+    Python code must not run in a child forked from a threaded process, so
+    no preexec_fn sets the limits there. With prlimit (Linux) the child is
+    a shell that stops itself; its limits are set from here and it goes on
+    to exec the command. Elsewhere the command is exec'd through this
+    module, which sets the limits on itself first.
+    """
+    if not hasattr(resource, "prlimit"):
+        wrapper = [sys.executable, "-S", os.path.abspath(__file__), json.dumps(limits.to_dict())]
+        return subprocess.Popen(wrapper + list(command), **popen_args)
+    process = subprocess.Popen(["/bin/sh", "-c", _HOLD_SCRIPT, "sh"] + list(command), **popen_args)
+    _, status = os.waitpid(process.pid, os.WUNTRACED)
+    if not os.WIFSTOPPED(status):
+        process.returncode = _exit_code(status)
+        raise OSError(f"Could not start {command[0]} under limits")
+    try:
+        apply_limits(limits, process.pid)
+    except BaseException:
+        kill_child(process.pid)
+        process.returncode = _exit_code(os.waitpid(process.pid, 0)[1])
+        raise
+    os.kill(process.pid, signal.SIGCONT)
+    return process
+
+
+def read_pipes(pipes, deadline, max_output=None, stdout_sink=None):
+    """
+    Read file objects until EOF.
+
+    Returns (contents, exceeded) where exceeded is None, "time" if the
+    deadline passed or "output" if more than max_output bytes were read in
+    total. Reading stops as soon as a limit is exceeded.
+
+    With stdout_sink, data from the first pipe is passed to it instead of
+    being collected; if the sink returns False reading stops and exceeded
+    is "abort".
+    """
+    chunks = {pipe: [] for pipe in pipes}
+    total = 0
+    exceeded = None
+    with selectors.DefaultSelector() as selector:
+        for pipe in pipes:
+            selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map() and exceeded is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                exceeded = "time"
+                break
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, 65536)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                total += len(data)
+                if max_output is not None and total > max_output:
+                    exceeded = "output"
+                    break
+                if stdout_sink is not None and key.fileobj is pipes[0]:
+                    if stdout_sink(data) is False:
+                        exceeded = "abort"
+                        break
+                else:
+                    chunks[key.fileobj].append(data)
+    return [b"".join(chunks[pipe]) for pipe in pipes], exceeded
+
+
+def kill_child(pid):
+    """
+    SIGKILL a child that is reaped later with wait_with_usage.
+
+    Popen.kill() polls first, which reaps a child that already exited and
+    makes the following wait fail with ECHILD; the pid cannot be reused
+    before the child is reaped, so signalling it directly is safe.
+    """
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def _exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def wait_with_usage(pid):
+    """Wait for a child, returns (exit_code, rusage) with rusage None where wait4 is unavailable"""
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(pid, 0)
+    else:
+        _, status = os.waitpid(pid, 0)
+        rusage = None
+    return _exit_code(status), rusage
+
+
+def poll_with_usage(pid):
+    """Reap a child if it has exited, returns (exit_code, rusage), or None while it is running"""
+    if hasattr(os, "wait4"):
+        reaped, status, rusage = os.wait4(pid, os.WNOHANG)
+    else:
+        reaped, status = os.waitpid(pid, os.WNOHANG)
+        rusage = None
+    if reaped == 0:
+        return None
+    return _exit_code(status), rusage
+
+
+def next_poll_interval(interval):
+    """Back off between polls for a child's exit: it has usually exited by the first one"""
+    return min(interval * 2, WAIT_POLL_INTERVAL)
+
+
+def usage_from_rusage(rusage, wall_time):
+    """
+    Usage dict reported with each run; times in milliseconds, memory in kilobytes.
+
+    Peak RSS is the kernel's high-water mark for the child, which also
+    counts pages it shared with its parent right after the fork.
+    """
+    usage = {
+        "wallTimeMs": round(wall_time * 1000, 1),
+        "userTimeMs": None,
+        "sysTimeMs": None,
+        "peakRssKb": None
+    }
+    if rusage is not None:
+        peak_rss = rusage.ru_maxrss
+        if sys.platform == "darwin":
+            # macOS reports bytes, Linux kilobytes
+            peak_rss //= 1024
+        usage.update({
+            "userTimeMs": round(rusage.ru_utime * 1000, 1),
+            "sysTimeMs": round(rusage.ru_stime * 1000, 1),
+            "peakRssKb": peak_rss
+        })
+    return usage
+
+
+# Messages printed by each runtime when an allocation fails
+OUT_OF_MEMORY_MARKERS = ("MemoryError", "std::bad_alloc", "java.lang.OutOfMemoryError")
+
+
+def detect_limit_exceeded(exit_code, stderr, usage, limits):
+    """Tell from how a run ended whether it hit the CPU or memory limit"""
+    if exit_code == 0:
+        return None
+    cpu_time_ms = (usage.get("userTimeMs") or 0) + (usage.get("sysTimeMs") or 0)
+    if hasattr(signal, "SIGXCPU") and exit_code == -signal.SIGXCPU:
+        return "time"
+    if limits.cpu_time is not None and exit_code == -signal.SIGKILL and cpu_time_ms >= limits.cpu_time * 1000:
+        return "time"
+    if any(marker in stderr for marker in OUT_OF_MEMORY_MARKERS):
+        return "memory"
+    peak_rss = usage.get("peakRssKb")
+    if limits.memory_bytes is not None and peak_rss is not None and peak_rss * 1024 >= limits.memory_bytes * 0.95:
+        return "memory"
+    return None
+
+
+if __name__ == "__main__":
+    # Exec wrapper for spawn_limited: sandbox.py <limits json> <command>...
+    apply_limits(RunLimits.from_dict(json.loads(sys.argv[1])))
+    os.execvp(sys.argv[2], sys.argv[2:])
@@ -2,10 +2,44 @@ import sqlite3
 import os
 import time
 import json
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from typing import List, Dict, Optional, Set
 import hashlib
+import queue
+import zlib
+import threading
 from contextlib import contextmanager
+from config import (DB_MMAP_SIZE, DB_CACHED_STATEMENTS, DB_BUSY_TIMEOUT, DB_WRITE_BEHIND_INTERVAL,
+                    DB_WRITE_BEHIND_BATCH, VERDICT_CACHE_MAX_ENTRIES)
+
+# Tells the writer thread to stop after writing what is queued
+_STOP = object()
+
+# Statuses a submission can have (the CHECK constraint on submissions.status)
+SUBMISSION_STATUSES = ("success", "failed", "error")
+
+# JSON type of the failed test case number in a row's test_results; CASE
+# keeps malformed JSON from raising
+_FAILED_TEST_CASE_TYPE = ("CASE WHEN json_valid({row}.test_results) "
+                          "THEN json_type({row}.test_results, '$.failed_test_case.testCase') END")
+
+# Fields a submission listing can return
+SUBMISSION_FIELDS = ("id", "problem_slug", "language", "code", "status", "timestamp", "datetime",
+                     "test_results", "error_message", "cached_from")
+
+
+def code_hash(code):
+    """Key of a submission's code in code_blobs"""
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def compress_code(code):
+    return zlib.compress(code.encode())
+
+
+def decompress_code(data):
+    return zlib.decompress(data).decode()
+
 
 class SubmissionDB:
     """
@@ -14,10 +48,26 @@ class SubmissionDB:
     1. Adding new submission entries
     2. Fetching submission history for a question
     3. Checking which problems from a list were solved/failed
+    
+    Writes are queued and committed by a background thread in batches, at
+    most DB_WRITE_BEHIND_INTERVAL seconds after they are made, so callers
+    never wait for the disk. Queued writes are flushed before every read,
+    and on close().
     """
     
-    def __init__(self, db_path: str = "submissions.db"):
+    def __init__(self, db_path: str = "submissions.db", verdict_cache_size: int = VERDICT_CACHE_MAX_ENTRIES):
         self.db_path = db_path
+        self.verdict_cache_size = verdict_cache_size
+        # One long-lived connection per thread; in WAL mode readers never
+        # block the writer, so status queries run while a submission is saved
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Writer thread and its queue, started on the first write
+        self._writer = None
+        self._queue = None
+        self._pending = 0  # Writes queued and not yet committed
+        self._pending_lock = threading.Lock()
         self._init_database()
     
     def _init_database(self):
@@ -25,21 +75,55 @@ class SubmissionDB:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
+            # Submitted code, compressed and stored once per distinct text
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS code_blobs (
+                    hash TEXT PRIMARY KEY,  -- SHA-256 of the code
+                    code BLOB NOT NULL,  -- zlib-compressed UTF-8
+                    size INTEGER NOT NULL  -- Uncompressed bytes
+                )
+            """)
+            
             # Create submissions table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS submissions (
                     id TEXT PRIMARY KEY,
                     problem_slug TEXT NOT NULL,
                     language TEXT NOT NULL,
-                    code TEXT NOT NULL,
+                    code_hash TEXT NOT NULL REFERENCES code_blobs(hash),
                     status TEXT NOT NULL CHECK (status IN ('success', 'failed', 'error')),
                     timestamp REAL NOT NULL,
                     datetime TEXT NOT NULL,
                     test_results TEXT,  -- JSON string
-                    error_message TEXT
+                    error_message TEXT,
+                    cached_from TEXT  -- Submission whose cached verdict this one reused
                 )
             """)
             
+            # Older databases had a problem_status view over submissions; it
+            # is dropped before submissions can be rebuilt below, and replaced
+            # by a table built from their submissions.
+            cursor.execute("SELECT type FROM sqlite_master WHERE name = 'problem_status'")
+            existing = cursor.fetchone()
+            if existing is not None and existing['type'] == 'view':
+                cursor.execute("DROP VIEW problem_status")
+            
+            # Older databases kept the code in every submission row
+            cursor.execute("PRAGMA table_info(submissions)")
+            migrate_code = 'code' in [column['name'] for column in cursor.fetchall()]
+            if migrate_code:
+                self._move_code_to_blobs(conn)
+            
+            # Older databases only recorded reused verdicts inside test_results
+            cursor.execute("PRAGMA table_info(submissions)")
+            migrate_cached_from = 'cached_from' not in [column['name'] for column in cursor.fetchall()]
+            if migrate_cached_from:
+                cursor.execute("ALTER TABLE submissions ADD COLUMN cached_from TEXT")
+                cursor.execute("""
+                    UPDATE submissions SET cached_from = json_extract(test_results, '$.cached_from')
+                    WHERE json_valid(test_results)
+                """)
+            
             # Create indexes for fast queries
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_problem_slug 
@@ -51,6 +135,17 @@ class SubmissionDB:
                 ON submissions(timestamp DESC)
             """)
             
+            # Keyset pagination walks these in (timestamp, id) order
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_timestamp_id 
+                ON submissions(timestamp DESC, id DESC)
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_problem_timestamp_id 
+                ON submissions(problem_slug, timestamp DESC, id DESC)
+            """)
+            
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_status 
                 ON submissions(status)
@@ -61,40 +156,373 @@ class SubmissionDB:
                 ON submissions(problem_slug, status)
             """)
             
-            # Create a view for problem status (latest successful submission per problem)
+            # Verdicts of judged code, keyed by a hash of the code, language,
+            # test suite and toolchain, so identical resubmissions are not re-run
             cursor.execute("""
-                CREATE VIEW IF NOT EXISTS problem_status AS
-                SELECT 
-                    problem_slug,
-                    CASE 
-                        WHEN MAX(CASE WHEN status = 'success' THEN timestamp END) IS NOT NULL THEN 'success'
-                        WHEN MAX(CASE WHEN status = 'failed' THEN timestamp END) IS NOT NULL THEN 'failed'
-                        ELSE 'error'
-                    END as status,
-                    MAX(timestamp) as latest_timestamp
-                FROM submissions 
-                GROUP BY problem_slug
+                CREATE TABLE IF NOT EXISTS verdict_cache (
+                    key TEXT PRIMARY KEY,
+                    submission_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    test_results TEXT,  -- JSON string
+                    error_message TEXT,
+                    timestamp REAL NOT NULL  -- Last stored or used, for evicting the least recently used
+                )
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_verdict_cache_timestamp
+                ON verdict_cache(timestamp)
+            """)
+            
+            # One row per problem with its best status, kept up to date by a
+            # trigger so status lookups never aggregate the submission history
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS problem_status (
+                    problem_slug TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,  -- Best status: success, then failed, then error
+                    latest_timestamp REAL NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    first_solved_timestamp REAL
+                )
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_problem_status_status
+                ON problem_status(status)
+            """)
+            
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS update_problem_status
+                AFTER INSERT ON submissions
+                BEGIN
+                    INSERT INTO problem_status
+                    (problem_slug, status, latest_timestamp, attempts, first_solved_timestamp)
+                    VALUES (NEW.problem_slug, NEW.status, NEW.timestamp, 1,
+                            CASE WHEN NEW.status = 'success' THEN NEW.timestamp END)
+                    ON CONFLICT(problem_slug) DO UPDATE SET
+                        status = CASE
+                            WHEN 'success' IN (status, excluded.status) THEN 'success'
+                            WHEN 'failed' IN (status, excluded.status) THEN 'failed'
+                            ELSE 'error'
+                        END,
+                        latest_timestamp = MAX(latest_timestamp, excluded.latest_timestamp),
+                        attempts = attempts + 1,
+                        first_solved_timestamp = COALESCE(
+                            MIN(first_solved_timestamp, excluded.first_solved_timestamp),
+                            first_solved_timestamp, excluded.first_solved_timestamp);
+                END
+            """)
+            
+            if existing is None or existing['type'] == 'view':
+                self._rebuild_problem_status(cursor)
+            
+            # Submission counts by status and language, and per day, kept up to
+            # date by a trigger so statistics and activity never scan the
+            # submission history. Databases from before they existed get them
+            # built from their submissions.
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_activity'")
+            build_rollups = cursor.fetchone() is None
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS submission_totals (
+                    dimension TEXT NOT NULL,  -- status or language
+                    value TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (dimension, value)
+                ) WITHOUT ROWID
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS daily_activity (
+                    day TEXT PRIMARY KEY,  -- Local date, YYYY-MM-DD
+                    submissions INTEGER NOT NULL,
+                    successful INTEGER NOT NULL
+                ) WITHOUT ROWID
             """)
             
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS update_submission_rollups
+                AFTER INSERT ON submissions
+                BEGIN
+                    INSERT INTO submission_totals (dimension, value, count)
+                    VALUES ('status', NEW.status, 1), ('language', NEW.language, 1)
+                    ON CONFLICT(dimension, value) DO UPDATE SET count = count + 1;
+                    INSERT INTO daily_activity (day, submissions, successful)
+                    VALUES (date(NEW.timestamp, 'unixepoch', 'localtime'), 1, NEW.status = 'success')
+                    ON CONFLICT(day) DO UPDATE SET
+                        submissions = submissions + 1,
+                        successful = successful + excluded.successful;
+                END
+            """)
+            
+            if build_rollups:
+                self._rebuild_rollups(cursor)
+            
+            # How many failed submissions of each problem stopped at each test
+            # case, so the judge can run the likeliest failures first without
+            # reading the problem's history on every submit. Reused verdicts
+            # are not counted again; databases that counted them get the
+            # table rebuilt.
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'test_case_failures'")
+            build_failures = cursor.fetchone() is None or migrate_cached_from
+            if migrate_cached_from:
+                cursor.execute("DROP TRIGGER IF EXISTS update_test_case_failures")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS test_case_failures (
+                    problem_slug TEXT NOT NULL,
+                    test_case INTEGER NOT NULL,
+                    failures INTEGER NOT NULL,
+                    PRIMARY KEY (problem_slug, test_case)
+                ) WITHOUT ROWID
+            """)
+            
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS update_test_case_failures
+                AFTER INSERT ON submissions
+                WHEN NEW.status = 'failed' AND NEW.cached_from IS NULL
+                     AND {_FAILED_TEST_CASE_TYPE.format(row='NEW')} = 'integer'
+                BEGIN
+                    INSERT INTO test_case_failures (problem_slug, test_case, failures)
+                    VALUES (NEW.problem_slug, json_extract(NEW.test_results, '$.failed_test_case.testCase'), 1)
+                    ON CONFLICT(problem_slug, test_case) DO UPDATE SET failures = failures + 1;
+                END
+            """)
+            
+            if build_failures:
+                self._rebuild_test_case_failures(cursor)
+            
             conn.commit()
+            
+            if migrate_code:
+                # Give the space of the inline code back to the file system
+                conn.execute("VACUUM")
+    
+    def _move_code_to_blobs(self, conn):
+        """Migrate submissions with inline code to code_blobs, in one transaction"""
+        conn.create_function("code_hash", 1, code_hash, deterministic=True)
+        conn.create_function("compress_code", 1, compress_code, deterministic=True)
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR IGNORE INTO code_blobs (hash, code, size)
+            SELECT code_hash(code), compress_code(code), length(CAST(code AS BLOB))
+            FROM submissions
+        """)
+        cursor.execute("""
+            CREATE TABLE submissions_migrated (
+                id TEXT PRIMARY KEY,
+                problem_slug TEXT NOT NULL,
+                language TEXT NOT NULL,
+                code_hash TEXT NOT NULL REFERENCES code_blobs(hash),
+                status TEXT NOT NULL CHECK (status IN ('success', 'failed', 'error')),
+                timestamp REAL NOT NULL,
+                datetime TEXT NOT NULL,
+                test_results TEXT,  -- JSON string
+                error_message TEXT
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO submissions_migrated
+            (id, problem_slug, language, code_hash, status, timestamp, datetime, test_results, error_message)
+            SELECT id, problem_slug, language, code_hash(code), status, timestamp, datetime,
+                   test_results, error_message
+            FROM submissions
+        """)
+        # Dropping the table drops its indexes and trigger; they are created again after this.
+        # Legacy renaming leaves any other view on submissions alone instead of failing on it.
+        cursor.execute("DROP TABLE submissions")
+        cursor.execute("PRAGMA legacy_alter_table = ON")
+        try:
+            cursor.execute("ALTER TABLE submissions_migrated RENAME TO submissions")
+        finally:
+            cursor.execute("PRAGMA legacy_alter_table = OFF")
+    
+    def _connect(self):
+        """Open a connection with the journaling and I/O settings the database uses"""
+        # check_same_thread is off only so close() can close every thread's connection
+        conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT,
+                               cached_statements=DB_CACHED_STATEMENTS, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; no fsync per commit
+        conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+        return conn
     
     @contextmanager
     def _get_connection(self):
-        """Get a database connection with proper cleanup"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable column access by name
+        """
+        Get the calling thread's database connection, opened on first use and kept open.
+        
+        Queued writes are committed first, so reads always see them.
+        """
+        self.flush()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
         try:
             yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+    
+    def _write(self, statements):
+        """Queue (sql, params) statements to be committed together by the writer thread"""
+        with self._pending_lock:
+            self._pending += 1
+            if self._writer is None:
+                self._queue = queue.Queue()
+                self._writer = threading.Thread(target=self._write_behind, args=(self._queue,),
+                                                name="submission-writer", daemon=True)
+                self._writer.start()
+            self._queue.put(statements)
+    
+    def _write_behind(self, write_queue):
+        """Writer thread: commit queued writes in batches until told to stop"""
+        conn = self._connect()
+        try:
+            while True:
+                batch = [write_queue.get()]
+                deadline = time.monotonic() + DB_WRITE_BEHIND_INTERVAL
+                while len(batch) < DB_WRITE_BEHIND_BATCH and isinstance(batch[-1], list):
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(write_queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                writes = [item for item in batch if isinstance(item, list)]
+                if writes:
+                    try:
+                        self._commit_writes(conn, writes)
+                    except sqlite3.Error:
+                        # Write them one at a time so only a bad write is lost
+                        for statements in writes:
+                            try:
+                                self._commit_writes(conn, [statements])
+                            except sqlite3.Error as e:
+                                print(f"Error writing queued submission record: {e}")
+                    with self._pending_lock:
+                        self._pending -= len(writes)
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                if batch[-1] is _STOP:
+                    return
         finally:
             conn.close()
     
+    def _commit_writes(self, conn, writes):
+        """Run queued writes in one transaction; rolled back if any of them fails"""
+        with conn:
+            for statements in writes:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+    
+    def flush(self):
+        """Wait until every queued write is committed"""
+        with self._pending_lock:
+            writer = self._writer
+            if not self._pending or writer is None:
+                # Nothing queued, or close() is committing it
+                return
+            done = threading.Event()
+            self._queue.put(done)
+        while not done.wait(1):
+            if not writer.is_alive():
+                return
+    
+    def close(self):
+        """
+        Commit queued writes and close every connection.
+        
+        The database can still be used afterwards; call this on shutdown so
+        no recent submission is lost.
+        """
+        with self._pending_lock:
+            writer, self._writer = self._writer, None
+            if writer is not None:
+                self._queue.put(_STOP)
+                self._queue = None
+        if writer is not None:
+            writer.join()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        # Threads reopen their connection on next use
+        self._local = threading.local()
+    
+    def _rebuild_problem_status(self, cursor):
+        cursor.execute("DELETE FROM problem_status")
+        cursor.execute("""
+            INSERT INTO problem_status
+            (problem_slug, status, latest_timestamp, attempts, first_solved_timestamp)
+            SELECT 
+                problem_slug,
+                CASE 
+                    WHEN SUM(status = 'success') > 0 THEN 'success'
+                    WHEN SUM(status = 'failed') > 0 THEN 'failed'
+                    ELSE 'error'
+                END,
+                MAX(timestamp),
+                COUNT(*),
+                MIN(CASE WHEN status = 'success' THEN timestamp END)
+            FROM submissions 
+            GROUP BY problem_slug
+        """)
+    
+    def _rebuild_rollups(self, cursor):
+        cursor.execute("DELETE FROM submission_totals")
+        cursor.execute("""
+            INSERT INTO submission_totals (dimension, value, count)
+            SELECT 'status', status, COUNT(*) FROM submissions GROUP BY status
+            UNION ALL
+            SELECT 'language', language, COUNT(*) FROM submissions GROUP BY language
+        """)
+        cursor.execute("DELETE FROM daily_activity")
+        cursor.execute("""
+            INSERT INTO daily_activity (day, submissions, successful)
+            SELECT date(timestamp, 'unixepoch', 'localtime') as day, COUNT(*), SUM(status = 'success')
+            FROM submissions
+            GROUP BY day
+        """)
+    
+    def _rebuild_test_case_failures(self, cursor):
+        cursor.execute("DELETE FROM test_case_failures")
+        cursor.execute(f"""
+            INSERT INTO test_case_failures (problem_slug, test_case, failures)
+            SELECT problem_slug, json_extract(test_results, '$.failed_test_case.testCase') as test_case, COUNT(*)
+            FROM submissions
+            WHERE status = 'failed' AND cached_from IS NULL
+                  AND {_FAILED_TEST_CASE_TYPE.format(row='submissions')} = 'integer'
+            GROUP BY problem_slug, test_case
+        """)
+    
+    def rebuild_problem_status(self):
+        """
+        Recompute the problem_status, rollup and test case failure tables
+        from every submission.
+        
+        They are kept up to date as submissions are added; this is only
+        needed if the tables were changed by hand.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            self._rebuild_problem_status(cursor)
+            self._rebuild_rollups(cursor)
+            self._rebuild_test_case_failures(cursor)
+            conn.commit()
+    
     def _generate_submission_id(self, problem_slug: str, language: str, code: str, timestamp: float) -> str:
         """Generate a unique submission ID"""
         content = f"{problem_slug}_{language}_{timestamp}_{code[:100]}"
         return hashlib.md5(content.encode()).hexdigest()
     
     def add_submission(self, problem_slug: str, language: str, code: str, status: str, 
-                      test_results: Optional[Dict] = None, error_message: Optional[str] = None) -> str:
+                      test_results: Optional[Dict] = None, error_message: Optional[str] = None,
+                      cached_from: Optional[str] = None) -> str:
         """
         Add a new submission entry.
         
@@ -105,10 +533,21 @@ class SubmissionDB:
             status: "success", "failed", or "error"
             test_results: Optional test execution results
             error_message: Optional error message if status is "error"
+            cached_from: ID of the submission whose cached verdict was
+                reused instead of judging this one
         
         Returns:
             submission_id: Unique identifier for the submission
+        
+        Raises:
+            ValueError: If status is not one of the statuses above
         """
+        # Checked here since the row is written later, by the writer thread
+        if status not in SUBMISSION_STATUSES:
+            raise ValueError(f"Invalid submission status: {status!r}")
+        if not problem_slug or not language:
+            raise ValueError("A submission needs a problem slug and a language")
+        
         timestamp = time.time()
         submission_id = self._generate_submission_id(problem_slug, language, code, timestamp)
         datetime_str = datetime.fromtimestamp(timestamp).isoformat()
@@ -116,50 +555,173 @@ class SubmissionDB:
         # Convert test_results to JSON string if provided
         test_results_json = json.dumps(test_results) if test_results else None
         
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO submissions 
-                (id, problem_slug, language, code, status, timestamp, datetime, test_results, error_message)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (submission_id, problem_slug, language, code, status, timestamp, 
-                  datetime_str, test_results_json, error_message))
-            conn.commit()
+        # Committed by the writer thread; the ID is known already.
+        # Code identical to an earlier submission's is not stored again.
+        digest = code_hash(code)
+        self._write([("""
+            INSERT OR IGNORE INTO code_blobs (hash, code, size)
+            VALUES (?, ?, ?)
+        """, (digest, compress_code(code), len(code.encode()))), ("""
+            INSERT INTO submissions 
+            (id, problem_slug, language, code_hash, status, timestamp, datetime, test_results, error_message,
+             cached_from)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (submission_id, problem_slug, language, digest, status, timestamp, 
+              datetime_str, test_results_json, error_message, cached_from))])
         
         return submission_id
     
-    def get_submission_history(self, problem_slug: str) -> List[Dict]:
+    def get_cached_verdict(self, key: str) -> Optional[Dict]:
         """
-        Get submission history for a specific problem.
+        Look up the verdict stored for a verdict cache key.
         
         Args:
-            problem_slug: The problem identifier
+            key: Hash identifying the code, language, test suite and toolchain
         
         Returns:
-            List of submissions for the problem, sorted by timestamp (newest first)
+            Dictionary with submission_id, status, test_results and
+            error_message of the submission it was judged for, or None
+        
+        A hit marks the verdict as recently used, so it is evicted last.
         """
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT id, problem_slug, language, code, status, timestamp, datetime, 
-                       test_results, error_message
-                FROM submissions 
-                WHERE problem_slug = ?
-                ORDER BY timestamp DESC
-            """, (problem_slug,))
+                SELECT submission_id, status, test_results, error_message
+                FROM verdict_cache
+                WHERE key = ?
+            """, (key,))
             
-            rows = cursor.fetchall()
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            self._write([("UPDATE verdict_cache SET timestamp = ? WHERE key = ?", (time.time(), key))])
+            verdict = dict(row)
+            if verdict['test_results']:
+                verdict['test_results'] = json.loads(verdict['test_results'])
+            return verdict
+    
+    def cache_verdict(self, key: str, submission_id: str, status: str,
+                      test_results: Optional[Dict] = None, error_message: Optional[str] = None):
+        """
+        Store the verdict of a judged submission under a verdict cache key.
+        
+        The least recently used verdicts are evicted once the cache holds
+        more than verdict_cache_size of them.
+        
+        Args:
+            key: Hash identifying the code, language, test suite and toolchain
+            submission_id: The submission the verdict was judged for
+            status: "success" or "failed"
+            test_results: Test execution results of the submission
+            error_message: Optional error message of the submission
+        """
+        test_results_json = json.dumps(test_results) if test_results else None
+        
+        self._write([("""
+            INSERT OR REPLACE INTO verdict_cache
+            (key, submission_id, status, test_results, error_message, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (key, submission_id, status, test_results_json, error_message, time.time())), ("""
+            DELETE FROM verdict_cache
+            WHERE timestamp < (SELECT timestamp FROM verdict_cache ORDER BY timestamp DESC LIMIT 1 OFFSET ?)
+        """, (self.verdict_cache_size - 1,))])
+    
+    def _list_submissions(self, filters: Dict, fields, limit: Optional[int], before: Optional[Dict]) -> List[Dict]:
+        """
+        Submissions matching column filters, newest first, one keyset page at a time.
+        
+        before is the (timestamp, id) of the last submission of the previous
+        page, so a page costs the same however deep into the history it is.
+        id and timestamp are always returned, for the next page's cursor.
+        """
+        unknown = set(fields) - set(SUBMISSION_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown submission fields: {', '.join(sorted(unknown))}")
+        columns = ["s.id", "s.timestamp"] + [
+            "b.code" if field == "code" else f"s.{field}"
+            for field in fields if field not in ("id", "timestamp")]
+        sql = f"SELECT {', '.join(columns)} FROM submissions s"
+        if "code" in fields:
+            # Only read the code blobs when the code is asked for
+            sql += " JOIN code_blobs b ON b.hash = s.code_hash"
+        conditions = [f"s.{column} = ?" for column, value in filters.items() if value is not None]
+        params = [value for value in filters.values() if value is not None]
+        if before is not None:
+            conditions.append("(s.timestamp, s.id) < (?, ?)")
+            params += [before["timestamp"], before["id"]]
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY s.timestamp DESC, s.id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
             
             submissions = []
-            for row in rows:
+            for row in cursor.fetchall():
                 submission = dict(row)
+                if "code" in submission:
+                    submission['code'] = decompress_code(submission['code'])
                 # Parse test_results JSON if present
-                if submission['test_results']:
+                if submission.get('test_results'):
                     submission['test_results'] = json.loads(submission['test_results'])
                 submissions.append(submission)
             
             return submissions
     
+    def get_submission_history(self, problem_slug: str, include_code: bool = True, limit: Optional[int] = None,
+                               before: Optional[Dict] = None, language: Optional[str] = None,
+                               status: Optional[str] = None, submission_id: Optional[str] = None,
+                               fields: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get submission history for a specific problem.
+        
+        Args:
+            problem_slug: The problem identifier
+            include_code: Whether to load each submission's code
+            limit: Maximum number of submissions to return (all if None)
+            before: {"timestamp", "id"} of the last submission already
+                listed; only older submissions are returned
+            language: Only submissions in this language
+            status: Only submissions with this status
+            submission_id: Only this submission
+            fields: Fields to return (default: all); code is only returned
+                with include_code, and id and timestamp are always included
+        
+        Returns:
+            List of submissions for the problem, sorted by timestamp (newest first)
+        """
+        if fields is None:
+            fields = SUBMISSION_FIELDS
+        fields = [field for field in fields if include_code or field != "code"]
+        filters = {"problem_slug": problem_slug, "language": language, "status": status, "id": submission_id}
+        return self._list_submissions(filters, fields, limit, before)
+    
+    def get_failed_test_case_counts(self, problem_slug: str) -> Dict[int, int]:
+        """
+        Count how often submissions for a problem failed on each test case.
+        
+        Args:
+            problem_slug: The problem identifier
+        
+        Returns:
+            Dictionary mapping test case number to the number of failed
+            submissions that stopped at it
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT test_case, failures
+                FROM test_case_failures
+                WHERE problem_slug = ?
+            """, (problem_slug,))
+            
+            return {row['test_case']: row['failures'] for row in cursor.fetchall()}
+    
     def check_problems_status(self, problem_slugs: List[str]) -> Dict[str, str]:
         """
         Check which problems from a list were solved, failed, or have errors.
@@ -213,72 +775,151 @@ class SubmissionDB:
             rows = cursor.fetchall()
             return {row['problem_slug'] for row in rows}
     
-    def get_submission_stats(self) -> Dict:
+    def get_module_progress(self, modules: Dict[str, List[str]]) -> Dict[str, Dict[str, int]]:
         """
-        Get overall submission statistics.
+        Count solved, failed and attempted problems per module in one query.
+        
+        The problem lists are loaded into a temporary table and joined with
+        problem_status, so a whole course is checked without a long IN list.
+        
+        Args:
+            modules: Dictionary mapping module slug to its problem slugs
         
         Returns:
-            Dictionary with submission statistics
+            Dictionary mapping module slug to its "total", "solved", "failed",
+            "error" and "attempted" counts, each problem counted once
         """
+        modules = {module: list(dict.fromkeys(problems)) for module, problems in modules.items()}
+        progress = {module: {"total": len(problems), "solved": 0, "failed": 0, "error": 0, "attempted": 0}
+                    for module, problems in modules.items()}
+        rows = [(module, slug) for module, problems in modules.items() for slug in problems]
+        if not rows:
+            return progress
+        
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Get basic submission counts
             cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_submissions,
-                    SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as successful_submissions,
-                    SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed_submissions,
-                    SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END) as error_submissions,
-                    COUNT(DISTINCT problem_slug) as unique_problems_attempted,
-                    COUNT(DISTINCT language) as unique_languages
-                FROM submissions
+                CREATE TEMP TABLE IF NOT EXISTS module_problems (
+                    module TEXT NOT NULL,
+                    problem_slug TEXT NOT NULL
+                )
             """)
-            
-            stats = dict(cursor.fetchone())
-            
-            # Get unique problems solved
+            cursor.execute("DELETE FROM temp.module_problems")
+            cursor.executemany("INSERT INTO temp.module_problems (module, problem_slug) VALUES (?, ?)", rows)
             cursor.execute("""
-                SELECT COUNT(*) as unique_problems_solved
-                FROM problem_status
-                WHERE status = 'success'
+                SELECT 
+                    m.module,
+                    SUM(CASE WHEN p.status = 'success' THEN 1 ELSE 0 END) as solved,
+                    SUM(CASE WHEN p.status = 'failed' THEN 1 ELSE 0 END) as failed,
+                    SUM(CASE WHEN p.status = 'error' THEN 1 ELSE 0 END) as error,
+                    COUNT(p.problem_slug) as attempted
+                FROM temp.module_problems m
+                LEFT JOIN problem_status p ON p.problem_slug = m.problem_slug
+                GROUP BY m.module
             """)
+            for row in cursor.fetchall():
+                progress[row['module']].update(solved=row['solved'], failed=row['failed'],
+                                               error=row['error'], attempted=row['attempted'])
+            cursor.execute("DELETE FROM temp.module_problems")
+            conn.commit()
+        
+        return progress
+    
+    def get_submission_stats(self) -> Dict:
+        """
+        Get overall submission statistics.
+        
+        Counts come from the rollup tables, so this does not scan the
+        submissions.
+        
+        Returns:
+            Dictionary with submission statistics
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
             
-            stats['unique_problems_solved'] = cursor.fetchone()['unique_problems_solved']
+            cursor.execute("SELECT dimension, value, count FROM submission_totals ORDER BY dimension, value")
+            totals = {"status": {}, "language": {}}
+            for row in cursor.fetchall():
+                totals[row['dimension']][row['value']] = row['count']
             
-            # Get languages used
             cursor.execute("""
-                SELECT DISTINCT language
-                FROM submissions
-                ORDER BY language
+                SELECT 
+                    COUNT(*) as unique_problems_attempted,
+                    SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as unique_problems_solved
+                FROM problem_status
             """)
+            problems = cursor.fetchone()
             
-            languages = [row['language'] for row in cursor.fetchall()]
-            stats['languages_used'] = languages
-            
-            return stats
+            status_counts = totals["status"]
+            return {
+                'total_submissions': sum(status_counts.values()),
+                'successful_submissions': status_counts.get('success', 0),
+                'failed_submissions': status_counts.get('failed', 0),
+                'error_submissions': status_counts.get('error', 0),
+                'unique_problems_attempted': problems['unique_problems_attempted'],
+                'unique_languages': len(totals["language"]),
+                'unique_problems_solved': problems['unique_problems_solved'] or 0,
+                'languages_used': list(totals["language"])
+            }
+    
+    def get_daily_activity(self, days: int = 365) -> Dict:
+        """
+        Get submission counts per day and the activity streaks.
+        
+        Args:
+            days: Number of days, up to and including today, to list
+        
+        Returns:
+            Dictionary with "days" (list of {"day", "submissions",
+            "successful"} for days with submissions, oldest first),
+            "current_streak" (consecutive days with submissions, ending today
+            or yesterday) and "longest_streak"
+        """
+        today = date.today()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT day, submissions, successful FROM daily_activity ORDER BY day")
+            rows = [dict(row) for row in cursor.fetchall()]
+        
+        longest = 0
+        streak = 0
+        previous = None
+        for row in rows:
+            day = date.fromisoformat(row['day'])
+            streak = streak + 1 if previous is not None and (day - previous).days == 1 else 1
+            longest = max(longest, streak)
+            previous = day
+        current = streak if previous is not None and (today - previous).days <= 1 else 0
+        
+        first_day = (today - timedelta(days=days - 1)).isoformat()
+        return {
+            'days': [row for row in rows if row['day'] >= first_day],
+            'current_streak': current,
+            'longest_streak': longest
+        }
     
-    def get_recent_submissions(self, limit: int = 10) -> List[Dict]:
+    def get_recent_submissions(self, limit: int = 10, before: Optional[Dict] = None,
+                               language: Optional[str] = None, status: Optional[str] = None,
+                               fields: Optional[List[str]] = None) -> List[Dict]:
         """
         Get recent submissions across all problems.
         
         Args:
             limit: Maximum number of submissions to return
+            before: {"timestamp", "id"} of the last submission already
+                listed; only older submissions are returned
+            language: Only submissions in this language
+            status: Only submissions with this status
+            fields: Fields to return (default: id, problem_slug, language,
+                status, timestamp and datetime)
         
         Returns:
             List of recent submissions, sorted by timestamp (newest first)
         """
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, problem_slug, language, status, timestamp, datetime
-                FROM submissions 
-                ORDER BY timestamp DESC
-                LIMIT ?
-            """, (limit,))
-            
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+        if fields is None:
+            fields = ["id", "problem_slug", "language", "status", "timestamp", "datetime"]
+        return self._list_submissions({"language": language, "status": status}, fields, limit, before)
     
     def backup_to_json(self, backup_path: str):
         """
@@ -290,10 +931,11 @@ class SubmissionDB:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT id, problem_slug, language, code, status, timestamp, datetime, 
-                       test_results, error_message
-                FROM submissions 
-                ORDER BY timestamp
+                SELECT s.id, s.problem_slug, s.language, b.code, s.status, s.timestamp, s.datetime, 
+                       s.test_results, s.error_message, s.cached_from
+                FROM submissions s
+                JOIN code_blobs b ON b.hash = s.code_hash
+                ORDER BY s.timestamp
             """)
             
             rows = cursor.fetchall()
@@ -301,6 +943,7 @@ class SubmissionDB:
             
             for row in rows:
                 submission = dict(row)
+                submission['code'] = decompress_code(submission['code'])
                 # Parse test_results JSON if present
                 if submission['test_results']:
                     submission['test_results'] = json.loads(submission['test_results'])
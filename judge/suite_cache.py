@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+from config import TEST_SUITE_CACHE_MAX_BYTES
+
+
+def suite_size(test_cases):
+    """Bytes a test suite accounts for: the length of every input and expected output"""
+    total = 0
+    for test_case in test_cases:
+        input_data = test_case['input']
+        total += input_data.length if hasattr(input_data, "length") else len(input_data)
+        total += len(test_case['expectedOutput'])
+    return total
+
+
+class SuiteCache:
+    """
+    In-memory LRU cache of loaded test suites.
+
+    Keys identify a problem and the version of its manifest, so a changed
+    problem is simply a miss. The cache is bounded by the total size of the
+    suites it holds rather than by their number; a suite larger than the
+    whole budget is not cached.
+    """
+
+    def __init__(self, max_bytes: int = TEST_SUITE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached test cases for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, test_cases):
+        """Cache a suite, evicting the least recently used ones to stay in budget"""
+        size = suite_size(test_cases)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old[1]
+            self._entries[key] = (test_cases, size)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and current memory use"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes
+            }
@@ -1,8 +1,29 @@
 import os
 import json
-import urllib.request
-import hashlib
-from config import TEST_CASES_CACHE_DIR, TEST_CASES_SERVER_URL
+import re
+import tempfile
+import threading
+import time
+from config import TEST_CASES_CACHE_DIR, TEST_CASES_SERVER_URL, MANIFEST_TTL, LOCAL_DATABASE_DIR
+from http_pool import get_connection_pool, download_pool, DownloadError
+from suite_cache import SuiteCache
+from test_case_store import PackedTestCases, PackError, write_pack
+
+# Loaded test suites, so resubmitting a problem does not load its tests again
+suite_cache = SuiteCache()
+
+# Manifests already read from disk, by file path: cached manifest entries,
+# and local mirror manifests with the (mtime, size) they were read at
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+# Problem, course and module slugs; they become paths in the database
+# ("+" appears in module slugs such as java-for-c++-coders)
+SLUG_PATTERN = re.compile(r"[A-Za-z0-9_+-]+")
+
+# Modules and problems of each course, by course slug, with the time they were read
+_course_modules = {}
+_course_modules_lock = threading.Lock()
 
 
 def test_case_file_path(problem_slug, filename):
@@ -15,160 +36,401 @@ def test_case_file_path(problem_slug, filename):
     return os.path.join(TEST_CASES_CACHE_DIR, f"{safe_slug}__{filename}")
 
 
-def fetch_and_cache_test_case_file(problem_slug, filename):
-    """Fetch and cache a single test case file (input or output)"""
-    file_path = test_case_file_path(problem_slug, filename)
+def write_cache_file(file_path, data):
+    """Write a cache file through a temporary file and a rename, so readers never see a partial file"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def manifest_file_path(problem_slug):
+    """Generate file path for the cached problem manifest"""
+    return test_case_file_path(problem_slug, "manifest.json")
+
+
+def read_cached_manifest(problem_slug):
+    """Cached manifest entry: the problem JSON plus its validators and fetch time"""
+    file_path = manifest_file_path(problem_slug)
+    with _manifests_lock:
+        if file_path in _manifests:
+            return _manifests[file_path]
+    try:
+        with open(file_path, 'r') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _manifests_lock:
+        _manifests[file_path] = entry
+    return entry
+
+
+def write_cached_manifest(problem_slug, entry):
+    """Store a manifest entry, replacing the old one in a single rename"""
+    file_path = manifest_file_path(problem_slug)
+    write_cache_file(file_path, json.dumps(entry))
+    with _manifests_lock:
+        _manifests[file_path] = entry
+
+
+def read_local_manifest(file_path):
+    """A manifest from the local mirror, parsed again only when the file changes"""
+    stat = os.stat(file_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _manifests_lock:
+        cached = _manifests.get(file_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with open(file_path, 'r') as f:
+        problem_data = json.load(f)
+    with _manifests_lock:
+        _manifests[file_path] = (version, problem_data)
+    return problem_data
+
+
+def remove_loose_test_case_files(problem_slug, problem_data):
+    """Drop the loose test case files older versions of the judge cached for a manifest"""
+    for test_case in problem_data.get('testCases') or []:
+        for filename in (test_case['input'], test_case['output']):
+            try:
+                os.remove(test_case_file_path(problem_slug, filename))
+            except OSError:
+                pass
+
+
+def remove_cached_test_case_files(problem_slug, problem_data):
+    """Drop the cached test cases of an outdated manifest"""
+    remove_loose_test_case_files(problem_slug, problem_data)
+    try:
+        os.remove(pack_file_path(problem_slug))
+    except OSError:
+        pass
+
+
+def check_slug(slug):
+    """Raise ValueError for a slug that could name a path outside its directory"""
+    if not isinstance(slug, str) or not SLUG_PATTERN.fullmatch(slug):
+        raise ValueError(f"Invalid slug: {slug!r}")
+
+
+def local_database_file(path):
+    """Path of a database file in the local mirror, or None if it is not there (or outside it)"""
+    if not LOCAL_DATABASE_DIR:
+        return None
+    root = os.path.realpath(LOCAL_DATABASE_DIR)
+    file_path = os.path.realpath(os.path.join(root, *path.split("/")))
+    if os.path.commonpath([root, file_path]) != root:
+        return None
+    return file_path if os.path.isfile(file_path) else None
+
+
+def local_source_stamp(problem_slug, problem_data):
+    """
+    Modification times and sizes of a problem's files in the local mirror.
+
+    Stored in packs built from the mirror, so editing a test file there is
+    picked up by the next submission. None when the problem is not in the
+    mirror.
+    """
+    manifest_path = local_database_file(f"problems/{problem_slug}.json")
+    if manifest_path is None:
+        return None
+    stamp = []
+    for file_path in [manifest_path] + [
+            os.path.join(LOCAL_DATABASE_DIR, "testcases", problem_slug, filename)
+            for filename in problem_test_case_files(problem_data)]:
+        try:
+            stat = os.stat(file_path)
+            stamp.append([stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+
+def get_problem_manifest(problem_slug):
+    """
+    Get the problem JSON listing the test case files.
+
+    Problems in the local mirror are read from it directly. Otherwise the
+    manifest is cached locally and used without any request for
+    MANIFEST_TTL seconds. After that it is revalidated with its ETag and
+    Last-Modified; if the server cannot be reached, the cached copy keeps
+    being used.
+    """
+    check_slug(problem_slug)
+    local_path = local_database_file(f"problems/{problem_slug}.json")
+    if local_path is not None:
+        return read_local_manifest(local_path)
     
-    # If file already exists, return the path
-    if os.path.exists(file_path):
-        return file_path
+    cached = read_cached_manifest(problem_slug)
+    if cached and time.time() - cached['fetchedAt'] < MANIFEST_TTL:
+        return cached['problem']
     
+    headers = {}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached.get('lastModified'):
+        headers['If-Modified-Since'] = cached['lastModified']
     try:
-        # Fetch the file from server
-        url = f"{TEST_CASES_SERVER_URL}/database/testcases/{problem_slug}/{filename}"
-        with urllib.request.urlopen(url) as response:
-            data = response.read().decode().strip()
-        
-        # Save to cache
-        with open(file_path, 'w') as f:
-            f.write(data)
+        status, response_headers, body = get_connection_pool(TEST_CASES_SERVER_URL).request(
+            f"/database/problems/{problem_slug}.json", headers)
+        if status == 304 and cached:
+            cached['fetchedAt'] = time.time()
+            write_cached_manifest(problem_slug, cached)
+            return cached['problem']
+        if status != 200:
+            raise DownloadError(f"HTTP {status}")
+        problem_data = json.loads(body.decode())
+    except DownloadError as e:
+        if cached:
+            print(f"Problem manifest for {problem_slug} unavailable ({e}), using cached copy")
+            return cached['problem']
+        raise
+    
+    if cached and cached['problem'] != problem_data:
+        # The problem changed, so its cached test files may be outdated too
+        remove_cached_test_case_files(problem_slug, cached['problem'])
+    write_cached_manifest(problem_slug, {
+        'problem': problem_data,
+        'etag': response_headers.get('ETag'),
+        'lastModified': response_headers.get('Last-Modified'),
+        'fetchedAt': time.time()
+    })
+    return problem_data
+
+
+def pack_file_path(problem_slug):
+    """Generate file path for the packed test cases of a problem"""
+    return test_case_file_path(problem_slug, "tests.pack")
+
+
+def fetch_test_case_file(problem_slug, filename):
+    """Fetch a single test case file (input or output), returns its stripped contents as bytes"""
+    # A loose file cached by an older judge is used instead of downloading it again
+    file_path = test_case_file_path(problem_slug, filename)
+    local_path = local_database_file(f"testcases/{problem_slug}/{filename}")
+    try:
+        if local_path is not None:
+            with open(local_path, 'r') as f:
+                return f.read().strip().encode()
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as f:
+                return f.read().strip().encode()
         
-        print(f"Cached test case file: {filename} for problem {problem_slug}")
-        return file_path
+        # Fetch the file from server over a pooled keep-alive connection
+        status, _, body = get_connection_pool(TEST_CASES_SERVER_URL).request(
+            f"/database/testcases/{problem_slug}/{filename}")
+        if status != 200:
+            raise DownloadError(f"HTTP {status}")
+        return body.decode().strip().encode()
     except Exception as e:
         print(f"Error fetching test case file {filename} for {problem_slug}: {e}")
         return None
 
 
-def load_test_case_file(problem_slug, filename):
-    """Load a test case file, fetching if not cached"""
-    file_path = test_case_file_path(problem_slug, filename)
-    
-    # If file doesn't exist, try to fetch it
-    if not os.path.exists(file_path):
-        file_path = fetch_and_cache_test_case_file(problem_slug, filename)
-        if not file_path:
-            return None
-    
+def fetch_test_case_files(problem_slug, filenames):
+    """Fetch several test case files concurrently, returns their contents (None on failure)"""
+    return list(download_pool.map(lambda filename: fetch_test_case_file(problem_slug, filename), filenames))
+
+
+def problem_test_case_files(problem_data):
+    """Input and output file names of every test case in a manifest"""
+    return [filename for test_case in problem_data['testCases'] for filename in (test_case['input'], test_case['output'])]
+
+
+def open_cached_pack(problem_slug, problem_data):
+    """The problem's pack if it was built from this manifest, else None"""
     try:
-        with open(file_path, 'r') as f:
-            return f.read().strip()
-    except Exception as e:
-        print(f"Error reading test case file {file_path}: {e}")
+        pack = PackedTestCases(pack_file_path(problem_slug), TEST_CASES_CACHE_DIR)
+    except PackError:
         return None
+    if pack.test_case_files != problem_data['testCases'] or pack.source != local_source_stamp(problem_slug, problem_data):
+        pack.close()
+        return None
+    return pack
+
+
+def pack_test_cases(problem_slug, problem_data):
+    """
+    Download every test case file of a problem and pack them.
+
+    Returns (tests, packed) where tests are (input, expected output) byte
+    pairs. Test cases whose files could not be fetched are skipped, and
+    then nothing is packed so they are tried again next time.
+    """
+    # Stamp the local files before reading them, so a change made meanwhile causes a rebuild
+    source = local_source_stamp(problem_slug, problem_data)
+    contents = fetch_test_case_files(problem_slug, problem_test_case_files(problem_data))
+    tests = []
+    for number, test_case in enumerate(problem_data['testCases']):
+        input_data, output_data = contents[2 * number], contents[2 * number + 1]
+        if input_data is None:
+            print(f"Failed to load input file: {test_case['input']}")
+            continue
+        if output_data is None:
+            print(f"Failed to load output file: {test_case['output']}")
+            continue
+        tests.append((input_data, output_data))
+    
+    packed = len(tests) == len(problem_data['testCases'])
+    if packed:
+        write_pack(pack_file_path(problem_slug), problem_data['testCases'], tests, TEST_CASES_CACHE_DIR, source)
+        # Loose files are no longer needed once their contents are packed
+        remove_loose_test_case_files(problem_slug, problem_data)
+        print(f"Packed {len(tests)} test cases for problem {problem_slug}")
+    return tests, packed
 
 
 def get_cached_test_cases(problem_slug):
     """Get test cases from cache if available"""
     try:
-        # Fetch problem details to get test case file names
-        problem_url = f"{TEST_CASES_SERVER_URL}/database/problems/{problem_slug}.json"
-        with urllib.request.urlopen(problem_url) as response:
-            problem_data = json.loads(response.read().decode())
+        # Get test case file names from the problem manifest
+        problem_data = get_problem_manifest(problem_slug)
         
         if not problem_data.get('testCases'):
             return None
         
-        # Check if all test case files are cached
-        all_cached = True
-        for test_case in problem_data['testCases']:
-            input_path = test_case_file_path(problem_slug, test_case['input'])
-            output_path = test_case_file_path(problem_slug, test_case['output'])
-            if not os.path.exists(input_path) or not os.path.exists(output_path):
-                all_cached = False
-                break
-        
-        if all_cached:
-            # Load test cases from individual files
-            test_cases = []
-            for test_case in problem_data['testCases']:
-                input_data = load_test_case_file(problem_slug, test_case['input'])
-                output_data = load_test_case_file(problem_slug, test_case['output'])
-                if input_data is not None and output_data is not None:
-                    test_cases.append({
-                        'input': input_data,
-                        'expectedOutput': output_data
-                    })
-            return test_cases if test_cases else None
-        
-        return None
+        pack = open_cached_pack(problem_slug, problem_data)
+        if pack is None:
+            return None
+        # Inputs are read from the mapped pack when they run, so it is left open
+        test_cases = pack.test_cases()
+        return test_cases if test_cases else None
     except Exception as e:
         print(f"Error checking cached test cases for {problem_slug}: {e}")
         return None
 
 
+def suite_cache_key(problem_slug, problem_data):
+    """Identifies a version of a problem's tests: its pack, manifest and local files"""
+    return (pack_file_path(problem_slug), json.dumps(problem_data['testCases'], sort_keys=True),
+            json.dumps(local_source_stamp(problem_slug, problem_data)))
+
+
 def fetch_test_cases(problem_slug):
-    """Fetch test cases for a problem from the server, storing each file individually"""
-    # First try to get from individual file cache
-    cached_test_cases = get_cached_test_cases(problem_slug)
-    if cached_test_cases is not None:
-        print(f"Using cached test case files for {problem_slug}")
-        return cached_test_cases
-    
+    """
+    Fetch test cases for a problem, serving them from its pack once downloaded.
+
+    Complete suites are kept in suite_cache, so fetching the same version
+    of a problem again does not read its pack.
+    """
     try:
-        # Fetch problem details to get test case file names
-        problem_url = f"{TEST_CASES_SERVER_URL}/database/problems/{problem_slug}.json"
-        with urllib.request.urlopen(problem_url) as response:
-            problem_data = json.loads(response.read().decode())
+        # Get test case file names from the problem manifest
+        problem_data = get_problem_manifest(problem_slug)
         
         if not problem_data.get('testCases'):
             return []
         
-        test_cases = []
-        for test_case in problem_data['testCases']:
-            try:
-                # Fetch and cache input file
-                input_data = load_test_case_file(problem_slug, test_case['input'])
-                if input_data is None:
-                    print(f"Failed to load input file: {test_case['input']}")
-                    continue
-                
-                # Fetch and cache output file
-                output_data = load_test_case_file(problem_slug, test_case['output'])
-                if output_data is None:
-                    print(f"Failed to load output file: {test_case['output']}")
-                    continue
-                
-                test_cases.append({
-                    'input': input_data,
-                    'expectedOutput': output_data
-                })
-            except Exception as e:
-                print(f"Error processing test case for {problem_slug}: {e}")
-                continue
+        key = suite_cache_key(problem_slug, problem_data)
+        test_cases = suite_cache.get(key)
+        if test_cases is not None:
+            return list(test_cases)
         
-        print(f"Loaded {len(test_cases)} test cases for {problem_slug} from individual files")
-        return test_cases
+        # Inputs are read from the mapped pack when they run, so it is left open
+        pack = open_cached_pack(problem_slug, problem_data)
+        if pack is not None:
+            print(f"Using cached test cases for {problem_slug}")
+        else:
+            tests, packed = pack_test_cases(problem_slug, problem_data)
+            pack = open_cached_pack(problem_slug, problem_data) if packed else None
+            if pack is None:
+                # Some files could not be fetched; don't keep the incomplete suite
+                test_cases = [{'input': input_data.decode(), 'expectedOutput': output_data.decode()}
+                              for input_data, output_data in tests]
+                print(f"Loaded {len(test_cases)} test cases for {problem_slug}")
+                return test_cases
+        test_cases = pack.test_cases()
+        suite_cache.put(key, test_cases)
+        print(f"Loaded {len(test_cases)} test cases for {problem_slug}")
+        return list(test_cases)
     except Exception as e:
         print(f"Error fetching test cases for {problem_slug}: {e}")
         return []
 
 
 def fetch_and_cache_all_test_case_files(problem_slug):
-    """Fetch and cache all test case files for a problem"""
+    """Fetch and pack all test case files for a problem, returns the cached file paths"""
     try:
-        # Fetch problem details to get test case file names
-        problem_url = f"{TEST_CASES_SERVER_URL}/database/problems/{problem_slug}.json"
-        with urllib.request.urlopen(problem_url) as response:
-            problem_data = json.loads(response.read().decode())
+        # Get test case file names from the problem manifest
+        problem_data = get_problem_manifest(problem_slug)
         
         if not problem_data.get('testCases'):
             return []
         
-        cached_files = []
-        for test_case in problem_data['testCases']:
-            # Cache input file
-            input_path = fetch_and_cache_test_case_file(problem_slug, test_case['input'])
-            if input_path:
-                cached_files.append(input_path)
-            
-            # Cache output file
-            output_path = fetch_and_cache_test_case_file(problem_slug, test_case['output'])
-            if output_path:
-                cached_files.append(output_path)
+        pack = open_cached_pack(problem_slug, problem_data)
+        if pack is not None:
+            pack.close()
+            return [pack_file_path(problem_slug)]
         
-        print(f"Cached {len(cached_files)} test case files for {problem_slug}")
-        return cached_files
+        _, packed = pack_test_cases(problem_slug, problem_data)
+        return [pack_file_path(problem_slug)] if packed else []
     except Exception as e:
         print(f"Error caching all test case files for {problem_slug}: {e}")
         return []
+
+
+class DatabaseFileNotFound(DownloadError):
+    """Raised when the database has no file at a path"""
+
+
+def fetch_database_json(path):
+    """Fetch a JSON file from the database, from the local mirror when it has it"""
+    local_path = local_database_file(path)
+    if local_path is not None:
+        with open(local_path, 'r') as f:
+            return json.load(f)
+    status, _, body = get_connection_pool(TEST_CASES_SERVER_URL).request(f"/database/{path}")
+    if status == 404:
+        raise DatabaseFileNotFound(f"No such database file: {path}")
+    if status != 200:
+        raise DownloadError(f"HTTP {status} for {path}")
+    return json.loads(body.decode())
+
+
+def course_modules(course_slug):
+    """
+    Modules of a course in course order, each {"slug", "name", "problems"}
+    with the slugs of its code problems.
+
+    The index is kept in memory and reread after MANIFEST_TTL seconds. A
+    module whose file the database does not have (yet) has no problems.
+    """
+    check_slug(course_slug)
+    with _course_modules_lock:
+        cached = _course_modules.get(course_slug)
+    if cached and time.time() - cached[0] < MANIFEST_TTL:
+        return cached[1]
+    course = fetch_database_json(f"courses/{course_slug}/meta.json")
+    topics = [topic for category in course.get('categorys', []) for topic in category.get('topics', [])]
+    def fetch_module_items(topic):
+        check_slug(topic['slug'])
+        try:
+            return fetch_database_json(f"courses/{course_slug}/{topic['slug']}.json")
+        except DatabaseFileNotFound:
+            return []
+
+    module_items = download_pool.map(fetch_module_items, topics)
+    modules = []
+    for topic, items in zip(topics, module_items):
+        problems = []
+        for item in items:
+            if item.get('type') == 'Code' and item['slug'] not in problems:
+                problems.append(item['slug'])
+        modules.append({"slug": topic['slug'], "name": topic.get('name', topic['slug']), "problems": problems})
+    with _course_modules_lock:
+        _course_modules[course_slug] = (time.time(), modules)
+    return modules
+
+
+def course_problem_slugs(course_slug):
+    """Slugs of the code problems in a course, in course order"""
+    slugs = []
+    for module in course_modules(course_slug):
+        for slug in module['problems']:
+            if slug not in slugs:
+                slugs.append(slug)
+    return slugs
@@ -0,0 +1,212 @@
+"""
+Packed on-disk store of test cases, one file per problem.
+
+A pack holds an index followed by the input and expected output blobs of
+every test case, already stripped, and is read through mmap. Identical
+blobs are stored once: within a pack by content hash, and across problems
+by keeping large blobs in a shared content-addressed directory that packs
+refer to.
+
+Pack layout:
+
+    PACK_MAGIC
+    8-byte big-endian length of the index
+    index (JSON): {"testCases": [manifest entries], "source": stamp of local files or null,
+                   "tests": [[input hash, output hash], ...],
+                   "blobs": {hash: {"offset": n, "length": n} | {"shared": true, "length": n}}}
+    blob data, offsets relative to its start
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from config import TEST_CASES_CACHE_DIR, PACK_SHARED_BLOB_MIN
+
+PACK_MAGIC = b"PJPACK1\n"
+_HEADER = struct.Struct(">Q")
+
+
+class PackError(Exception):
+    """Raised when a pack file is missing, truncated or not a pack"""
+
+
+def blob_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomically(file_path, chunks):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _map_file(file_path):
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PackedTestCases:
+    """Read-only, memory-mapped view of a problem's pack"""
+
+    def __init__(self, pack_path, cache_dir=TEST_CASES_CACHE_DIR):
+        self.pack_path = pack_path
+        self.shared_dir = os.path.join(cache_dir, "blobs")
+        try:
+            self._map = _map_file(pack_path)
+            if self._map[:len(PACK_MAGIC)] != PACK_MAGIC:
+                raise PackError(f"Not a test case pack: {pack_path}")
+            index_start = len(PACK_MAGIC) + _HEADER.size
+            (index_length,) = _HEADER.unpack(self._map[len(PACK_MAGIC):index_start])
+            self.index = json.loads(self._map[index_start:index_start + index_length])
+        except (OSError, ValueError, struct.error) as e:
+            raise PackError(f"Unreadable test case pack {pack_path}: {e}")
+        self.data_start = index_start + index_length
+        self._shared = {}
+
+    @property
+    def test_case_files(self):
+        """Manifest entries the pack was built from"""
+        return self.index["testCases"]
+
+    @property
+    def source(self):
+        """Stamp of the local files the pack was built from, if any"""
+        return self.index.get("source")
+
+    def __len__(self):
+        return len(self.index["tests"])
+
+    def blob(self, digest):
+        """The blob's bytes as a memoryview of the mapped file"""
+        entry = self.index["blobs"][digest]
+        if entry.get("shared"):
+            if digest not in self._shared:
+                try:
+                    self._shared[digest] = _map_file(os.path.join(self.shared_dir, digest))
+                except OSError as e:
+                    raise PackError(f"Missing shared blob {digest}: {e}")
+            data = memoryview(self._shared[digest])
+        else:
+            start = self.data_start + entry["offset"]
+            data = memoryview(self._map)[start:start + entry["length"]]
+        if len(data) != entry["length"]:
+            raise PackError(f"Truncated blob {digest} in {self.pack_path}")
+        return data
+
+    def test_case(self, number):
+        """Test case as the dict the judge runs; the input stays in the pack"""
+        input_hash, output_hash = self.index["tests"][number]
+        return {
+            'input': PackedInput(self, input_hash),
+            'expectedOutput': str(self.blob(output_hash), 'utf-8')
+        }
+
+    def test_cases(self):
+        return [self.test_case(number) for number in range(len(self))]
+
+    def close(self):
+        # Views handed out keep their mapping alive until they are released
+        for mapped in [self._map, *self._shared.values()]:
+            try:
+                mapped.close()
+            except (AttributeError, BufferError):
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PackedInput:
+    """
+    A test input read from its pack for each run rather than held in memory.
+
+    Runs get it as a file: shared blobs are whole files and are opened
+    directly, smaller blobs are written from the mapped pack into a
+    temporary file. The input keeps its pack mapped, so it stays valid even
+    if the pack file is replaced meanwhile.
+    """
+
+    def __init__(self, pack, digest):
+        self.pack = pack
+        self.digest = digest
+        self.length = pack.index["blobs"][digest]["length"]
+
+    @property
+    def shared_path(self):
+        """Path of the shared blob holding the input, or None if it is stored in the pack"""
+        if self.pack.index["blobs"][self.digest].get("shared"):
+            return os.path.join(self.pack.shared_dir, self.digest)
+        return None
+
+    def open(self):
+        """A binary file positioned at the start of the input, for use as stdin"""
+        if self.shared_path is not None:
+            try:
+                return open(self.shared_path, 'rb')
+            except OSError as e:
+                raise PackError(f"Missing shared blob {self.digest}: {e}")
+        stdin_file = tempfile.TemporaryFile()
+        stdin_file.write(self.pack.blob(self.digest))
+        stdin_file.seek(0)
+        return stdin_file
+
+    def read(self):
+        """The whole input as bytes"""
+        return bytes(self.pack.blob(self.digest))
+
+    def preview(self, limit):
+        """The input as text, cut after limit bytes"""
+        text = str(self.pack.blob(self.digest)[:limit], 'utf-8', 'replace')
+        if self.length > limit:
+            text += "\n... (input truncated)"
+        return text
+
+
+def write_pack(pack_path, test_case_files, tests, cache_dir=TEST_CASES_CACHE_DIR, source=None):
+    """
+    Write a pack from (input bytes, expected output bytes) pairs.
+
+    source is any JSON value identifying the local files the tests were
+    read from, so readers can tell when the pack is outdated.
+
+    Blobs of PACK_SHARED_BLOB_MIN bytes or more are stored once in the
+    shared blob directory instead of in the pack.
+    """
+    blobs = {}
+    data = []
+    offset = 0
+    index_tests = []
+    shared_dir = os.path.join(cache_dir, "blobs")
+    for test in tests:
+        digests = []
+        for content in test:
+            digest = blob_hash(content)
+            digests.append(digest)
+            if digest in blobs:
+                continue
+            if len(content) >= PACK_SHARED_BLOB_MIN:
+                os.makedirs(shared_dir, exist_ok=True)
+                shared_path = os.path.join(shared_dir, digest)
+                if not os.path.exists(shared_path):
+                    _write_atomically(shared_path, [content])
+                blobs[digest] = {"shared": True, "length": len(content)}
+            else:
+                blobs[digest] = {"offset": offset, "length": len(content)}
+                data.append(content)
+                offset += len(content)
+        index_tests.append(digests)
+    index = json.dumps({"testCases": test_case_files, "source": source, "tests": index_tests, "blobs": blobs}).encode()
+    _write_atomically(pack_path, [PACK_MAGIC, _HEADER.pack(len(index)), index, *data])
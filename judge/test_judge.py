@@ -0,0 +1,1056 @@
+#!/usr/bin/env python3
+"""
+Test script for code execution and judging.
+This script runs small programs through the executor and the judge loop.
+"""
+
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import json
+import tempfile
+import threading
+import time
+import http.server
+import code_executor
+import java_worker
+import judge
+import sandbox
+import test_case_manager
+from compile_cache import CompileCache
+from code_executor import CompiledProgram, compile_code, execute_code, input_bytes, input_path
+from judge import compare_outputs, execute_test_cases, run_test_cases, run_test_case
+from java_worker import JavaWorkerPool
+from job_scheduler import JobScheduler
+from message_handler import MessageHandler
+from python_forkserver import forkserver_supported, start_python_forkserver, stop_python_forkserver
+from sandbox import RunLimits, limits_supported, spawn_limited
+from submission_db import SubmissionDB
+from suite_cache import SuiteCache
+from test_case_store import PackedTestCases, write_pack, PACK_SHARED_BLOB_MIN
+
+PYTHON_SUM = "a, b = map(int, input().split())\nprint(a + b)\n"
+
+CPP_SUM = """#include <iostream>
+int main() { long long a, b; std::cin >> a >> b; std::cout << a + b << std::endl; return 0; }
+"""
+
+
+@contextlib.contextmanager
+def temporary_compile_cache():
+    """Build through a compile cache in a temporary directory instead of the judge's own"""
+    saved = code_executor.compile_cache
+    with tempfile.TemporaryDirectory() as tempdir:
+        code_executor.compile_cache = CompileCache(tempdir)
+        try:
+            yield code_executor.compile_cache
+        finally:
+            code_executor.compile_cache = saved
+
+
+def test_compile_once_run_many():
+    """Test that a compiled program can be run against several inputs"""
+    print("🧪 Testing compile once, run many...")
+
+    with compile_code("python", PYTHON_SUM) as program:
+        assert program.run("1 2").stdout.strip() == "3"
+        assert program.run("40 2").stdout.strip() == "42"
+        workdir = program.workdir
+    assert not os.path.exists(workdir)
+    print("✅ Workspace reused across runs and cleaned up")
+
+    if shutil.which("g++"):
+        with temporary_compile_cache():
+            with compile_code("cpp", CPP_SUM) as program:
+                assert program.compile_error is None
+                assert program.run("5 7").stdout.strip() == "12"
+                assert program.run("-1 1").stdout.strip() == "0"
+            print("✅ C++ binary built once and run twice")
+
+            with compile_code("cpp", "int main( {") as program:
+                run = program.run("")
+                assert run.stdout == "" and run.stderr
+            print("✅ Compile errors reported on every run")
+
+
+def test_execute_test_cases():
+    """Test running custom test cases"""
+    print("\n🧪 Testing execute_test_cases...")
+
+    results = execute_test_cases("python", PYTHON_SUM, [
+        {"input": "1 1", "expectedOutput": "2"},
+        {"input": "2 2", "expectedOutput": "5"},
+        {"input": "3 3", "expectedOutput": ""},
+    ])
+    assert [r["passed"] for r in results] == [True, False, None]
+    assert [r["testCase"] for r in results] == [1, 2, 3]
+    assert execute_code("python", PYTHON_SUM, "3 4")[0].strip() == "7"
+    print("✅ Custom test cases executed")
+
+
+def test_compile_cache():
+    """Test the content-addressed compile cache"""
+    print("\n🧪 Testing compile cache...")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        cache = CompileCache(os.path.join(tempdir, "cache"), max_bytes=64)
+        key = cache.make_key("cpp", "int main() {}", "g++ 1.0", [])
+        assert key != cache.make_key("cpp", "int main() {}", "g++ 2.0", [])
+        assert key != cache.make_key("cpp", "int main() {}", "g++ 1.0", ["-O2"])
+
+        build_dir = os.path.join(tempdir, "build")
+        os.makedirs(build_dir)
+        with open(os.path.join(build_dir, "main.out"), "wb") as f:
+            f.write(b"x" * 40)
+
+        assert not cache.fetch(key, os.path.join(tempdir, "miss"))
+        cache.store(key, build_dir)
+        assert cache.fetch(key, os.path.join(tempdir, "hit"))
+        assert os.path.exists(os.path.join(tempdir, "hit", "main.out"))
+
+        # A second entry pushes the cache over budget and evicts the first
+        other_key = cache.make_key("cpp", "int main() { return 0; }", "g++ 1.0", [])
+        os.utime(os.path.join(cache.cache_dir, key), (0, 0))
+        cache.store(other_key, build_dir)
+        stats = cache.stats()
+        assert stats["entries"] == 1 and stats["hits"] == 1 and stats["misses"] == 1
+        assert not cache.fetch(key, os.path.join(tempdir, "evicted"))
+    print("✅ Cache hits, misses and LRU eviction work")
+
+    if shutil.which("g++"):
+        with temporary_compile_cache() as cache:
+            with compile_code("cpp", CPP_SUM):
+                pass
+            with compile_code("cpp", CPP_SUM) as program:
+                assert program.from_cache
+                assert program.run("2 3").stdout.strip() == "5"
+            assert cache.stats()["entries"] == 1
+        print("✅ Second C++ build served from cache")
+
+
+def test_parallel_fail_fast():
+    """Test that the lowest failing test case is reported and later runs are killed"""
+    print("\n🧪 Testing parallel fail-fast execution...")
+
+    sleeper = "import time\nn = int(input())\ntime.sleep(n)\nprint(n)\n"
+    test_cases = [
+        {"input": "0", "expectedOutput": "0"},
+        {"input": "1", "expectedOutput": "1"},
+        {"input": "0", "expectedOutput": "7"},
+        {"input": "4", "expectedOutput": "4"},
+        {"input": "0", "expectedOutput": "8"},
+    ]
+    start_time = time.time()
+    with compile_code("python", sleeper) as program:
+        results = run_test_cases(program, test_cases, always_compare=True, fail_fast=True)
+    elapsed = time.time() - start_time
+
+    assert [r["testCase"] for r in results] == [1, 2, 3]
+    assert results[-1]["passed"] is False
+    assert elapsed < 4, f"slow test case was not cancelled ({elapsed:.2f}s)"
+    print(f"✅ Failed at test case 3 in {elapsed:.2f} seconds")
+
+
+def test_python_forkserver():
+    """Test that forked Python runs behave like python3 subprocess runs"""
+    print("\n🧪 Testing Python fork server...")
+
+    if not forkserver_supported():
+        print("⏭ Fork server not supported on this platform")
+        return
+
+    programs = [
+        (PYTHON_SUM, "19 23"),
+        ("import sys\nprint('out')\nprint('err', file=sys.stderr)\nsys.exit(2)\n", ""),
+        ("x = []\nprint('before')\nprint(x[1])\n", ""),
+        ("def f(:\n    pass\n", ""),
+        ("import sys\nprint(__name__, sum(map(int, sys.stdin.read().split())))\n", "1 2 3\n4"),
+    ]
+    expected = []
+    for code, input_text in programs:
+        with compile_code("python", code) as program:
+            run = program.run(input_text)
+            expected.append((run.stdout, run.stderr))
+
+    start_python_forkserver()
+    try:
+        for (code, input_text), (stdout, stderr) in zip(programs, expected):
+            with compile_code("python", code) as program:
+                assert program.forkserver_id or program.compile_error
+                run = program.run(input_text)
+            assert run.stdout == stdout
+            assert run.stderr.splitlines()[-1:] == stderr.splitlines()[-1:]
+    finally:
+        stop_python_forkserver()
+    print("✅ Forked runs match subprocess runs")
+
+
+JAVA_PLUS_ONE = """import java.util.*;
+public class Main {
+    public static void main(String[] args) {
+        Scanner scn = new Scanner(System.in);
+        System.out.println(scn.nextInt() + 1);
+    }
+}
+"""
+
+
+def test_java_workers():
+    """Test compiling and running on warm JVM workers, and replacing workers that cannot go on"""
+    print("\n🧪 Testing warm Java workers...")
+
+    if shutil.which("javac") is None:
+        print("⏭ javac not found")
+        return
+
+    def write_source(directory, code):
+        os.makedirs(directory)
+        source = os.path.join(directory, "Main.java")
+        with open(source, "w") as f:
+            f.write(code)
+        return source
+
+    def write_input(directory, text):
+        input_path = os.path.join(directory, "input.txt")
+        with open(input_path, "w") as f:
+            f.write(text)
+        return input_path
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        pool = JavaWorkerPool(size=1, worker_dir=os.path.join(tempdir, "worker"))
+        pool.start()
+        try:
+            build = os.path.join(tempdir, "plus-one")
+            ok, diagnostics = pool.compile(["-d", build, write_source(build, JAVA_PLUS_ONE)])
+            assert ok, diagnostics
+            broken = os.path.join(tempdir, "broken")
+            ok, diagnostics = pool.compile(["-d", broken, write_source(broken, "public class Main { int x = ; }")])
+            assert not ok and "error" in diagnostics
+
+            stdout, stderr, exit_code, usage, exceeded = pool.run(build, write_input(tempdir, "41"), RunLimits(wall_time=5))
+            assert (stdout.strip(), exit_code, exceeded) == (b"42", 0, None), stderr
+            assert usage["wallTimeMs"] is not None
+
+            # A run past its time limit takes its worker down; a replacement serves the next run
+            looping = os.path.join(tempdir, "looping")
+            code = "public class Main { public static void main(String[] a) { while (true) {} } }"
+            assert pool.compile(["-d", looping, write_source(looping, code)])[0]
+            timed_out_worker = pool._workers[0]
+            assert pool.run(looping, write_input(tempdir, ""), RunLimits(wall_time=1))[4] == "time"
+            stdout, _, _, _, exceeded = pool.run(build, write_input(tempdir, "1"), RunLimits(wall_time=5))
+            assert (stdout.strip(), exceeded) == (b"2", None)
+            assert len(pool._workers) == 1 and pool._workers[0] is not timed_out_worker
+
+            # System.exit ends the worker's JVM, so the run falls back to plain java
+            saved_pool = java_worker._pool
+            java_worker._pool = pool
+            try:
+                code = ("public class Main { public static void main(String[] a) "
+                        "{ System.out.println(1); System.exit(3); } }")
+                with temporary_compile_cache(), compile_code("java", code) as program:
+                    run = program.run("")
+            finally:
+                java_worker._pool = saved_pool
+            assert (run.stdout.strip(), run.exit_code) == ("1", 3), run.stderr
+
+            # A failing test case cancels the queued runs without killing or replacing any worker
+            pids = [worker.process.pid for worker in pool._workers]
+            code = ("import java.util.*;\npublic class Main { public static void main(String[] a) throws Exception "
+                    "{ int n = new Scanner(System.in).nextInt(); if (n > 0) Thread.sleep(500); "
+                    "System.out.println(n + 1); } }")
+            test_cases = [{"input": "0", "expectedOutput": "0"}] + \
+                         [{"input": str(n), "expectedOutput": str(n + 1)} for n in range(1, 6)]
+            java_worker._pool = pool
+            try:
+                with temporary_compile_cache(), compile_code("java", code) as program:
+                    results = run_test_cases(program, test_cases, fail_fast=True)
+            finally:
+                java_worker._pool = saved_pool
+            assert [result["passed"] for result in results] == [False]
+            assert [worker.process.pid for worker in pool._workers] == pids
+            assert all(worker.alive() for worker in pool._workers)
+
+            # Runaway wrong output is checked as it streams in and aborts the run, keeping the worker
+            code = "public class Main { public static void main(String[] a) { for (int i = 0; ; i++) System.out.println(i); } }"
+            java_worker._pool = pool
+            try:
+                with temporary_compile_cache(), compile_code("java", code) as program:
+                    start_time = time.time()
+                    result = run_test_case(program, 1, {"input": "", "expectedOutput": "0\n1\n2"})
+            finally:
+                java_worker._pool = saved_pool
+            assert result["verdict"] == "WA" and time.time() - start_time < 2, result["verdict"]
+            assert [worker.process.pid for worker in pool._workers] == pids
+        finally:
+            pool.shutdown()
+    print("✅ Java workers compile, run, time out, fall back, skip cancelled runs and stream output")
+
+
+def test_java_worker_restart():
+    """Test that a worker that fails to restart is retried in the background, keeping the pool's size"""
+    print("\n🧪 Testing Java worker restarts...")
+
+    class FakeWorker:
+        starts = 0
+
+        def __init__(self, worker_dir):
+            FakeWorker.starts += 1
+            if FakeWorker.starts == 2:
+                raise OSError("java not found")
+            self.dead = False
+
+        def alive(self):
+            return not self.dead
+
+        def kill(self):
+            self.dead = True
+
+        def close(self):
+            self.dead = True
+
+    saved = (java_worker.JavaWorker, java_worker.RESTART_DELAY)
+    java_worker.JavaWorker = FakeWorker
+    java_worker.RESTART_DELAY = 0.01
+    pool = JavaWorkerPool(size=1)
+    pool._build_worker = lambda: None
+    pool._warm_up = lambda worker: time.sleep(0.2)
+    try:
+        pool.start()
+        worker = pool._acquire()
+        worker.kill()
+        start_time = time.time()
+        pool._release(worker)
+        assert time.time() - start_time < 0.1, "the replacement was started on the request path"
+        replacement = pool._acquire()
+        assert replacement.alive() and FakeWorker.starts == 3
+        assert pool._workers == [replacement]
+    finally:
+        pool.shutdown()
+        java_worker.JavaWorker, java_worker.RESTART_DELAY = saved
+    print("✅ Dead worker replaced in the background after a failed restart")
+
+
+def test_java_worker_cancel():
+    """Test that cancelled runs never reach a worker and leave the pool's workers running"""
+    print("\n🧪 Testing cancelled Java runs...")
+
+    class FakeWorker:
+        starts = 0
+
+        def __init__(self, worker_dir):
+            FakeWorker.starts += 1
+            self.runs = 0
+            self.dead = False
+
+        def alive(self):
+            return not self.dead
+
+        def kill(self):
+            self.dead = True
+
+        def close(self):
+            self.dead = True
+
+        def run(self, class_dir, input_path, limits, stdout_sink=None, cancel=None):
+            self.runs += 1
+            time.sleep(0.3)
+            return b"", b"", 0, {}, None
+
+    saved = java_worker.JavaWorker
+    java_worker.JavaWorker = FakeWorker
+    pool = JavaWorkerPool(size=1)
+    pool._build_worker = lambda: None
+    pool._warm_up = lambda worker: None
+    try:
+        pool.start()
+        worker = pool._workers[0]
+        tokens = [code_executor.CancelToken() for _ in range(4)]
+        errors = []
+
+        def run(token):
+            try:
+                pool.run("build", "input.txt", RunLimits(wall_time=1), cancel=token)
+            except java_worker.JavaWorkerError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=run, args=(token,)) for token in tokens]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        start_time = time.time()
+        for token in tokens:
+            token.cancel()
+        for thread in threads:
+            thread.join()
+        # The run in progress finishes, the queued ones stop waiting as soon as they are cancelled
+        assert time.time() - start_time < 0.5
+        assert worker.runs == 1 and errors == ["Run cancelled"] * 3
+        assert pool._workers == [worker] and worker.alive() and FakeWorker.starts == 1
+        assert pool._acquire() is worker
+    finally:
+        pool.shutdown()
+        java_worker.JavaWorker = saved
+    print("✅ Cancelled Java runs skipped without touching the workers")
+
+
+def test_resource_limits():
+    """Test TLE/MLE/OLE verdicts and usage accounting"""
+    print("\n🧪 Testing resource limits...")
+
+    limits = RunLimits(wall_time=1, cpu_time=1, memory_bytes=256 * 1024 * 1024,
+                       output_bytes=1024 * 1024, processes=4096)
+    programs = [
+        ("print(sum(range(1000)))\n", "AC"),
+        ("while True:\n    pass\n", "TLE"),
+        ("data = bytearray(2 * 1024 * 1024 * 1024)\nprint(len(data))\n", "MLE"),
+        ("while True:\n    print('spam' * 100)\n", "OLE"),
+        # Sleeping uses no CPU, and with its output closed the pipes no longer tell it is running
+        ("import os, time\nos.close(1)\nos.close(2)\ntime.sleep(8)\n", "TLE"),
+    ]
+
+    def check_verdicts():
+        for code, verdict in programs:
+            if verdict == "MLE" and not limits_supported():
+                continue
+            with compile_code("python", code) as program:
+                program.limits = limits
+                # Without an expected output, runaway output is only stopped by the output limit
+                expected_output = "" if verdict == "OLE" else "499500"
+                result = run_test_case(program, 1, {"input": "", "expectedOutput": expected_output})
+            assert result["verdict"] == verdict, (code, result["verdict"], result["stderr"][-200:])
+            assert result["usage"]["wallTimeMs"] is not None
+            assert result["usage"]["wallTimeMs"] < 3000, (code, result["usage"])
+
+    check_verdicts()
+    print("✅ Verdicts from python3 subprocess runs")
+    if forkserver_supported():
+        start_python_forkserver()
+        try:
+            check_verdicts()
+        finally:
+            stop_python_forkserver()
+        print("✅ Verdicts from fork server runs")
+
+
+def test_spawn_limited():
+    """Test that limits reach the program both through prlimit and through the exec wrapper"""
+    print("\n🧪 Testing limits on spawned programs...")
+
+    if not limits_supported():
+        print("⏭ rlimits not supported")
+        return
+
+    limits = RunLimits(wall_time=1, cpu_time=3, memory_bytes=512 * 1024 * 1024)
+    command = ["sh", "-c", "ulimit -t; ulimit -v"]
+    process = spawn_limited(command, limits, stdout=subprocess.PIPE)
+    assert process.communicate()[0].split() == [b"3", b"524288"]
+    wrapper = [sys.executable, "-S", sandbox.__file__, json.dumps(limits.to_dict())]
+    assert subprocess.run(wrapper + command, stdout=subprocess.PIPE).stdout.split() == [b"3", b"524288"]
+    print("✅ Limits applied without running Python in the forked child")
+
+
+def test_streaming_output_check():
+    """Test that wrong output stops a run early and the diff stays small"""
+    print("\n🧪 Testing streaming output comparison...")
+
+    assert compare_outputs(" 1  \r\n2\n\n", "1\n2") == (True, None)
+    expected = "\n".join(str(i) for i in range(1000))
+    passed, diff = compare_outputs(expected.replace("500", "x"), expected)
+    assert not passed and "-500" in diff and "+x" in diff and len(diff.splitlines()) < 15
+
+    runaway = "i = 0\nwhile True:\n    print(i)\n    i += 1\n"
+    start_time = time.time()
+    with compile_code("python", runaway) as program:
+        result = run_test_case(program, 1, {"input": "", "expectedOutput": "0\n1\n2"})
+    elapsed = time.time() - start_time
+    assert result["verdict"] == "WA", result["verdict"]
+    assert elapsed < 2, f"runaway output was not stopped ({elapsed:.2f}s)"
+    print(f"✅ Runaway output stopped with WA in {elapsed:.2f} seconds")
+
+
+def as_text(test_cases):
+    """Test cases with packed inputs read back as text"""
+    return [{"input": input_bytes(t["input"]).decode(), "expectedOutput": t["expectedOutput"]} for t in test_cases]
+
+
+def serve_directory(directory, handler_class=http.server.SimpleHTTPRequestHandler):
+    """Serve a directory over HTTP on a free port, returns the server"""
+    handler = lambda *args: handler_class(*args, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_manifest_cache():
+    """Test that problem manifests are cached, revalidated and used offline"""
+    print("\n🧪 Testing problem manifest cache...")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        site = os.path.join(tempdir, "site")
+        os.makedirs(os.path.join(site, "database", "problems"))
+        os.makedirs(os.path.join(site, "database", "testcases", "demo"))
+        with open(os.path.join(site, "database", "problems", "demo.json"), "w") as f:
+            json.dump({"slug": "demo", "testCases": [{"input": "in1.txt", "output": "out1.txt"}]}, f)
+        for filename, data in (("in1.txt", "1 2"), ("out1.txt", "3")):
+            with open(os.path.join(site, "database", "testcases", "demo", filename), "w") as f:
+                f.write(data)
+
+        server = serve_directory(site)
+        saved = (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+                 test_case_manager.MANIFEST_TTL, test_case_manager.LOCAL_DATABASE_DIR)
+        test_case_manager.LOCAL_DATABASE_DIR = None
+        test_case_manager.TEST_CASES_SERVER_URL = f"http://127.0.0.1:{server.server_address[1]}"
+        test_case_manager.TEST_CASES_CACHE_DIR = os.path.join(tempdir, "cache")
+        try:
+            assert as_text(test_case_manager.fetch_test_cases("demo")) == [{"input": "1 2", "expectedOutput": "3"}]
+            fetched_at = test_case_manager.read_cached_manifest("demo")["fetchedAt"]
+
+            # Within the TTL nothing is requested, even with the server gone
+            server.shutdown()
+            server.server_close()
+            assert as_text(test_case_manager.fetch_test_cases("demo")) == [{"input": "1 2", "expectedOutput": "3"}]
+
+            # Past the TTL an unreachable server falls back to the cached manifest
+            test_case_manager.MANIFEST_TTL = 0
+            assert as_text(test_case_manager.fetch_test_cases("demo")) == [{"input": "1 2", "expectedOutput": "3"}]
+
+            # A 304 refreshes the fetch time
+            server = serve_directory(site)
+            test_case_manager.TEST_CASES_SERVER_URL = f"http://127.0.0.1:{server.server_address[1]}"
+            assert test_case_manager.get_problem_manifest("demo")["slug"] == "demo"
+            assert test_case_manager.read_cached_manifest("demo")["fetchedAt"] > fetched_at
+        finally:
+            server.shutdown()
+            server.server_close()
+            (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+             test_case_manager.MANIFEST_TTL, test_case_manager.LOCAL_DATABASE_DIR) = saved
+    print("✅ Manifest served from cache, revalidated and used offline")
+
+
+class FlakyKeepAliveHandler(http.server.SimpleHTTPRequestHandler):
+    """Keep-alive handler that counts connections and fails the first request for each file"""
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    failed = set()
+    lock = threading.Lock()
+
+    def setup(self):
+        with FlakyKeepAliveHandler.lock:
+            FlakyKeepAliveHandler.connections += 1
+        super().setup()
+
+    def do_GET(self):
+        with FlakyKeepAliveHandler.lock:
+            first_request = self.path not in FlakyKeepAliveHandler.failed
+            FlakyKeepAliveHandler.failed.add(self.path)
+        if first_request:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_concurrent_downloads():
+    """Test pooled, retried downloads of a problem's test case files"""
+    print("\n🧪 Testing concurrent test case downloads...")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        site = os.path.join(tempdir, "site")
+        os.makedirs(os.path.join(site, "database", "problems"))
+        os.makedirs(os.path.join(site, "database", "testcases", "many"))
+        test_cases = [{"input": f"in{i}.txt", "output": f"out{i}.txt"} for i in range(1, 21)]
+        with open(os.path.join(site, "database", "problems", "many.json"), "w") as f:
+            json.dump({"slug": "many", "testCases": test_cases}, f)
+        for i in range(1, 21):
+            for filename, data in ((f"in{i}.txt", f"{i} {i}"), (f"out{i}.txt", str(2 * i))):
+                with open(os.path.join(site, "database", "testcases", "many", filename), "w") as f:
+                    f.write(data)
+
+        server = serve_directory(site, FlakyKeepAliveHandler)
+        saved = (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+                 test_case_manager.LOCAL_DATABASE_DIR)
+        test_case_manager.LOCAL_DATABASE_DIR = None
+        test_case_manager.TEST_CASES_SERVER_URL = f"http://127.0.0.1:{server.server_address[1]}"
+        test_case_manager.TEST_CASES_CACHE_DIR = os.path.join(tempdir, "cache")
+        try:
+            loaded = test_case_manager.fetch_test_cases("many")
+        finally:
+            server.shutdown()
+            server.server_close()
+            (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+             test_case_manager.LOCAL_DATABASE_DIR) = saved
+        assert [t["expectedOutput"] for t in loaded] == [str(2 * i) for i in range(1, 21)]
+        assert FlakyKeepAliveHandler.connections < 41, FlakyKeepAliveHandler.connections
+        assert not [name for name in os.listdir(os.path.join(tempdir, "cache")) if name.endswith(".tmp")]
+    print(f"✅ 41 files fetched with retries over {FlakyKeepAliveHandler.connections} connections")
+
+
+def test_packed_test_cases():
+    """Test that packs store identical blobs once and share large ones across problems"""
+    print("\n🧪 Testing packed test case store...")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        large = b"7 " * PACK_SHARED_BLOB_MIN
+        files = [{"input": "in1.txt", "output": "out1.txt"}, {"input": "in2.txt", "output": "out2.txt"}]
+        tests = [(b"1 2", b"YES"), (large, b"YES")]
+        for name in ("a.pack", "b.pack"):
+            write_pack(os.path.join(tempdir, name), files, tests, tempdir)
+        assert len(os.listdir(os.path.join(tempdir, "blobs"))) == 1
+        assert os.path.getsize(os.path.join(tempdir, "a.pack")) < PACK_SHARED_BLOB_MIN
+
+        with PackedTestCases(os.path.join(tempdir, "b.pack"), tempdir) as pack:
+            assert pack.test_case_files == files
+            assert len(pack.index["blobs"]) == 3
+            test_cases = pack.test_cases()
+            assert as_text(test_cases)[0] == {"input": "1 2", "expectedOutput": "YES"}
+            assert test_cases[1]["input"].read() == large
+            print("✅ Blobs deduplicated within and across packs")
+
+            # Packed inputs are fed to runs as files, inline and shared alike
+            with compile_code("python", "import sys\nprint(len(sys.stdin.buffer.read()))\n") as program:
+                assert program.run(test_cases[0]["input"]).stdout.strip() == "3"
+                assert program.run(test_cases[1]["input"]).stdout.strip() == str(len(large))
+                result = run_test_case(program, 2, test_cases[1])
+            assert result["input"].startswith("7 7") and not result["passed"]
+
+            # Runners that open the input themselves get shared blobs in place
+            with input_path(test_cases[1]["input"]) as path:
+                assert path == os.path.join(tempdir, "blobs", test_cases[1]["input"].digest)
+            with input_path(test_cases[0]["input"]) as path:
+                with open(path, "rb") as f:
+                    assert f.read() == b"1 2"
+            assert not os.path.exists(path)
+    print("✅ Packed inputs run without loading them into memory")
+
+
+def write_site(site, problems, courses=()):
+    """Lay out a test case server: {slug: [(input, output), ...] or None} plus courses"""
+    for slug, tests in problems.items():
+        os.makedirs(os.path.join(site, "database", "problems"), exist_ok=True)
+        if tests is None:
+            continue
+        files = [{"input": f"in{i}.txt", "output": f"out{i}.txt"} for i in range(1, len(tests) + 1)]
+        with open(os.path.join(site, "database", "problems", f"{slug}.json"), "w") as f:
+            json.dump({"slug": slug, "testCases": files}, f)
+        os.makedirs(os.path.join(site, "database", "testcases", slug), exist_ok=True)
+        for i, (input_text, output_text) in enumerate(tests, 1):
+            for filename, data in ((f"in{i}.txt", input_text), (f"out{i}.txt", output_text)):
+                with open(os.path.join(site, "database", "testcases", slug, filename), "w") as f:
+                    f.write(data)
+    for course_slug, modules in courses:
+        course_dir = os.path.join(site, "database", "courses", course_slug)
+        os.makedirs(course_dir)
+        topics = [{"name": module, "slug": module} for module in modules]
+        with open(os.path.join(course_dir, "meta.json"), "w") as f:
+            json.dump({"name": course_slug, "categorys": [{"name": "All", "topics": topics}]}, f)
+        for module, slugs in modules.items():
+            with open(os.path.join(course_dir, f"{module}.json"), "w") as f:
+                json.dump([{"type": "Code", "slug": slug, "name": slug} for slug in slugs], f)
+
+
+def test_course_prefetch():
+    """Test that a prefetch message caches a course's test cases with progress updates"""
+    print("\n🧪 Testing course prefetch...")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        site = os.path.join(tempdir, "site")
+        write_site(site, {"sum": [("1 2", "3"), ("2 2", "4")], "empty": [], "missing": None},
+                   [("course", {"basics": ["sum", "empty"], "more": ["missing", "sum"]})])
+        server = serve_directory(site, FlakyKeepAliveHandler)
+        saved = (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+                 test_case_manager.LOCAL_DATABASE_DIR)
+        test_case_manager.LOCAL_DATABASE_DIR = None
+        test_case_manager.TEST_CASES_SERVER_URL = f"http://127.0.0.1:{server.server_address[1]}"
+        test_case_manager.TEST_CASES_CACHE_DIR = os.path.join(tempdir, "cache")
+        scheduler = JobScheduler(workers=2)
+        try:
+            handler = MessageHandler(submission_db=None, scheduler=scheduler)
+            messages = []
+            done = threading.Event()
+
+            def send(payload):
+                messages.append(json.loads(payload))
+                if sum(1 for m in messages if m.get("type") == "prefetch_progress") == 3:
+                    done.set()
+
+            handler.handle_message(json.dumps({"type": "prefetch", "course": "course", "_msgId": 3}), send)
+            assert done.wait(30)
+            reply = next(m for m in messages if m.get("_msgId") == 3)
+            assert reply["prefetch"]["total"] == 3
+            statuses = {m["problemSlug"]: m["status"] for m in messages if m.get("type") == "prefetch_progress"}
+            assert statuses == {"sum": "cached", "empty": "no_test_cases", "missing": "failed"}
+            assert test_case_manager.get_cached_test_cases("sum") is not None
+        finally:
+            scheduler.shutdown(wait=True)
+            server.shutdown()
+            server.server_close()
+            (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+             test_case_manager.LOCAL_DATABASE_DIR) = saved
+    print("✅ Course prefetched in the background with progress updates")
+
+
+def test_local_mirror():
+    """Test reading test cases from a local database directory, invalidated by mtime"""
+    print("\n🧪 Testing local mirror mode...")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        site = os.path.join(tempdir, "site")
+        write_site(site, {"local": [("1 2", "3")]})
+        saved = (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+                 test_case_manager.LOCAL_DATABASE_DIR)
+        # No server: everything must come from the mirror
+        test_case_manager.TEST_CASES_SERVER_URL = "http://127.0.0.1:9"
+        test_case_manager.TEST_CASES_CACHE_DIR = os.path.join(tempdir, "cache")
+        test_case_manager.LOCAL_DATABASE_DIR = os.path.join(site, "database")
+        try:
+            assert as_text(test_case_manager.fetch_test_cases("local")) == [{"input": "1 2", "expectedOutput": "3"}]
+            assert test_case_manager.get_cached_test_cases("local") is not None
+
+            output_path = os.path.join(site, "database", "testcases", "local", "out1.txt")
+            with open(output_path, "w") as f:
+                f.write("30")
+            os.utime(output_path, ns=(0, 10 ** 18))
+            assert test_case_manager.get_cached_test_cases("local") is None
+            assert as_text(test_case_manager.fetch_test_cases("local")) == [{"input": "1 2", "expectedOutput": "30"}]
+
+            # Slugs from the browser must not reach files outside the mirror
+            with open(os.path.join(site, "outside.json"), "w") as f:
+                json.dump({"testCases": [{"input": "x", "output": "y"}]}, f)
+            assert test_case_manager.fetch_test_cases("../../outside") == []
+            assert test_case_manager.local_database_file("problems/../../outside.json") is None
+        finally:
+            (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+             test_case_manager.LOCAL_DATABASE_DIR) = saved
+    print("✅ Mirror files served without a server and repacked after edits")
+
+
+def test_suite_cache():
+    """Test that loaded test suites are reused until the problem changes, within a byte budget"""
+    print("\n🧪 Testing test suite cache...")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        site = os.path.join(tempdir, "site")
+        write_site(site, {"suite": [("1 2", "3")]})
+        saved = (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+                 test_case_manager.LOCAL_DATABASE_DIR, test_case_manager.suite_cache)
+        test_case_manager.TEST_CASES_SERVER_URL = "http://127.0.0.1:9"
+        test_case_manager.TEST_CASES_CACHE_DIR = os.path.join(tempdir, "cache")
+        test_case_manager.LOCAL_DATABASE_DIR = os.path.join(site, "database")
+        test_case_manager.suite_cache = SuiteCache()
+        try:
+            first = test_case_manager.fetch_test_cases("suite")
+            second = test_case_manager.fetch_test_cases("suite")
+            assert second[0] is first[0]
+            stats = test_case_manager.suite_cache.stats()
+            assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+            # An edited test file is a new version of the suite
+            output_path = os.path.join(site, "database", "testcases", "suite", "out1.txt")
+            with open(output_path, "w") as f:
+                f.write("30")
+            os.utime(output_path, ns=(0, 10 ** 18))
+            assert as_text(test_case_manager.fetch_test_cases("suite")) == [{"input": "1 2", "expectedOutput": "30"}]
+            assert test_case_manager.suite_cache.stats()["misses"] == 2
+        finally:
+            (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.TEST_CASES_CACHE_DIR,
+             test_case_manager.LOCAL_DATABASE_DIR, test_case_manager.suite_cache) = saved
+
+    # The least recently used suites are evicted to stay within the budget
+    cache = SuiteCache(max_bytes=10)
+    cache.put("a", [{"input": "12", "expectedOutput": "3"}])
+    cache.put("b", [{"input": "1234", "expectedOutput": "5"}])
+    assert cache.get("a") is not None
+    cache.put("c", [{"input": "123", "expectedOutput": "4"}])
+    assert cache.get("b") is None and cache.get("a") is not None
+    assert cache.stats()["size_bytes"] == 7
+    print("✅ Test suites served from memory and reloaded after edits")
+
+
+def test_verdict_cache():
+    """Test that identical resubmissions get the stored verdict without running"""
+    print("\n🧪 Testing verdict cache...")
+
+    suites = {"sum": [{"input": "1 2", "expectedOutput": "3"}]}
+    saved = judge.fetch_test_cases
+    judge.fetch_test_cases = lambda slug: list(suites[slug])
+    with tempfile.TemporaryDirectory() as tempdir:
+        db = SubmissionDB(os.path.join(tempdir, "submissions.db"))
+        code = "a, b = map(int, input().split())\nprint(a + b)"
+        try:
+            first = judge.judge_submission("python", code, "sum", db)
+            assert first["allPassed"] and not first["cached"]
+
+            # A cache hit must not compile or run anything
+            judge.compile_code = None
+            try:
+                second = judge.judge_submission("python", code, "sum", db)
+            finally:
+                judge.compile_code = compile_code
+            assert second["allPassed"] and second["cached"]
+            assert second["submissionId"] != first["submissionId"]
+            history = db.get_submission_history("sum")
+            assert len(history) == 2
+            assert history[0]["test_results"]["cached_from"] == first["submissionId"]
+
+            # Changed test cases are judged again
+            suites["sum"] = [{"input": "1 2", "expectedOutput": "4"}]
+            third = judge.judge_submission("python", code, "sum", db)
+            assert third["failed"] and not third["cached"]
+            # A reused failing verdict is not counted as another failure of its test case
+            fourth = judge.judge_submission("python", code, "sum", db)
+            assert fourth["failed"] and fourth["cached"]
+            db.flush()
+            assert db.get_failed_test_case_counts("sum") == {1: 1}
+
+            # A run the judge itself failed to do is not cached as the code's verdict
+            other_code = code + "\n"
+            saved_run = CompiledProgram.run
+
+            def failing_run(self, *args, **kwargs):
+                raise OSError(24, "Too many open files")
+
+            CompiledProgram.run = failing_run
+            try:
+                broken = judge.judge_submission("python", other_code, "sum", db)
+            finally:
+                CompiledProgram.run = saved_run
+            assert broken["failed"] and broken["verdict"] == "RE"
+            retried = judge.judge_submission("python", other_code, "sum", db)
+            assert not retried["cached"] and retried["verdict"] == "WA"
+        finally:
+            judge.fetch_test_cases = saved
+            db.close()
+    print("✅ Resubmission answered from the verdict cache and re-judged after test changes")
+
+
+def test_scheduled_execution():
+    """Test that execute requests run on the job scheduler, off the caller's thread"""
+    print("\n🧪 Testing scheduled execution...")
+
+    scheduler = JobScheduler(workers=1)
+    handler = MessageHandler(submission_db=None, scheduler=scheduler)
+    responses = []
+    done = threading.Event()
+
+    def send(payload):
+        responses.append(json.loads(payload))
+        done.set()
+
+    message = json.dumps({
+        "type": "execute", "_msgId": 7, "language": "python",
+        "code": "import time\ntime.sleep(0.5)\nprint(input())", "input": "hi"
+    })
+    start_time = time.time()
+    handler.handle_message(message, send)
+    assert time.time() - start_time < 0.3, "handle_message blocked on execution"
+    assert done.wait(10)
+    assert responses[0]["_msgId"] == 7
+    assert responses[0]["results"][0]["actualOutput"] == "hi"
+    scheduler.shutdown(wait=True)
+    print("✅ Execute request answered asynchronously")
+
+    # Shutting down waits for running jobs, up to a timeout
+    scheduler = JobScheduler(workers=1)
+    finished = threading.Event()
+    scheduler.submit(lambda: (time.sleep(0.3), finished.set()))
+    assert not scheduler.shutdown(wait=True, timeout=0.05) and not finished.is_set()
+    assert scheduler.shutdown(wait=True, timeout=5) and finished.is_set()
+    print("✅ Shutdown waits for running jobs")
+
+
+def test_adaptive_test_order():
+    """Test that submissions run the most failed and smallest test cases first"""
+    print("\n🧪 Testing adaptive test order...")
+
+    test_cases = [{"input": "1 2 " + "0" * 100, "expectedOutput": "3"},
+                  {"input": "2 2", "expectedOutput": "5"},
+                  {"input": "3 4", "expectedOutput": "8"},
+                  {"input": "0 0", "expectedOutput": "0"}]
+    assert judge.judging_order(test_cases, {}) == [1, 2, 3, 0]
+    assert judge.judging_order(test_cases, {3: 2, 2: 1}) == [2, 1, 3, 0]
+
+    saved = judge.fetch_test_cases
+    judge.fetch_test_cases = lambda slug: list(test_cases)
+    with tempfile.TemporaryDirectory() as tempdir:
+        db = SubmissionDB(os.path.join(tempdir, "submissions.db"))
+        for _ in range(2):
+            db.add_submission("sum", "python", "print(8)", "failed",
+                              test_results={"failed_test_case": {"testCase": 3}, "verdict": "WA"})
+        try:
+            # Test cases 2 and 3 both fail; 3 failed before, so it runs first and is reported
+            response = judge.judge_submission("python", "a, b = map(int, input().split()[:2])\nprint(a + b)",
+                                              "sum", db)
+            assert response["failed"] and response["testCaseNumber"] == 3
+        finally:
+            judge.fetch_test_cases = saved
+            db.close()
+    print("✅ Test cases that failed before are judged first, numbering kept")
+
+
+def test_progress_messages():
+    """Test that requests asking for progress get updates before their response"""
+    print("\n🧪 Testing progress messages...")
+
+    handler = MessageHandler(submission_db=None)
+    messages = []
+    handler.handle_message(json.dumps({
+        "type": "execute", "_msgId": 3, "progress": True, "language": "python", "code": PYTHON_SUM,
+        "testCases": [{"input": "1 2", "expectedOutput": "3"}, {"input": "2 2", "expectedOutput": "5"}]
+    }), lambda payload: messages.append(json.loads(payload)))
+    assert all(message["_msgId"] == 3 for message in messages)
+    stages = [message.get("stage") for message in messages[:-1]]
+    assert stages == ["compile_started", "compile_finished", "test_case", "test_case"], stages
+    assert messages[1]["success"]
+    updates = sorted(messages[2:4], key=lambda message: message["testCase"])
+    assert [(u["passed"], u["verdict"], u["total"]) for u in updates] == [(True, "AC", 2), (False, "WA", 2)]
+    assert updates[0]["wallTimeMs"] is not None
+    assert "type" not in messages[-1] and messages[-1]["summary"]["failed"] == 1
+
+    # Without asking for progress only the response is sent
+    messages.clear()
+    handler.handle_message(json.dumps({"type": "execute", "_msgId": 4, "language": "python",
+                                       "code": PYTHON_SUM, "input": "1 2"}),
+                           lambda payload: messages.append(json.loads(payload)))
+    assert len(messages) == 1 and messages[0]["results"][0]["actualOutput"] == "3"
+    print("✅ Compile and test case progress sent before the response")
+
+
+def test_history_pagination():
+    """Test that submission listings are paged by cursor, filtered and projected"""
+    print("\n🧪 Testing history pagination...")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        db = SubmissionDB(os.path.join(tempdir, "submissions.db"))
+        handler = MessageHandler(submission_db=db)
+        for number in range(5):
+            db.add_submission("paged", ["python", "cpp"][number % 2], f"print({number})",
+                              ["success", "failed"][number % 2])
+        try:
+            pages = []
+            cursor = None
+            while True:
+                response = handler._process_message({"type": "submission_history", "problemSlug": "paged",
+                                                     "limit": 2, "cursor": cursor}, None)
+                pages.append([submission["id"] for submission in response["history"]])
+                cursor = response["nextCursor"]
+                if cursor is None:
+                    break
+            assert [len(page) for page in pages] == [2, 2, 1]
+            every_id = [submission["id"] for submission in db.get_submission_history("paged")]
+            assert sum(pages, []) == every_id
+
+            response = handler._process_message({"type": "recent_submissions", "limit": 10, "language": "cpp",
+                                                 "fields": ["status"]}, None)
+            assert response["count"] == 2 and response["nextCursor"] is None
+            assert all(set(s) == {"id", "timestamp", "status"} and s["status"] == "failed"
+                       for s in response["recentSubmissions"])
+
+            response = handler._process_message({"type": "submission_history", "problemSlug": "paged",
+                                                 "includeCode": True, "submissionId": every_id[-1],
+                                                 "fields": ["code"]}, None)
+            assert response["history"] == [{"id": every_id[-1], "timestamp": response["history"][0]["timestamp"],
+                                             "code": "print(0)"}]
+            # Projecting code does not send it without includeCode
+            response = handler._process_message({"type": "submission_history", "problemSlug": "paged",
+                                                 "submissionId": every_id[-1], "fields": ["code"]}, None)
+            assert "code" not in response["history"][0]
+            response = handler._process_message({"type": "recent_submissions", "fields": ["code"]}, None)
+            assert all("code" not in s for s in response["recentSubmissions"])
+
+            try:
+                handler._process_message({"type": "recent_submissions", "limit": "10"}, None)
+                assert False, "a bad limit was accepted"
+            except ValueError as e:
+                assert "limit" in str(e)
+        finally:
+            db.close()
+    print("✅ Submission history paged by cursor with filters and projection")
+
+
+def test_course_progress():
+    """Test that course progress is counted per module from the course metadata"""
+    print("\n🧪 Testing course progress...")
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        site = os.path.join(tempdir, "site")
+        write_site(site, {}, [("progress-course", {"arrays": ["two-sum", "max-sum", "rotate"],
+                                                   "graphs": ["bfs", "two-sum"], "empty": [],
+                                                   "unwritten": ["later"]})])
+        # A module listed in the course before its file exists has no problems yet
+        os.remove(os.path.join(site, "database", "courses", "progress-course", "unwritten.json"))
+        server = serve_directory(site)
+        saved = (test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.LOCAL_DATABASE_DIR)
+        test_case_manager.LOCAL_DATABASE_DIR = None
+        test_case_manager.TEST_CASES_SERVER_URL = f"http://127.0.0.1:{server.server_address[1]}"
+        db = SubmissionDB(os.path.join(tempdir, "submissions.db"))
+        scheduler = JobScheduler(workers=1)
+        handler = MessageHandler(submission_db=db, scheduler=scheduler)
+        db.add_submission("two-sum", "python", "print(1)", "failed")
+        db.add_submission("two-sum", "python", "print(2)", "success")
+        db.add_submission("max-sum", "python", "print(3)", "failed")
+        db.add_submission("bfs", "cpp", "int main(){}", "error")
+        db.add_submission("elsewhere", "python", "print(4)", "success")
+        try:
+            # Answered on the scheduler, since the course metadata may be downloaded
+            responses = []
+            done = threading.Event()
+
+            def send(payload):
+                responses.append(json.loads(payload))
+                done.set()
+
+            handler.handle_message(json.dumps({"type": "course_progress", "course": "progress-course",
+                                               "_msgId": 5}), send)
+            assert done.wait(10)
+            response = responses[0]
+            counts = {m["module"]: (m["total"], m["solved"], m["failed"], m["error"], m["attempted"])
+                      for m in response["modules"]}
+            assert [m["module"] for m in response["modules"]] == ["arrays", "graphs", "empty", "unwritten"]
+            assert counts == {"arrays": (3, 1, 1, 0, 2), "graphs": (2, 1, 0, 1, 2), "empty": (0, 0, 0, 0, 0),
+                              "unwritten": (0, 0, 0, 0, 0)}
+            # two-sum is in two modules but is one problem of the course
+            assert response["totals"] == {"total": 4, "solved": 1, "failed": 1, "error": 1, "attempted": 3}
+
+            response = handler._process_message({"type": "course_progress", "course": "progress-course",
+                                                 "module": "graphs"}, None)
+            assert [m["module"] for m in response["modules"]] == ["graphs"]
+            assert "error" in handler._process_message({"type": "course_progress", "course": "progress-course",
+                                                        "module": "nope"}, None)
+        finally:
+            scheduler.shutdown(wait=True)
+            server.shutdown()
+            server.server_close()
+            db.close()
+            test_case_manager.TEST_CASES_SERVER_URL, test_case_manager.LOCAL_DATABASE_DIR = saved
+    print("✅ Course progress counted per module in one query")
+
+if __name__ == "__main__":
+    test_compile_once_run_many()
+    test_compile_cache()
+    test_execute_test_cases()
+    test_parallel_fail_fast()
+    test_python_forkserver()
+    test_java_workers()
+    test_java_worker_restart()
+    test_java_worker_cancel()
+    test_resource_limits()
+    test_spawn_limited()
+    test_streaming_output_check()
+    test_manifest_cache()
+    test_concurrent_downloads()
+    test_packed_test_cases()
+    test_course_prefetch()
+    test_local_mirror()
+    test_suite_cache()
+    test_verdict_cache()
+    test_adaptive_test_order()
+    test_progress_messages()
+    test_history_pagination()
+    test_course_progress()
+    test_scheduled_execution()
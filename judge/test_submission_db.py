@@ -6,7 +6,9 @@ This script tests all the main features of the SubmissionDB class.
 
 import os
 import json
+import sqlite3
 import time
+import threading
 from submission_db import SubmissionDB
 
 def test_submission_db():
@@ -91,6 +93,15 @@ def test_submission_db():
     for problem, status in status_map.items():
         print(f"   {problem}: {status}")
     
+    with db._get_connection() as conn:
+        row = conn.execute("SELECT * FROM problem_status WHERE problem_slug = 'two-sum'").fetchone()
+    assert (row['status'], row['attempts']) == ("success", 2)
+    assert row['first_solved_timestamp'] < row['latest_timestamp']
+    
+    failure_counts = db.get_failed_test_case_counts("two-sum")
+    print(f"✅ Failed test case counts for two-sum: {failure_counts}")
+    assert failure_counts == {2: 1}
+    
     # Test 4: Get all solved problems
     print("\n🏆 Test 4: Getting all solved problems...")
     
@@ -164,11 +175,203 @@ def test_submission_db():
     end_time = time.time()
     print(f"✅ Checked status of 50 problems in {end_time - start_time:.3f} seconds")
     
+    # Test 10: Write-behind queue
+    print("\n📥 Test 10: Write-behind queue...")
+    
+    submission_id = db.add_submission("queued", "python", "print(1)", "success")
+    assert db.check_problems_status(["queued"]) == {"queued": "success"}
+    db.add_submission("queued-late", "python", "print(2)", "failed")
+    db.close()
+    reopened = SubmissionDB(test_db_path)
+    assert reopened.check_problems_status(["queued-late"]) == {"queued-late": "failed"}
+    assert reopened.get_submission_history("queued")[0]["id"] == submission_id
+    reopened.close()
+    print("✅ Queued submissions visible to reads and written on close")
+    
+    try:
+        db.add_submission("queued", "python", "print(3)", "accepted")
+        assert False, "invalid status was queued"
+    except ValueError:
+        pass
+    # A write that still fails in the writer only loses itself, not its batch
+    batch_ids = [db.add_submission("batch", "python", f"print({i})", "success") for i in range(3)]
+    db._write([("""
+        INSERT INTO submissions (id, problem_slug, language, code_hash, status, timestamp, datetime)
+        VALUES ('bad', 'batch', 'python', '', 'accepted', 0, '')
+    """, ())])
+    batch_ids.append(db.add_submission("batch", "python", "print(4)", "failed"))
+    assert sorted(s["id"] for s in db.get_submission_history("batch", include_code=False)) == sorted(batch_ids)
+    print("✅ Invalid submissions rejected and failed writes isolated")
+    
+    # Test 11: Reads while a submission is being written
+    print("\n🔀 Test 11: Concurrent reads and writes...")
+    
+    with db._get_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    
+    writing = threading.Event()
+    release = threading.Event()
+    
+    def slow_writer():
+        with db._get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""
+                INSERT INTO submissions (id, problem_slug, language, code_hash, status, timestamp, datetime)
+                VALUES ('pending', 'slow-write', 'python', '', 'success', 0, '')
+            """)
+            writing.set()
+            release.wait(10)
+            conn.commit()
+    
+    writer = threading.Thread(target=slow_writer)
+    writer.start()
+    writing.wait(10)
+    start_time = time.time()
+    assert db.check_problems_status(["slow-write"]) == {"slow-write": "not_attempted"}
+    print(f"✅ Status read during an open write in {time.time() - start_time:.3f} seconds")
+    release.set()
+    writer.join()
+    assert db.check_problems_status(["slow-write"]) == {"slow-write": "success"}
+    
+    # Test 12: Problem status table rebuilt from the history
+    print("\n🔁 Test 12: Rebuilding problem statuses...")
+    
+    status_before = db.check_problems_status(bulk_problems)
+    failures_before = db.get_failed_test_case_counts("two-sum")
+    with db._get_connection() as conn:
+        conn.execute("DELETE FROM problem_status")
+        conn.execute("DELETE FROM test_case_failures")
+        conn.commit()
+    db.rebuild_problem_status()
+    assert db.check_problems_status(bulk_problems) == status_before
+    assert db.get_failed_test_case_counts("two-sum") == failures_before == {2: 1}
+    print("✅ Problem statuses rebuilt")
+    
+    # Test 13: Code stored once, compressed, and converted from inline code
+    print("\n🗜️ Test 13: Code blobs...")
+    
+    repeated_code = "print('same')\n" * 50
+    db.add_submission("blob-test", "python", repeated_code, "failed")
+    db.add_submission("blob-test", "python", repeated_code, "success")
+    with db._get_connection() as conn:
+        blob = conn.execute("SELECT COUNT(*) AS n, MAX(length(code)) AS stored FROM code_blobs "
+                            "WHERE size = ?", (len(repeated_code),)).fetchone()
+    assert blob['n'] == 1 and blob['stored'] < len(repeated_code)
+    assert [s['code'] for s in db.get_submission_history("blob-test")] == [repeated_code] * 2
+    assert 'code' not in db.get_submission_history("blob-test", include_code=False)[0]
+    
+    legacy_db_path = "test_submissions_legacy.db"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(legacy_db_path + suffix):
+            os.remove(legacy_db_path + suffix)
+    # The schema the first version of the judge created
+    with sqlite3.connect(legacy_db_path) as conn:
+        conn.executescript("""
+            CREATE TABLE submissions (
+                id TEXT PRIMARY KEY, problem_slug TEXT NOT NULL, language TEXT NOT NULL,
+                code TEXT NOT NULL, status TEXT NOT NULL CHECK (status IN ('success', 'failed', 'error')),
+                timestamp REAL NOT NULL, datetime TEXT NOT NULL, test_results TEXT, error_message TEXT
+            );
+            CREATE INDEX idx_problem_slug ON submissions(problem_slug);
+            CREATE INDEX idx_timestamp ON submissions(timestamp DESC);
+            CREATE INDEX idx_status ON submissions(status);
+            CREATE INDEX idx_problem_status ON submissions(problem_slug, status);
+            CREATE VIEW problem_status AS
+            SELECT 
+                problem_slug,
+                CASE 
+                    WHEN MAX(CASE WHEN status = 'success' THEN timestamp END) IS NOT NULL THEN 'success'
+                    WHEN MAX(CASE WHEN status = 'failed' THEN timestamp END) IS NOT NULL THEN 'failed'
+                    ELSE 'error'
+                END as status,
+                MAX(timestamp) as latest_timestamp
+            FROM submissions 
+            GROUP BY problem_slug;
+        """)
+        conn.executemany("INSERT INTO submissions VALUES (?, 'legacy', 'python', ?, ?, ?, '', ?, NULL)",
+                         [("a", "print(1)", "failed", 1.0, '{"failed_test_case": {"testCase": 3}}'),
+                          ("b", "print(2)", "success", 2.0, None), ("c", "print(2)", "success", 3.0, None),
+                          ("d", "print(1)", "failed", 4.0,
+                           '{"failed_test_case": {"testCase": 3}, "cached_from": "a"}')])
+    conn.close()
+    legacy = SubmissionDB(legacy_db_path)
+    history = legacy.get_submission_history("legacy")
+    assert [s['code'] for s in history] == ["print(1)", "print(2)", "print(2)", "print(1)"]
+    assert [s['cached_from'] for s in history] == ["a", None, None, None]
+    assert legacy.check_problems_status(["legacy"]) == {"legacy": "success"}
+    assert legacy.get_submission_stats()['successful_submissions'] == 2
+    # A reused verdict is not another failure on its test case
+    assert legacy.get_failed_test_case_counts("legacy") == {3: 1}
+    with legacy._get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM code_blobs").fetchone()[0] == 2
+    legacy.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(legacy_db_path + suffix):
+            os.remove(legacy_db_path + suffix)
+    print("✅ Identical code stored once and legacy databases converted")
+    
+    # Test 14: Statistics and daily activity from the rollup tables
+    print("\n📅 Test 14: Rollups...")
+    
+    with db._get_connection() as conn:
+        scanned = conn.execute("""
+            SELECT COUNT(*) AS total, SUM(status = 'success') AS successful,
+                   COUNT(DISTINCT language) AS languages, COUNT(DISTINCT problem_slug) AS problems
+            FROM submissions
+        """).fetchone()
+    stats = db.get_submission_stats()
+    assert (stats['total_submissions'], stats['successful_submissions'], stats['unique_languages'],
+            stats['unique_problems_attempted']) == tuple(scanned)
+    assert stats['languages_used'] == sorted(stats['languages_used'])
+    
+    # The slow-write row above is dated 1970
+    activity = db.get_daily_activity(days=100 * 365)
+    assert sum(day['submissions'] for day in activity['days']) == stats['total_submissions']
+    assert activity['current_streak'] >= 1 and activity['longest_streak'] >= 1
+    
+    day = 24 * 60 * 60
+    with db._get_connection() as conn:
+        conn.executemany("""
+            INSERT INTO submissions (id, problem_slug, language, code_hash, status, timestamp, datetime)
+            VALUES (?, 'streak', 'python', '', 'success', ?, '')
+        """, [(f"streak-{offset}", time.time() - offset * day) for offset in (30, 31, 32, 33)])
+        conn.commit()
+    activity = db.get_daily_activity()
+    assert activity['longest_streak'] >= 4
+    assert len(db.get_daily_activity(days=7)['days']) < len(activity['days'])
+    
+    with db._get_connection() as conn:
+        conn.execute("DELETE FROM daily_activity")
+        conn.execute("DELETE FROM submission_totals")
+        conn.commit()
+    db.rebuild_problem_status()
+    assert db.get_daily_activity() == activity
+    print("✅ Statistics and daily activity read from rollups")
+    
+    # Test 15: Verdict cache capped, least recently used evicted first
+    print("\n🗃️ Test 15: Verdict cache size...")
+    
+    capped_db_path = "test_submissions_capped.db"
+    capped = SubmissionDB(capped_db_path, verdict_cache_size=2)
+    capped.cache_verdict("first", "s1", "success")
+    capped.cache_verdict("second", "s2", "failed")
+    capped.flush()
+    assert capped.get_cached_verdict("first")["submission_id"] == "s1"
+    capped.cache_verdict("third", "s3", "success")
+    capped.flush()
+    assert [key for key in ("first", "second", "third") if capped.get_cached_verdict(key)] == ["first", "third"]
+    capped.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(capped_db_path + suffix):
+            os.remove(capped_db_path + suffix)
+    print("✅ Verdict cache kept to its size")
+    
     # Final statistics
     final_stats = db.get_submission_stats()
     print(f"\n📈 Final statistics: {final_stats['total_submissions']} total submissions")
     
     # Clean up test database
+    db.close()
     if os.path.exists(test_db_path):
         os.remove(test_db_path)
         print("✅ Test database cleaned up")
@@ -201,6 +404,10 @@ def test_message_types():
         {
             "type": "recent_submissions",
             "limit": 5
+        },
+        {
+            "type": "daily_activity",
+            "days": 30
         }
     ]
     
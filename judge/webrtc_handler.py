@@ -6,11 +6,12 @@ from message_handler import MessageHandler
 
 
 class WebRTCHandler:
-    def __init__(self, session_id, sio, submission_db):
+    def __init__(self, session_id, sio, submission_db, scheduler=None):
         self.session_id = session_id
         self.sio = sio
         self.submission_db = submission_db
-        self.message_handler = MessageHandler(submission_db)
+        self.message_handler = MessageHandler(submission_db, scheduler)
+        self.loop = None
         self.rtc_pc = None
         self.data_channel = None
         self.channel_ready = asyncio.Event()
@@ -18,6 +19,7 @@ class WebRTCHandler:
     def handle_offer(self, signal, loop):
         """Handle WebRTC offer from browser"""
         print("Received offer from browser.")
+        self.loop = loop
         print("Creating RTCPeerConnection...")
         try:
             # Create proper RTCConfiguration with RTCIceServer
@@ -46,7 +48,7 @@ class WebRTCHandler:
             @channel.on("message")
             def on_message(message):
                 print(f"Received message from browser: {message}")
-                self.message_handler.handle_message(message, channel)
+                self.message_handler.handle_message(message, self._channel_sender(channel))
             
             self.channel_ready.set()
         
@@ -63,6 +65,15 @@ class WebRTCHandler:
         # Process the offer
         asyncio.run_coroutine_threadsafe(self._process_offer(signal), loop)
     
+    def _channel_sender(self, channel):
+        """Return a send function that is safe to call from worker threads"""
+        loop = self.loop
+        
+        def send(payload):
+            loop.call_soon_threadsafe(channel.send, payload)
+        
+        return send
+    
     async def _process_offer(self, signal):
         """Process the WebRTC offer"""
         try: